@@ -0,0 +1,197 @@
+"""
+Armazenamento binário da matriz estação-dia (dias x estações, float32).
+
+A matriz é gravada em uma pasta, dividida em blocos de dias x blocos de
+estações, cada bloco um arquivo .npy. Um índice (indice.json) guarda os
+códigos das estações, a data inicial, o número de dias e o tamanho dos
+blocos. Os blocos são abertos por memory map (np.load(mmap_mode='r')):
+selecionar algumas estações ou um período lê só os blocos envolvidos.
+
+Blocos sem nenhum dado (só NaN) não são gravados. Junto com os blocos é gravado o
+índice de disponibilidade (1 bit por estação-dia, ver disponibilidade.py).
+
+    pasta/
+        indice.json
+        disponibilidade.npz
+        bloco_0000_0000.npy    (bloco de dias 0, bloco de estações 0)
+        bloco_0000_0001.npy
+        ...
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from matriz_estacoes import DECIMAIS
+from disponibilidade import ARQUIVO as ARQUIVO_DISPONIBILIDADE, IndiceDisponibilidade, cortes_mes, resume_bloco
+
+INDICE = 'indice.json'
+BLOCO_DIAS = 3653        # ~10 anos
+BLOCO_ESTACOES = 256
+
+
+def _arquivo_bloco(pasta, t, e):
+    return os.path.join(pasta, f"bloco_{t:04d}_{e:04d}.npy")
+
+
+def grava_armazem(pasta, matriz, bloco_dias=BLOCO_DIAS, bloco_estacoes=BLOCO_ESTACOES):
+    """ Grava a matriz (MatrizEstacaoDia ou DataFrame dias x estações) na pasta.
+        O conteúdo anterior da pasta é substituído só no final, quando tudo já foi gravado.
+    """
+    if isinstance(matriz, pd.DataFrame):
+        codigos = [str(c) for c in matriz.columns]
+        datas = pd.DatetimeIndex(matriz.index)
+        def colunas(fatia):
+            return matriz.iloc[:, fatia].to_numpy(dtype=np.float32)
+    else:
+        codigos = list(matriz.codigos)
+        datas = matriz.datas
+        colunas = matriz.bloco
+
+    num_dias = len(datas)
+    if num_dias and (datas[-1] - datas[0]).days + 1 != num_dias:
+        raise ValueError("O índice de datas deve ser diário e contínuo")
+
+    temporaria = pasta.rstrip('/\\') + '.tmp'
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+
+    cortes = cortes_mes(datas[0] if num_dias else None, num_dias)
+    bits, mensal = [], []
+    for e, j in enumerate(range(0, len(codigos), bloco_estacoes)):
+        parte = colunas(slice(j, j + bloco_estacoes))
+        bits_bloco, mensal_bloco = resume_bloco(parte, cortes)
+        bits.append(bits_bloco)
+        mensal.append(mensal_bloco)
+        for t, i in enumerate(range(0, num_dias, bloco_dias)):
+            bloco = parte[i:i + bloco_dias]
+            if not np.isnan(bloco).all():
+                np.save(_arquivo_bloco(temporaria, t, e), np.ascontiguousarray(bloco, dtype=np.float32))
+
+    indice = {
+        'codigos': codigos,
+        'data_inicio': datas[0].strftime('%Y-%m-%d') if num_dias else None,
+        'num_dias': num_dias,
+        'bloco_dias': bloco_dias,
+        'bloco_estacoes': bloco_estacoes,
+        'dtype': 'float32',
+    }
+    with open(os.path.join(temporaria, INDICE), 'w') as arquivo:
+        json.dump(indice, arquivo)
+    IndiceDisponibilidade(codigos, datas[0] if num_dias else None, num_dias,
+                          np.vstack(bits) if bits else np.zeros((0, (num_dias + 7) // 8), dtype=np.uint8),
+                          np.vstack(mensal) if mensal else np.zeros((0, len(cortes) - 1), dtype=np.int32)
+                          ).grava(os.path.join(temporaria, ARQUIVO_DISPONIBILIDADE))
+
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.replace(temporaria, pasta)
+
+
+class ArmazemMatriz:
+    """ Leitura da matriz gravada por grava_armazem.
+        pasta(str): pasta do armazenamento
+    """
+    def __init__(self, pasta) -> None:
+        self.pasta = pasta
+        with open(os.path.join(pasta, INDICE)) as arquivo:
+            indice = json.load(arquivo)
+        self.codigos = indice['codigos']
+        self.num_dias = indice['num_dias']
+        self.bloco_dias = indice['bloco_dias']
+        self.bloco_estacoes = indice['bloco_estacoes']
+        self.inicio = pd.Timestamp(indice['data_inicio']) if indice['data_inicio'] else None
+        self.posicao = {codigo: j for j, codigo in enumerate(self.codigos)}
+        self._blocos = {}
+        self._disponibilidade = None
+
+    @property
+    def shape(self):
+        return self.num_dias, len(self.codigos)
+
+    @property
+    def datas(self):
+        if self.inicio is None:
+            return pd.DatetimeIndex([], name='date')
+        return pd.date_range(self.inicio, periods=self.num_dias, freq='D', name='date')
+
+    def disponibilidade(self):
+        """ Índice de disponibilidade (IndiceDisponibilidade) gravado com a matriz; em
+            armazenamentos gravados antes dele o índice é montado lendo a matriz (e gravado).
+        """
+        if self._disponibilidade is None:
+            caminho = os.path.join(self.pasta, ARQUIVO_DISPONIBILIDADE)
+            if os.path.exists(caminho):
+                self._disponibilidade = IndiceDisponibilidade.le(caminho)
+            else:
+                self._disponibilidade = IndiceDisponibilidade.de_matriz(self, bloco=self.bloco_estacoes)
+                try:
+                    self._disponibilidade.grava(caminho)
+                except OSError:
+                    pass
+        return self._disponibilidade
+
+    def _bloco(self, t, e):
+        # memory map do bloco (None se o bloco não tem dados)
+        chave = (t, e)
+        if chave not in self._blocos:
+            caminho = _arquivo_bloco(self.pasta, t, e)
+            self._blocos[chave] = np.load(caminho, mmap_mode='r') if os.path.exists(caminho) else None
+        return self._blocos[chave]
+
+    def _linhas(self, data_inicio=None, data_fim=None):
+        # intervalo [i0, i1) de dias do índice global correspondente ao período
+        if self.inicio is None:
+            return 0, 0
+        i0 = 0 if data_inicio is None else (pd.to_datetime(data_inicio, dayfirst=True) - self.inicio).days
+        i1 = self.num_dias if data_fim is None else (pd.to_datetime(data_fim, dayfirst=True) - self.inicio).days + 1
+        return min(max(i0, 0), self.num_dias), min(max(i1, 0), self.num_dias)
+
+    def _colunas(self, codigos=None):
+        if codigos is None:
+            return np.arange(len(self.codigos))
+        faltando = [str(c) for c in codigos if str(c) not in self.posicao]
+        if faltando:
+            raise KeyError(f"Estações fora do armazenamento: {faltando}")
+        return np.array([self.posicao[str(c)] for c in codigos], dtype=np.int64)
+
+    def matriz(self, codigos=None, data_inicio=None, data_fim=None):
+        """ Submatriz float32 (dias x estações) para a lista de estações e o período
+            (datas inclusivas, d/m/Y ou datetime). None seleciona tudo.
+        """
+        i0, i1 = self._linhas(data_inicio, data_fim)
+        colunas = self._colunas(codigos)
+        saida = np.full((i1 - i0, len(colunas)), np.nan, dtype=np.float32)
+        if i1 <= i0 or not len(colunas):
+            return saida
+
+        bloco_de = colunas // self.bloco_estacoes
+        for e in np.unique(bloco_de):
+            destino = np.flatnonzero(bloco_de == e)
+            origem = colunas[destino] - e * self.bloco_estacoes
+            for t in range(i0 // self.bloco_dias, (i1 - 1) // self.bloco_dias + 1):
+                bloco = self._bloco(t, int(e))
+                if bloco is None:
+                    continue
+                a = max(i0, t * self.bloco_dias)
+                b = min(i1, (t + 1) * self.bloco_dias)
+                linhas = slice(a - t * self.bloco_dias, b - t * self.bloco_dias)
+                saida[a - i0:b - i0, destino] = bloco[linhas][:, origem]
+        return saida
+
+    def seleciona(self, codigos=None, data_inicio=None, data_fim=None):
+        """ Mesma seleção de matriz(), como DataFrame float64 (índice 'date', colunas = código). """
+        i0, i1 = self._linhas(data_inicio, data_fim)
+        nomes = self.codigos if codigos is None else [str(c) for c in codigos]
+        valores = np.round(self.matriz(codigos, data_inicio, data_fim).astype(np.float64), DECIMAIS)
+        return pd.DataFrame(valores, index=self.datas[i0:i1], columns=nomes)
+
+    def __getitem__(self, chave):
+        """ armazem[linhas, colunas] em float64 arredondado, como MatrizEstacaoDia
+            (as linhas são filtradas depois de ler as colunas).
+        """
+        linhas, colunas = chave
+        selecionadas = np.arange(len(self.codigos))[colunas]
+        valores = self.matriz([self.codigos[j] for j in selecionadas])
+        return np.round(valores[linhas].astype(np.float64), DECIMAIS)
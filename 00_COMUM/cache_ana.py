@@ -0,0 +1,100 @@
+"""
+Cache em disco das respostas do webservice da ANA.
+
+Cada resposta é guardada compactada (gzip) em um arquivo cujo nome é o hash
+da requisição (endpoint + parâmetros: estação, tipoDados, datas,
+nivelConsistencia...). Assim, rodar de novo o download com a mesma janela
+de datas não acessa a rede.
+
+As respostas vencem após `validade` segundos e, quando o cache passa de
+`tamanho_max` bytes, as menos usadas recentemente são apagadas.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheRespostas:
+    """ diretorio(str): pasta do cache
+        validade(float): segundos até uma resposta vencer (None = não vence)
+        tamanho_max(int): tamanho máximo do cache em bytes (None = sem limite)
+    """
+    def __init__(self, diretorio, validade=None, tamanho_max=None) -> None:
+        self.diretorio = diretorio
+        self.validade = validade
+        self.tamanho_max = tamanho_max
+        self.lock = threading.Lock()
+
+        # Índice LRU: caminho -> tamanho, do menos para o mais usado recentemente.
+        # O instante de uso fica no atime do arquivo e o de gravação no mtime.
+        self.arquivos = OrderedDict()
+        self.tamanho = 0
+        encontrados = []
+        for raiz, _, nomes in os.walk(diretorio):
+            for nome in nomes:
+                if nome.endswith('.gz'):
+                    caminho = os.path.join(raiz, nome)
+                    info = os.stat(caminho)
+                    encontrados.append((info.st_atime, caminho, info.st_size))
+        for _, caminho, tamanho in sorted(encontrados):
+            self.arquivos[caminho] = tamanho
+            self.tamanho += tamanho
+
+    def chave(self, url, params=None):
+        requisicao = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(requisicao.encode('utf-8')).hexdigest()
+
+    def caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], chave + '.xml.gz')
+
+    def obtem(self, url, params=None):
+        """ Devolve o corpo guardado para a requisição, ou None se não houver (ou tiver vencido). """
+        caminho = self.caminho(self.chave(url, params))
+        with self.lock:
+            if caminho not in self.arquivos:
+                return None
+            agora = time.time()
+            # o arquivo é lido com o lock: um grava() em outra thread pode apagá-lo ao liberar espaço
+            try:
+                gravado = os.stat(caminho).st_mtime
+                if self.validade is not None and agora - gravado > self.validade:
+                    self._remove(caminho)
+                    return None
+                with open(caminho, 'rb') as arquivo:
+                    compactado = arquivo.read()
+                os.utime(caminho, (agora, gravado))
+            except OSError:
+                # apagado fora do cache (ex.: limpeza manual da pasta)
+                self._remove(caminho)
+                return None
+            self.arquivos.move_to_end(caminho)
+        return gzip.decompress(compactado)
+
+    def grava(self, url, params, conteudo):
+        caminho = self.caminho(self.chave(url, params))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        compactado = gzip.compress(conteudo, compresslevel=6)
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(compactado)
+        os.replace(temporario, caminho)
+
+        # tamanho do que foi escrito: o arquivo pode já ter sido apagado por outra thread ao liberar espaço
+        tamanho = len(compactado)
+        with self.lock:
+            self.tamanho += tamanho - self.arquivos.pop(caminho, 0)
+            self.arquivos[caminho] = tamanho
+            if self.tamanho_max is not None:
+                while self.tamanho > self.tamanho_max and len(self.arquivos) > 1:
+                    self._remove(next(iter(self.arquivos)))
+
+    def _remove(self, caminho):
+        self.tamanho -= self.arquivos.pop(caminho, 0)
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
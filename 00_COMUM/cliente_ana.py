@@ -0,0 +1,115 @@
+"""
+Cliente HTTP compartilhado pelos scripts que acessam o webservice da ANA
+(01_INVENTARIO e 02_DOWNLOAD_E_AVALIACAO).
+
+Uma única sessão mantém as conexões abertas (keep-alive) entre as
+requisições, pede as respostas compactadas com gzip, aplica timeout e
+repete as requisições que falham com espera exponencial entre as tentativas.
+Opcionalmente, as respostas são guardadas em um cache em disco (cache_ana)
+e cada requisição é registrada na telemetria do download (telemetria).
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from xml_ana import tem_registros
+
+URL_ANA = 'http://telemetriaws1.ana.gov.br/ServiceANA.asmx/'
+
+
+class LimitadorTaxa:
+    """ Limita o número de requisições por segundo para cada host.
+        max_req_por_segundo(float): None ou 0 desliga o limite
+    """
+    def __init__(self, max_req_por_segundo=None) -> None:
+        self.intervalo = 1.0 / max_req_por_segundo if max_req_por_segundo else 0.0
+        self.proxima = {}
+        self.lock = threading.Lock()
+
+    def aguarda(self, url):
+        if not self.intervalo:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            agora = time.monotonic()
+            instante = max(agora, self.proxima.get(host, agora))
+            self.proxima[host] = instante + self.intervalo
+        if instante > agora:
+            time.sleep(instante - agora)
+
+
+class ClienteANA:
+    """ Sessão HTTP com pool de conexões para o webservice da ANA.
+        timeout(tuple): segundos para conectar e para ler a resposta
+        tentativas(int): número máximo de novas tentativas por requisição
+        fator_espera(float): espera de fator_espera * 2**(n-1) segundos antes da tentativa n
+        tamanho_pool(int): conexões mantidas abertas por host (use >= número de threads)
+        max_req_por_segundo(float): limite de requisições por segundo por host
+        cache(CacheRespostas): cache em disco consultado por conteudo(); None desliga. Só respostas 200
+            com algum registro (tem_registros) são guardadas: uma estação que ainda não tem dados, ou
+            uma resposta de erro, é pedida de novo na próxima vez
+        telemetria(Telemetria): registra latência, bytes, status e novas tentativas de conteudo(); None desliga
+    """
+    def __init__(self, timeout=(10, 300), tentativas=5, fator_espera=1.0, tamanho_pool=16,
+                 max_req_por_segundo=None, cache=None, telemetria=None) -> None:
+        self.timeout = timeout
+        self.cache = cache
+        self.telemetria = telemetria
+        self.limitador = LimitadorTaxa(max_req_por_segundo)
+
+        retry = Retry(total=tentativas,
+                      backoff_factor=fator_espera,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']),
+                      raise_on_status=False)
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamanho_pool,
+                                pool_block=True, max_retries=retry)
+
+        self.sessao = requests.Session()
+        self.sessao.headers.update({'Accept-Encoding': 'gzip, deflate',
+                                    'Connection': 'keep-alive'})
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+    def get(self, url, params=None):
+        self.limitador.aguarda(url)
+        return self.sessao.get(url, params=params, timeout=self.timeout)
+
+    def conteudo(self, url, params=None, usa_cache=True):
+        """ Devolve (status_code, corpo) da requisição, usando o cache quando houver.
+            usa_cache(bool): False ignora o cache nesta requisição (nem lê, nem grava)
+        """
+        codigo = (params or {}).get('codEstacao')
+        inicio = time.perf_counter()
+        cache = self.cache if usa_cache else None
+        if cache is not None:
+            corpo = cache.obtem(url, params)
+            if corpo is not None:
+                if self.telemetria is not None:
+                    self.telemetria.requisicao(time.perf_counter() - inicio, 200, tamanho_xml=len(corpo),
+                                               cache=True, codigo=codigo)
+                return 200, corpo
+
+        try:
+            r = self.get(url, params)
+            corpo = r.content
+        except requests.RequestException:
+            if self.telemetria is not None:
+                self.telemetria.requisicao(time.perf_counter() - inicio, 'erro', codigo=codigo)
+            raise
+        if self.telemetria is not None:
+            # bytes lidos do socket (compactados) e novas tentativas feitas pelo Retry
+            tentativas = r.raw.retries.history if r.raw is not None and r.raw.retries is not None else ()
+            self.telemetria.requisicao(time.perf_counter() - inicio, r.status_code,
+                                       tamanho=r.raw.tell() if r.raw is not None else len(corpo),
+                                       tamanho_xml=len(corpo), tentativas=len(tentativas), codigo=codigo)
+        if r.status_code == 200 and cache is not None and tem_registros(corpo):
+            cache.grava(url, params, corpo)
+        return r.status_code, corpo
+
+    def close(self):
+        self.sessao.close()
@@ -0,0 +1,288 @@
+"""
+Índice de disponibilidade dos dados: 1 bit por estação-dia (dado válido ou não) e as contagens
+de dias válidos acumuladas nos inícios de mês, para responder sem reler as séries:
+    - dias válidos de uma estação em qualquer período: duas consultas às contagens acumuladas
+      e no máximo dois meses incompletos lidos dos bits (O(1) por estação);
+    - IDV, 'Num de Anos Total' e 'Num Anos Validos' do período, como na aba ANUAL do download
+      (resumo), e as estações que passam nos limites da filtragem (seleciona), em O(estações);
+    - dias válidos por ano e por mês, e o raster estação x ano do IDV anual (raster, desenha_raster).
+
+O download grava o índice junto com a matriz (armazem_matriz.grava_armazem, arquivo
+disponibilidade.npz na pasta da matriz); ArmazemMatriz.disponibilidade() o carrega, ou o monta a
+partir da matriz em armazenamentos antigos. Para 100 mil estações-ano são ~4,6 MB de bits e
+~5 MB de contagens (int32 por estação-mês).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from estatisticas import Calendario
+
+ARQUIVO = 'disponibilidade.npz'
+BYTES_JANELA = 5            # 40 bits: cobrem um mês (até 31 dias) a partir de qualquer bit de um byte
+
+
+def cortes_mes(inicio, num_dias):
+    """ Índices (dias desde `inicio`) dos inícios de mês, com 0 e num_dias nas pontas. """
+    if not num_dias:
+        return np.zeros(1, dtype=np.int64)
+    meses = pd.date_range(inicio, periods=num_dias, freq='D')
+    meses = np.flatnonzero(meses.day == 1)
+    return np.unique(np.concatenate([[0], meses, [num_dias]])).astype(np.int64)
+
+
+def resume_bloco(parte, cortes):
+    """ Bits (estações x bytes, bit i do dia i) e dias válidos por mês (estações x meses)
+        de um bloco dias x estações da matriz (NaN onde não há dado).
+    """
+    validos = ~np.isnan(parte)
+    bits = np.ascontiguousarray(np.packbits(validos, axis=0, bitorder='little').T)
+    mensal = np.add.reduceat(validos, cortes[:-1], axis=0).T if len(cortes) > 1 else np.zeros((validos.shape[1], 0))
+    return bits, mensal.astype(np.int32)
+
+
+class IndiceDisponibilidade:
+    """ codigos(list): códigos das estações (linhas do índice)
+        inicio(Timestamp): data do dia 0
+        num_dias(int): dias do índice
+        bits(ndarray): uint8 estações x ceil(num_dias / 8), bit i (ordem 'little') = dia i válido
+        mensal(ndarray): dias válidos por estação e mês (intervalos de cortes_mes)
+    """
+    def __init__(self, codigos, inicio, num_dias, bits, mensal) -> None:
+        self.codigos = [str(c) for c in codigos]
+        self.inicio = None if inicio is None else pd.Timestamp(inicio)
+        self.num_dias = int(num_dias)
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.cortes = cortes_mes(self.inicio, self.num_dias)
+        # acumulado[s, k]: dias válidos da estação s antes do corte k
+        mensal = np.asarray(mensal, dtype=np.int32).reshape(len(self.codigos), len(self.cortes) - 1)
+        self.acumulado = np.zeros((len(self.codigos), len(self.cortes)), dtype=np.int32)
+        np.cumsum(mensal, axis=1, out=self.acumulado[:, 1:])
+        self.posicao = {codigo: j for j, codigo in enumerate(self.codigos)}
+
+    @classmethod
+    def de_matriz(cls, matriz, codigos=None, inicio=None, bloco=256):
+        """ Monta o índice a partir de uma matriz dias x estações: ArmazemMatriz, MatrizEstacaoDia
+            (com codigos/datas) ou DataFrame com índice de datas diário.
+        """
+        if isinstance(matriz, pd.DataFrame):
+            codigos = list(matriz.columns) if codigos is None else codigos
+            inicio = matriz.index[0] if inicio is None and len(matriz) else inicio
+            valores = matriz.to_numpy(dtype=np.float32)
+            def colunas(j):
+                return valores[:, j:j + bloco]
+        else:
+            codigos = list(matriz.codigos) if codigos is None else codigos
+            inicio = (matriz.datas[0] if len(matriz.datas) else None) if inicio is None else inicio
+            def colunas(j):
+                return matriz[:, j:j + bloco]
+        num_dias = matriz.shape[0]
+        cortes = cortes_mes(inicio, num_dias)
+        partes = [resume_bloco(colunas(j), cortes) for j in range(0, len(codigos), bloco)]
+        bits = np.vstack([p[0] for p in partes]) if partes else np.zeros((0, (num_dias + 7) // 8), np.uint8)
+        mensal = np.vstack([p[1] for p in partes]) if partes else np.zeros((0, len(cortes) - 1), np.int32)
+        return cls(codigos, inicio, num_dias, bits, mensal)
+
+    def grava(self, caminho):
+        np.savez(caminho, codigos=np.array(self.codigos, dtype=str), bits=self.bits,
+                 mensal=np.diff(self.acumulado, axis=1).astype(np.int32), num_dias=self.num_dias,
+                 inicio=np.array('' if self.inicio is None else self.inicio.strftime('%Y-%m-%d')))
+
+    @classmethod
+    def le(cls, caminho):
+        with np.load(caminho) as dados:
+            inicio = str(dados['inicio'])
+            return cls(list(dados['codigos']), inicio or None, int(dados['num_dias']), dados['bits'], dados['mensal'])
+
+    # ----- consultas -----
+
+    def _linhas(self, data_inicio=None, data_fim=None):
+        # intervalo [i0, i1) de dias do índice (datas inclusivas, d/m/Y ou datetime), como em ArmazemMatriz
+        if self.inicio is None:
+            return 0, 0
+        i0 = 0 if data_inicio is None else (pd.to_datetime(data_inicio, dayfirst=True) - self.inicio).days
+        i1 = self.num_dias if data_fim is None else (pd.to_datetime(data_fim, dayfirst=True) - self.inicio).days + 1
+        return min(max(i0, 0), self.num_dias), min(max(i1, 0), self.num_dias)
+
+    def _estacoes(self, codigos=None):
+        if codigos is None:
+            return np.arange(len(self.codigos))
+        faltando = [str(c) for c in codigos if str(c) not in self.posicao]
+        if faltando:
+            raise KeyError(f"Estações fora do índice de disponibilidade: {faltando}")
+        return np.array([self.posicao[str(c)] for c in codigos], dtype=np.int64)
+
+    def _janela_bits(self, estacoes, byte_inicial):
+        # bits de BYTES_JANELA bytes a partir de byte_inicial (por estação), zeros fora do índice
+        byte_inicial = np.broadcast_to(np.asarray(byte_inicial, dtype=np.int64), estacoes.shape)
+        colunas = byte_inicial[:, None] + np.arange(BYTES_JANELA)
+        dentro = (colunas >= 0) & (colunas < self.bits.shape[1])
+        janela = np.where(dentro, self.bits[estacoes[:, None], np.clip(colunas, 0, max(self.bits.shape[1] - 1, 0))], 0)
+        return np.unpackbits(janela.astype(np.uint8), axis=1, bitorder='little').astype(bool)
+
+    def _acumulado_em(self, estacoes, dia):
+        # dias válidos antes do dia `dia` (0 <= dia <= num_dias): contagem do último início de mês
+        # mais os bits do mês incompleto (no máximo 30 dias)
+        k = int(np.searchsorted(self.cortes, dia, side='right')) - 1
+        corte = int(self.cortes[k])
+        total = self.acumulado[estacoes, k].astype(np.int64)
+        if dia > corte:
+            bits = self._janela_bits(estacoes, corte // 8)
+            deslocamento = corte - (corte // 8) * 8
+            total += bits[:, deslocamento:deslocamento + dia - corte].sum(axis=1)
+        return total
+
+    def contagem(self, data_inicio=None, data_fim=None, codigos=None):
+        """ Dias válidos de cada estação no período (datas inclusivas; None = todo o índice). """
+        estacoes = self._estacoes(codigos)
+        i0, i1 = self._linhas(data_inicio, data_fim)
+        if i1 <= i0:
+            return np.zeros(len(estacoes), dtype=np.int64)
+        return self._acumulado_em(estacoes, i1) - self._acumulado_em(estacoes, i0)
+
+    def extremos(self, data_inicio=None, data_fim=None, codigos=None):
+        """ Índices (dias desde `inicio`) do primeiro e do último dia válido de cada estação no
+            período, -1 sem dados. Percorre as contagens mensais do período (vetorizado) e lê os
+            bits de um mês por estação.
+        """
+        estacoes = self._estacoes(codigos)
+        i0, i1 = self._linhas(data_inicio, data_fim)
+        primeiro = np.full(len(estacoes), -1, dtype=np.int64)
+        ultimo = primeiro.copy()
+        if i1 <= i0 or not len(estacoes):
+            return primeiro, ultimo
+
+        limites = np.concatenate([[i0], self.cortes[(self.cortes > i0) & (self.cortes < i1)], [i1]])
+        interiores = np.searchsorted(self.cortes, limites[1:-1])
+        acumulado = np.hstack([self._acumulado_em(estacoes, i0)[:, None],
+                               self.acumulado[estacoes][:, interiores],
+                               self._acumulado_em(estacoes, i1)[:, None]])
+        com_dados = np.diff(acumulado, axis=1) > 0
+        tem = com_dados.any(axis=1)
+        if not tem.any():
+            return primeiro, ultimo
+        estacoes, com_dados = estacoes[tem], com_dados[tem]
+
+        # primeiro dia válido: no primeiro mês com dados, a partir do início do mês
+        comeco = limites[np.argmax(com_dados, axis=1)]
+        byte = comeco // 8
+        bits = self._janela_bits(estacoes, byte) & (byte[:, None] * 8 + np.arange(8 * BYTES_JANELA) >= comeco[:, None])
+        primeiro[tem] = byte * 8 + np.argmax(bits, axis=1)
+
+        # último dia válido: no último mês com dados, antes do fim do mês
+        final = limites[com_dados.shape[1] - np.argmax(com_dados[:, ::-1], axis=1)]
+        byte = (final - 1) // 8 - (BYTES_JANELA - 1)
+        bits = self._janela_bits(estacoes, byte) & (byte[:, None] * 8 + np.arange(8 * BYTES_JANELA) < final[:, None])
+        ultimo[tem] = byte * 8 + 8 * BYTES_JANELA - 1 - np.argmax(bits[:, ::-1], axis=1)
+        return primeiro, ultimo
+
+    def resumo(self, data_inicio=None, data_fim=None, codigos=None):
+        """ Uma linha por estação com as colunas da aba ANUAL que dependem só da disponibilidade,
+            calculadas como no download do período: 'Num de Dias' vai do primeiro ao último dia válido,
+            'Num de Anos Total' = ceil(dias / 365.25), IDV = válidos / dias * 100 e
+            'Num Anos Validos' = ceil(anos * IDV / 100). Estações sem dados no período têm IDV 0.
+        """
+        estacoes = self._estacoes(codigos)
+        nomes = [self.codigos[s] for s in estacoes]
+        validos = self.contagem(data_inicio, data_fim, nomes)
+        primeiro, ultimo = self.extremos(data_inicio, data_fim, nomes)
+        num_dias = np.where(primeiro >= 0, ultimo - primeiro, 0)
+        num_anos = np.array([math.ceil(dias / 365.25) for dias in num_dias], dtype=np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            idv = np.where(num_dias > 0, validos / num_dias * 100, 0.0)
+        datas = pd.Series(pd.NaT, index=range(len(estacoes)), dtype='datetime64[ns]')
+        tabela = pd.DataFrame({
+            "Codigo": nomes,
+            "Data Inicial": datas.where(primeiro < 0, self.inicio + pd.to_timedelta(primeiro, unit='D')),
+            "Data Final": datas.where(ultimo < 0, self.inicio + pd.to_timedelta(ultimo, unit='D')),
+            "Num de Dias": num_dias,
+            "Num de Anos Total": num_anos,
+            "Num Dados Válidos": validos,
+            "IDV": idv,
+        })
+        tabela["Num Anos Validos"] = np.ceil(num_anos * (idv / 100)).astype(np.int64)
+        return tabela
+
+    def seleciona(self, data_inicio=None, data_fim=None, min_anos=None, min_idv=None, codigos=None):
+        """ Códigos das estações com 'Num Anos Validos' >= min_anos e IDV >= min_idv no período
+            (os critérios de 04_FILTRAGEM). None não verifica o critério.
+        """
+        tabela = self.resumo(data_inicio, data_fim, codigos)
+        aceita = tabela['Num Dados Válidos'] > 0
+        if min_anos is not None:
+            aceita &= tabela['Num Anos Validos'] >= min_anos
+        if min_idv is not None:
+            aceita &= tabela['IDV'] >= min_idv
+        return tabela.loc[aceita, 'Codigo'].tolist()
+
+    def _anos(self, ano_inicial=None, ano_final=None):
+        if self.inicio is None:
+            return np.zeros(0, dtype=np.int64)
+        fim = self.inicio + pd.Timedelta(days=max(self.num_dias - 1, 0))
+        return np.arange(ano_inicial or self.inicio.year, (ano_final or fim.year) + 1)
+
+    def _dia_de(self, datas):
+        dias = (pd.DatetimeIndex(datas) - self.inicio).days.to_numpy()
+        return np.clip(dias, 0, self.num_dias)
+
+    def contagem_anual(self, ano_inicial=None, ano_final=None, codigos=None):
+        """ Dias válidos por estação (linhas) e ano (colunas), DataFrame. Os inícios de ano são
+            inícios de mês: cada coluna é uma diferença das contagens acumuladas.
+        """
+        estacoes = self._estacoes(codigos)
+        anos = self._anos(ano_inicial, ano_final)
+        limites = self._dia_de([pd.Timestamp(int(ano), 1, 1) for ano in np.append(anos, anos[-1] + 1 if len(anos) else [])])
+        acumulado = np.column_stack([self._acumulado_em(estacoes, int(dia)) for dia in limites]) if len(limites) \
+            else np.zeros((len(estacoes), 1), dtype=np.int64)
+        return pd.DataFrame(np.diff(acumulado, axis=1), index=[self.codigos[s] for s in estacoes], columns=anos)
+
+    def contagem_mensal(self, codigos=None):
+        """ Dias válidos por estação (linhas) e mês (colunas 'AAAA-MM'), DataFrame. """
+        estacoes = self._estacoes(codigos)
+        meses = [f"{data:%Y-%m}" for data in self.inicio + pd.to_timedelta(self.cortes[:-1], unit='D')] \
+            if self.inicio is not None else []
+        return pd.DataFrame(np.diff(self.acumulado[estacoes], axis=1), index=[self.codigos[s] for s in estacoes],
+                            columns=meses)
+
+    def raster(self, ano_inicial=None, ano_final=None, codigos=None):
+        """ IDV anual (%) por estação (linhas) e ano (colunas): dias válidos / dias do ano * 100,
+            como a coluna IDV da aba ANUAIS.
+        """
+        contagem = self.contagem_anual(ano_inicial, ano_final, codigos)
+        if not contagem.shape[1]:
+            return contagem.astype(np.float64)
+        anos = contagem.columns.to_numpy()
+        dias_ano = Calendario(int(anos.min()), int(anos.max())).num_dias_ano(anos)
+        return contagem / dias_ano * 100
+
+    def desenha_raster(self, caminho, ano_inicial=None, ano_final=None, codigos=None, ordena=True, titulo=None):
+        """ Grava a figura do raster estação x ano (uma linha de pixels por estação).
+            ordena: estações em ordem do ano do primeiro dado e do IDV total
+        """
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        raster = self.raster(ano_inicial, ano_final, codigos)
+        if ordena and len(raster):
+            com_dados = raster.to_numpy() > 0
+            primeiro = np.where(com_dados.any(axis=1), np.argmax(com_dados, axis=1), com_dados.shape[1])
+            raster = raster.iloc[np.lexsort((-raster.mean(axis=1).to_numpy(), primeiro))]
+
+        altura = min(max(3.0, len(raster) / 60), 40.0)
+        fig, ax = plt.subplots(figsize=(10, altura))
+        anos = raster.columns.to_numpy()
+        imagem = ax.imshow(raster.to_numpy(), aspect='auto', interpolation='nearest', cmap='viridis', vmin=0, vmax=100,
+                           extent=(anos.min() - 0.5, anos.max() + 0.5, len(raster), 0) if len(anos) else None)
+        ax.set_xlabel('Ano')
+        ax.set_ylabel(f'Estações ({len(raster)})')
+        if len(raster) <= 60:
+            ax.set_yticks(np.arange(len(raster)) + 0.5)
+            ax.set_yticklabels(raster.index, fontsize=6)
+        ax.set_title(titulo or 'Disponibilidade de dados (IDV anual, %)')
+        fig.colorbar(imagem, ax=ax, label='IDV (%)')
+        fig.tight_layout()
+        fig.savefig(caminho, dpi=150)
+        plt.close(fig)
+        return raster
@@ -0,0 +1,518 @@
+"""
+Estatísticas das estações calculadas de uma vez para todas as estações.
+
+Em vez de filtrar cópias de cada série e chamar mean/median/mode/quantile
+separadamente (cada quantile ordenando os dados de novo), os valores de cada
+estação são ordenados uma única vez. Com os dados ordenados, os subconjuntos
+por limiar de chuva (válidos >= 0, non-zero >= 0.1, LDU >= limite_chuva) são
+sufixos de cada segmento, e todas as estatísticas de ordem (mínimo, máximo,
+mediana, percentis, moda) saem por indexação direta.
+
+Os segmentos são guardados "achatados": um vetor `x` com os valores de todos
+os segmentos em sequência, ordenados dentro de cada segmento, o vetor `seg`
+com o segmento de cada valor e, por segmento, o início (`inicio`) e o
+tamanho (`n`).
+
+Para muitos limiares de uma vez (varredura_limiares, tabela_limiares) nem o
+sufixo é copiado: a posição do limiar em cada segmento sai de uma busca
+binária (searchsorted) e contagens, somas e variâncias de somas acumuladas
+(prefix sums) de x e x², então cada limiar a mais custa O(log n) por
+segmento em vez de uma nova passada sobre os dados.
+"""
+import numpy as np
+import pandas as pd
+
+from matriz_estacoes import DECIMAIS
+
+QUANTIS = (0.25, 0.50, 0.75, 0.90, 0.95, 0.99)
+# Limiares (mm) usados nos índices de dias chuvosos e de chuva forte
+LIMIARES = (0.1, 1.0, 2.5, 5.0, 10.0, 20.0, 50.0)
+
+
+def ordena_colunas(matriz):
+    """ Ordena cada coluna da matriz (dias x estações, NaN = sem dado) e devolve
+        os segmentos achatados (x, seg, inicio, n), um segmento por coluna.
+    """
+    ordenada = np.sort(matriz, axis=0)  # NaN vai para o fim de cada coluna
+    n = np.count_nonzero(~np.isnan(ordenada), axis=0)
+    validos = np.arange(ordenada.shape[0])[None, :] < n[:, None]
+    x = ordenada.T[validos]
+    seg = np.repeat(np.arange(len(n)), n)
+    inicio = np.concatenate(([0], np.cumsum(n)[:-1]))
+    return x, seg, inicio, n
+
+
+def estatisticas(x, seg, inicio, n, limiar=None, quantis=QUANTIS):
+    """ Estatísticas de cada segmento considerando só os valores >= limiar.
+        Retorna dict de vetores (um valor por segmento): n, media, mediana, moda,
+        maximo, minimo, desvio, variancia e P25..P99 (conforme `quantis`).
+        Segmentos vazios ficam com NaN (variância e desvio exigem 2 valores).
+    """
+    num_seg = len(n)
+    if limiar is not None:
+        abaixo = np.bincount(seg[x < limiar], minlength=num_seg)
+        mascara = x >= limiar
+        x, seg = x[mascara], seg[mascara]
+        inicio = inicio - np.concatenate(([0], np.cumsum(abaixo)[:-1])) if num_seg else inicio
+        n = n - abaixo
+    else:
+        inicio = np.asarray(inicio)
+        n = np.asarray(n)
+
+    est = {'n': n}
+    cheio = n > 0
+    ultimo = np.where(cheio, inicio + n - 1, 0)
+    primeiro = np.where(cheio, inicio, 0)
+    if len(x) == 0:
+        x = np.full(1, np.nan)  # só para a indexação abaixo; todos os segmentos estão vazios
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        soma = np.bincount(seg, weights=x[:len(seg)], minlength=num_seg)
+        media = np.where(cheio, soma / n, np.nan)
+        desvios = x[:len(seg)] - media[seg]
+        soma_quadrados = np.bincount(seg, weights=desvios * desvios, minlength=num_seg)
+        variancia = np.where(n > 1, soma_quadrados / (n - 1), np.nan)
+
+    est['media'] = media
+    est['variancia'] = variancia
+    est['desvio'] = np.sqrt(variancia)
+    est['minimo'] = np.where(cheio, x[primeiro], np.nan)
+    est['maximo'] = np.where(cheio, x[ultimo], np.nan)
+    for q in quantis:
+        est[q] = quantil_ordenado(x, inicio, n, q)
+    est['mediana'] = est[0.5] if 0.5 in est else quantil_ordenado(x, inicio, n, 0.5)
+    est['moda'] = moda_ordenada(x[:len(seg)], seg, num_seg)
+    return est
+
+
+def quantil_ordenado(x, inicio, n, q):
+    """ Quantil com interpolação linear (o mesmo de pandas.Series.quantile) em segmentos ordenados. """
+    cheio = n > 0
+    # pandas passa q * 100 ao numpy, que divide por 100: o mesmo arredondamento de q aqui
+    q = (q * 100) / 100
+    # posição relativa ao início do segmento, para a fração não depender de onde ele está no vetor
+    posicao = np.where(cheio, (n - 1) * q, 0.0)
+    anterior = np.floor(posicao)
+    fracao = posicao - anterior
+    baixo = np.where(cheio, inicio + anterior.astype(np.int64), 0)
+    alto = np.minimum(baixo + 1, np.where(cheio, inicio + n - 1, 0))
+    diferenca = x[alto] - x[baixo]
+    valor = np.where(fracao >= 0.5, x[alto] - diferenca * (1 - fracao), x[baixo] + diferenca * fracao)
+    return np.where(cheio, valor, np.nan)
+
+
+def moda_ordenada(x, seg, num_seg):
+    """ Valor mais frequente de cada segmento ordenado; no empate, o menor (como pandas.Series.mode). """
+    return moda_limiares(x, seg, num_seg, (-np.inf,))[-np.inf]
+
+
+def moda_limiares(x, seg, num_seg, limiares):
+    """ moda_ordenada dos valores >= limiar de cada segmento, para vários limiares. As corridas de
+        valores iguais são separadas uma vez só: cada corrida fica inteira acima ou abaixo do limiar.
+        Retorna {limiar: moda de cada segmento}.
+    """
+    modas = {limiar: np.full(num_seg, np.nan) for limiar in limiares}
+    if len(seg) == 0:
+        return modas
+    x = x[:len(seg)]
+    novo = np.ones(len(x), dtype=bool)
+    novo[1:] = (seg[1:] != seg[:-1]) | (x[1:] != x[:-1])
+    inicio_corrida = np.flatnonzero(novo)
+    tamanho = np.diff(np.append(inicio_corrida, len(x)))
+    seg_corrida = seg[inicio_corrida]
+    valor = x[inicio_corrida]
+    for limiar in limiares:
+        acima = np.flatnonzero(valor >= limiar)
+        ordem = acima[np.lexsort((inicio_corrida[acima], -tamanho[acima], seg_corrida[acima]))]
+        primeira = np.ones(len(ordem), dtype=bool)
+        primeira[1:] = seg_corrida[ordem[1:]] != seg_corrida[ordem[:-1]]
+        melhores = ordem[primeira]
+        modas[limiar][seg_corrida[melhores]] = valor[melhores]
+    return modas
+
+
+def busca_segmentos(x, inicio, n, valores):
+    """ searchsorted (side='left') de cada valor dentro de cada segmento ordenado, para todos
+        os segmentos de uma vez (busca binária vetorizada).
+        Retorna a matriz (segmentos x valores) com a posição em x do primeiro elemento >= valor
+        (inicio + n se não houver).
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    baixo = np.repeat(np.asarray(inicio, dtype=np.int64)[:, None], len(valores), axis=1)
+    alto = baixo + np.asarray(n, dtype=np.int64)[:, None]
+    for _ in range(int(np.max(n, initial=0)).bit_length()):
+        ativo = baixo < alto
+        meio = (baixo + alto) // 2
+        menor = ativo & (x[np.where(ativo, meio, 0)] < valores)
+        baixo = np.where(menor, meio + 1, baixo)
+        alto = np.where(ativo & ~menor, meio, alto)
+    return baixo
+
+
+def acumulado_segmentos(v, seg, inicio, n):
+    """ Soma acumulada de v com um 0 no início (acumulado[fim] - acumulado[p] = soma de v[p:fim]),
+        recomeçando (quase) do zero a cada segmento: a soma do segmento anterior é descontada no
+        primeiro valor, para o arredondamento não crescer com o total do bloco inteiro.
+    """
+    y = np.array(v[:len(seg)], dtype=np.float64)
+    total = np.bincount(seg, weights=y, minlength=len(n))
+    cheios = np.flatnonzero(np.asarray(n) > 0)
+    y[np.asarray(inicio)[cheios[1:]]] -= total[cheios[:-1]]
+    return np.concatenate(([0.0], np.cumsum(y)))
+
+
+def varredura_limiares(x, seg, inicio, n, limiares=LIMIARES, quantis=QUANTIS, moda=False, momentos=None):
+    """ Estatísticas de cada segmento acima de vários limiares (valores >= limiar) com uma única
+        ordenação: a posição de cada limiar vem de busca_segmentos e as somas, de somas acumuladas.
+        Retorna {limiar: dict de vetores} com n, soma, media, variancia, desvio, minimo, maximo,
+        mediana e os quantis, como estatisticas(); a moda só com moda=True.
+        momentos(dict): {limiar: (soma, soma dos quadrados)} de cada segmento já calculados
+            (ex.: somas acumuladas no tempo, ver janelas.py); None = calculados aqui
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    n = np.asarray(n, dtype=np.int64)
+    fim = inicio + n
+    if len(x) == 0:
+        x = np.full(1, np.nan)  # só para a indexação abaixo; todos os segmentos estão vazios
+    if momentos is None:
+        acumulado = acumulado_segmentos(x, seg, inicio, n)
+        acumulado2 = acumulado_segmentos(x * x, seg, inicio, n)
+    posicoes = busca_segmentos(x, inicio, n, limiares)
+    modas = moda_limiares(x, seg, len(n), limiares) if moda else None
+
+    resultado = {}
+    for k, limiar in enumerate(limiares):
+        p = posicoes[:, k]
+        cont = fim - p
+        cheio = cont > 0
+        if momentos is None:
+            soma, soma2 = acumulado[fim] - acumulado[p], acumulado2[fim] - acumulado2[p]
+        else:
+            soma, soma2 = momentos[limiar]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = np.where(cheio, soma / cont, np.nan)
+            soma_quadrados = np.maximum(soma2 - soma * media, 0.0)
+            variancia = np.where(cont > 1, soma_quadrados / (cont - 1), np.nan)
+        est = {'n': cont, 'soma': np.where(cheio, soma, 0.0), 'media': media,
+               'variancia': variancia, 'desvio': np.sqrt(variancia),
+               'minimo': np.where(cheio, x[np.where(cheio, p, 0)], np.nan),
+               'maximo': np.where(cheio, x[np.where(cheio, fim - 1, 0)], np.nan)}
+        for q in quantis:
+            est[q] = quantil_ordenado(x, p, cont, q)
+        est['mediana'] = est[0.5] if 0.5 in est else quantil_ordenado(x, p, cont, 0.5)
+        if moda:
+            est['moda'] = modas[limiar]
+        resultado[limiar] = est
+    return resultado
+
+
+def colunas_estatisticas(est, sufixo='', media_mes=True):
+    """ Nomes e valores das colunas de estatísticas das planilhas de sumário.
+        sufixo(str): '' (todos os válidos), 'NZ' (non-zero) ou 'LDU'
+        media_mes(bool): inclui a coluna 'Média mm/mes' (a aba ANUAIS não tem)
+    """
+    s = f" {sufixo}" if sufixo else ""
+    colunas = {f"Média{s} mm/dia": est['media']}
+    if media_mes:
+        colunas[f"Média{s} mm/mes"] = est['media'] * 30
+    colunas[f"Média{s} mm/ano"] = est['media'] * 365
+    colunas[f"Mediana{s}"] = est['mediana']
+    colunas[f"Moda{s}"] = est['moda']
+    colunas[f"Máximo{s}"] = est['maximo']
+    colunas[f"Mínimo{s}"] = est['minimo']
+    colunas[f"Desvio Padrao{s}"] = est['desvio']
+    colunas[f"Variancia{s}"] = est['variancia']
+    for q in QUANTIS:
+        p = f"P{round(q * 100)}"
+        colunas[f"{p}({sufixo})" if sufixo == 'LDU' else f"{p}{s}"] = est[q]
+    return colunas
+
+
+def blocos_estatisticas(est_validos, est_nz, est_ldu, media_mes=True):
+    """ Colunas STAT-ALL, CHUVA NON-ZERO e CHUVA LDU, na ordem das planilhas. """
+    colunas = {"STAT-ALL": " - "}
+    colunas.update(colunas_estatisticas(est_validos, '', media_mes))
+    colunas["CHUVA NON-ZERO"] = " - "
+    colunas.update(colunas_estatisticas(est_nz, 'NZ', media_mes))
+    colunas["CHUVA LDU"] = " - "
+    colunas.update(colunas_estatisticas(est_ldu, 'LDU', media_mes))
+    return colunas
+
+
+def junta_estatisticas(partes):
+    """ Concatena os resultados de estatisticas() calculados em blocos de segmentos. """
+    return {campo: np.concatenate([parte[campo] for parte in partes]) for campo in partes[0]}
+
+
+def tabela_anual(metadados, matriz, limite_chuva=1.0, bloco=512):
+    """ Monta a aba ANUAL para todas as estações de uma vez.
+        metadados(DataFrame): uma linha por coluna da matriz, com as colunas de identificação
+            da estação até 'Num de Anos Total' (inclusive 'Num de Dias')
+        matriz(ndarray): dias x estações com os dados válidos (>= 0) e NaN onde não há dado
+        bloco(int): estações processadas por vez, para limitar a memória
+    """
+    partes = {'': [], 'NZ': [], 'LDU': []}
+    for j in range(0, matriz.shape[1], bloco):
+        x, seg, inicio, n = ordena_colunas(np.asarray(matriz[:, j:j + bloco], dtype=np.float64))
+        partes[''].append(estatisticas(x, seg, inicio, n))
+        partes['NZ'].append(estatisticas(x, seg, inicio, n, 0.1))
+        partes['LDU'].append(estatisticas(x, seg, inicio, n, limite_chuva))
+    est = {chave: junta_estatisticas(lista) for chave, lista in partes.items()}
+    return monta_anual(metadados, est[''], est['NZ'], est['LDU'])
+
+
+def monta_anual(metadados, est, est_nz, est_ldu):
+    """ Aba ANUAL a partir das estatísticas de cada estação (válidos, non-zero e LDU). """
+    num_de_dias = metadados['Num de Dias'].to_numpy(dtype=np.float64)
+    num_anos = metadados['Num de Anos Total'].to_numpy(dtype=np.float64)
+
+    def indice(contagem):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(num_de_dias > 0, contagem / num_de_dias * 100, 0.0)
+
+    idv = indice(est['n'])
+
+    tabela = metadados.reset_index(drop=True).copy()
+    tabela["Num Anos Validos"] = np.ceil(num_anos * (idv / 100)).astype(np.int64)
+    tabela["Num Dados Válidos"] = est['n']
+    tabela["Num Dados chuva non_zero"] = est_nz['n']
+    tabela["Num Dados >= LDU"] = est_ldu['n']
+    tabela["IDV"] = idv
+    tabela["IDV LDU"] = indice(est_ldu['n'])
+    tabela["IDV Nonzero"] = indice(est_nz['n'])
+    estatisticas_df = pd.DataFrame(blocos_estatisticas(est, est_nz, est_ldu), index=tabela.index)
+    return pd.concat([tabela, estatisticas_df], axis=1)
+
+
+def dias_no_mes(anos, meses):
+    """ Número de dias de cada (ano, mês), vetorizado. """
+    inicio = (np.asarray(anos) - 1970) * 12 + (np.asarray(meses) - 1)
+    inicio = inicio.astype('datetime64[M]')
+    return ((inicio + 1).astype('datetime64[D]') - inicio.astype('datetime64[D]')).astype(np.int64)
+
+
+class Calendario:
+    """ Tabela com o número de dias de cada mês de cada ano, acumulada ao longo dos anos,
+        para contar em O(1) os dias de um mês (ou ano) entre dois anos quaisquer.
+    """
+    def __init__(self, ano_inicial, ano_final) -> None:
+        self.ano_inicial = ano_inicial
+        anos = np.arange(ano_inicial, ano_final + 1)
+        dias = dias_no_mes(anos[:, None], np.arange(1, 13)[None, :])
+        # acumulado[a, m-1]: dias do mês m somados de ano_inicial até ano_inicial + a - 1
+        self.acumulado = np.vstack([np.zeros((1, 12), dtype=np.int64), np.cumsum(dias, axis=0)])
+        self.dias_ano = dias.sum(axis=1)
+
+    def total_dias_mes(self, mes, ano_inicio, ano_fim):
+        """ Dias do mês `mes` somados de ano_inicio até ano_fim (vetorizado). """
+        mes = np.asarray(mes) - 1
+        return (self.acumulado[np.asarray(ano_fim) - self.ano_inicial + 1, mes]
+                - self.acumulado[np.asarray(ano_inicio) - self.ano_inicial, mes])
+
+    def num_dias_ano(self, ano):
+        return self.dias_ano[np.asarray(ano) - self.ano_inicial]
+
+
+def ordena_grupos(parte, chave_linha, num_chaves):
+    """ Segmentos achatados (x, seg, inicio, n) de cada grupo (estação, chave) com dados de
+        `parte` (dias x estações), ordenados por estação e chave, e o id de cada grupo
+        (coluna * num_chaves + chave).
+    """
+    linhas, colunas = np.nonzero(~np.isnan(parte))
+    valores = parte[linhas, colunas]
+    grupo = colunas.astype(np.int64) * num_chaves + chave_linha[linhas]
+
+    ordem = np.lexsort((valores, grupo))
+    x, grupo = valores[ordem], grupo[ordem]
+    ids, inicio, n = np.unique(grupo, return_index=True, return_counts=True)
+    seg = np.repeat(np.arange(len(ids)), n)
+    return x, seg, inicio, n, ids
+
+
+def estatisticas_agrupadas(matriz, chave_linha, num_chaves, limite_chuva=1.0, bloco=256):
+    """ Estatísticas por (estação, chave) para todas as estações de uma vez.
+        matriz(ndarray): dias x estações, NaN onde não há dado
+        chave_linha(ndarray int): chave de cada dia (linha), de 0 a num_chaves-1 (ex.: mês - 1)
+        Retorna (estacao, chave, est_validos, est_nz, est_ldu), só para os grupos com dados,
+        ordenados por estação e chave.
+    """
+    estacoes, chaves, partes = [], [], {'': [], 'NZ': [], 'LDU': []}
+    for j in range(0, matriz.shape[1], bloco):
+        x, seg, inicio, n, ids = ordena_grupos(np.asarray(matriz[:, j:j + bloco], dtype=np.float64),
+                                               chave_linha, num_chaves)
+
+        estacoes.append(j + ids // num_chaves)
+        chaves.append(ids % num_chaves)
+        partes[''].append(estatisticas(x, seg, inicio, n))
+        partes['NZ'].append(estatisticas(x, seg, inicio, n, 0.1))
+        partes['LDU'].append(estatisticas(x, seg, inicio, n, limite_chuva))
+
+    return (np.concatenate(estacoes), np.concatenate(chaves),
+            junta_estatisticas(partes['']), junta_estatisticas(partes['NZ']), junta_estatisticas(partes['LDU']))
+
+
+COLUNAS_ESTACAO = ["Codigo", "Nome", "Latitude", "Longitude", "Altitude", "cidade", "UF",
+                   "Bacia", "Sub Bacia", "Rio", "orgao"]
+
+
+def tabela_mensal(metadados, matriz, datas, limite_chuva=1.0):
+    """ Monta a aba MENSAL (uma linha por estação e mês com dados, todos os anos juntos).
+        metadados(DataFrame): a aba ANUAL (ou suas colunas de identificação), uma linha por coluna da matriz
+        datas(DatetimeIndex): data de cada linha da matriz
+    """
+    estacao, chave, est, est_nz, est_ldu = estatisticas_agrupadas(
+        matriz, datas.month.to_numpy() - 1, 12, limite_chuva)
+    return monta_mensal(metadados, estacao, chave + 1, est, est_nz, est_ldu)
+
+
+def monta_mensal(metadados, estacao, mes, est, est_nz, est_ldu):
+    """ Aba MENSAL a partir das estatísticas de cada (estação, mês), ordenados por estação e mês.
+        estacao(ndarray int): linha de `metadados` de cada grupo
+    """
+    data_min = pd.DatetimeIndex(metadados["Data Inicial"])
+    data_max = pd.DatetimeIndex(metadados["Data Final"])
+    calendario = Calendario(int(data_min.year.min()), int(data_max.year.max()))
+    total_dias = calendario.total_dias_mes(mes, data_min.year.to_numpy()[estacao], data_max.year.to_numpy()[estacao])
+
+    tabela = metadados[COLUNAS_ESTACAO].iloc[estacao].reset_index(drop=True)
+    tabela["CONTAGEM"] = " - "
+    tabela["mes"] = mes
+    tabela["Data Inicial"] = data_min[estacao]
+    tabela["Data Final"] = data_max[estacao]
+    _contagens(tabela, total_dias, est['n'], est_nz['n'], est_ldu['n'], "ID Nonzero")
+    estatisticas_df = pd.DataFrame(blocos_estatisticas(est, est_nz, est_ldu), index=tabela.index)
+    return pd.concat([tabela, estatisticas_df], axis=1)
+
+
+def tabela_anos(metadados, matriz, datas, limite_chuva=1.0):
+    """ Monta a aba ANUAIS (uma linha por estação e ano com dados). """
+    ano_inicial = int(datas.year.min())
+    estacao, chave, est, est_nz, est_ldu = estatisticas_agrupadas(
+        matriz, datas.year.to_numpy() - ano_inicial, int(datas.year.max()) - ano_inicial + 1, limite_chuva)
+    return monta_anos(metadados, estacao, chave + ano_inicial, est, est_nz, est_ldu)
+
+
+def monta_anos(metadados, estacao, ano, est, est_nz, est_ldu):
+    """ Aba ANUAIS a partir das estatísticas de cada (estação, ano), ordenados por estação e ano. """
+    ano = np.asarray(ano)
+    num_dias_ano = Calendario(int(ano.min()), int(ano.max())).num_dias_ano(ano) if len(ano) else ano
+
+    tabela = metadados[COLUNAS_ESTACAO].iloc[estacao].reset_index(drop=True)
+    tabela["CONTAGEM"] = " - "
+    tabela["ano"] = ano
+    tabela["Data Inicial"] = pd.DatetimeIndex(metadados["Data Inicial"])[estacao]
+    tabela["Data Final"] = pd.DatetimeIndex(metadados["Data Final"])[estacao]
+    # Nesta aba os índices LDU e Nonzero repetem o IDV, como sempre foi calculado por ano
+    _contagens(tabela, num_dias_ano, est['n'], est_nz['n'], est_ldu['n'], "IDV Nonzero", repete_idv=True)
+    estatisticas_df = pd.DataFrame(blocos_estatisticas(est, est_nz, est_ldu, media_mes=False), index=tabela.index)
+    return pd.concat([tabela, estatisticas_df], axis=1)
+
+
+def colunas_limiares(varredura, n_validos, quantis=QUANTIS):
+    """ Colunas da tabela larga da varredura de limiares, agrupadas por limiar. """
+    colunas = {}
+    for limiar, est in varredura.items():
+        s = f">= {limiar:g}"
+        colunas[f"Dias {s}"] = est['n']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            colunas[f"Freq {s} (%)"] = np.where(n_validos > 0, est['n'] / n_validos * 100, np.nan)
+        colunas[f"Total {s} mm"] = est['soma']
+        colunas[f"Média {s} mm/dia"] = est['media']
+        colunas[f"Desvio Padrao {s}"] = est['desvio']
+        for q in quantis:
+            colunas[f"P{round(q * 100)} {s}"] = est[q]
+    return colunas
+
+
+def tabela_limiares(metadados, matriz, limiares=LIMIARES, datas=None, por=None, quantis=QUANTIS, bloco=512):
+    """ Tabela larga com dias, frequência, total, média, desvio e percentis acima de cada limiar
+        (chuva >= limiar), para qualquer lista de limiares com uma única ordenação por estação
+        (ver varredura_limiares).
+        metadados(DataFrame): uma linha por coluna da matriz, com COLUNAS_ESTACAO (ex.: a aba ANUAL)
+        matriz: dias x estações com os dados válidos e NaN onde não há dado (ndarray,
+            MatrizEstacaoDia ou ArmazemMatriz: qualquer objeto com shape e matriz[:, j:k])
+        por(str): None = uma linha por estação; 'ano' ou 'mes' = uma linha por estação e ano/mês
+            com dados (precisa de `datas`)
+    """
+    limiares = sorted(float(limiar) for limiar in limiares)
+    if por is None:
+        chave_linha, num_chaves, primeira = None, 1, 0
+    elif por == 'ano':
+        primeira = int(datas.year.min())
+        chave_linha, num_chaves = datas.year.to_numpy() - primeira, int(datas.year.max()) - primeira + 1
+    elif por == 'mes':
+        chave_linha, num_chaves, primeira = datas.month.to_numpy() - 1, 12, 1
+    else:
+        raise ValueError(f"por deve ser None, 'ano' ou 'mes': {por}")
+
+    estacoes, chaves, n_validos, partes = [], [], [], []
+    for j in range(0, matriz.shape[1], bloco):
+        parte = np.asarray(matriz[:, j:j + bloco], dtype=np.float64)
+        if por is None:
+            # uma linha por estação, inclusive as sem dados
+            x, seg, inicio, n = ordena_colunas(parte)
+            ids = np.arange(parte.shape[1])
+        else:
+            x, seg, inicio, n, ids = ordena_grupos(parte, chave_linha, num_chaves)
+        estacoes.append(j + ids // num_chaves)
+        chaves.append(ids % num_chaves)
+        n_validos.append(n)
+        partes.append(varredura_limiares(x, seg, inicio, n, limiares, quantis))
+    estacao = np.concatenate(estacoes)
+    n_validos = np.concatenate(n_validos)
+    varredura = {limiar: junta_estatisticas([parte[limiar] for parte in partes]) for limiar in limiares}
+
+    tabela = metadados[COLUNAS_ESTACAO].iloc[estacao].reset_index(drop=True)
+    if por is not None:
+        tabela[por] = np.concatenate(chaves) + primeira
+    tabela["Num Dados Válidos"] = n_validos
+    colunas = pd.DataFrame(colunas_limiares(varredura, n_validos, quantis), index=tabela.index)
+    return pd.concat([tabela, colunas], axis=1)
+
+
+def calcula_tabelas(metadados, matriz, datas, limite_chuva=1.0):
+    """ Abas ANUAL, MENSAL e ANUAIS de um bloco de estações, como (anual, mensal, anos).
+        Cada estação é calculada só com os próprios dados, então os blocos podem ser
+        calculados separadamente (ex.: em outros processos) e concatenados na ordem.
+        matriz(ndarray float32): dias x estações do bloco, como MatrizEstacaoDia.bloco
+            (arredondada para DECIMAIS ao converter para float64, como matriz[:, :])
+        datas(DatetimeIndex): data de cada linha da matriz
+    """
+    matriz = np.round(np.asarray(matriz).astype(np.float64), DECIMAIS)
+    return (tabela_anual(metadados, matriz, limite_chuva),
+            tabela_mensal(metadados, matriz, datas, limite_chuva),
+            tabela_anos(metadados, matriz, datas, limite_chuva))
+
+
+def atualiza_tabela(anterior, nova, codigos, reaproveitadas, chave=None):
+    """ Junta as linhas de uma tabela já calculada (ANUAL, ANUAIS ou MENSAL) das estações
+        reaproveitadas com as linhas recalculadas, na ordem de `codigos` e, dentro de cada
+        estação, da chave ('ano' ou 'mes').
+        anterior(DataFrame): tabela da execução anterior
+        nova(DataFrame): tabela só das estações recalculadas (ou None)
+        codigos(list): códigos das estações, na ordem das colunas da matriz
+        reaproveitadas(set): códigos (str) cujas linhas vêm de `anterior`
+    """
+    posicao = {str(codigo): j for j, codigo in enumerate(codigos)}
+    anterior = anterior[anterior['Codigo'].astype(str).isin(reaproveitadas)]
+    tabela = pd.concat([parte for parte in (anterior, nova) if parte is not None], ignore_index=True)
+    ordem = tabela['Codigo'].astype(str).map(posicao).to_numpy()
+    chaves = (ordem,) if chave is None else (tabela[chave].to_numpy(), ordem)
+    return tabela.iloc[np.lexsort(chaves)].reset_index(drop=True)
+
+
+def _contagens(tabela, num_dias, n, n_nz, n_ldu, nome_nonzero, repete_idv=False):
+    # Colunas de contagem e índices de dados válidos das abas MENSAL e ANUAIS
+    def indice(contagem):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(num_dias > 0, (contagem / num_dias) * 100, 0.0)
+
+    idv = indice(n)
+    tabela["Num de Dias"] = num_dias
+    tabela["Num de Dias válidos"] = n
+    tabela["Num Dias Validos"] = np.ceil(num_dias * (idv / 100)).astype(np.int64)
+    tabela["Num Dados chuva non_zero"] = n_nz
+    tabela["Num Dados >= LDU"] = n_ldu
+    tabela["IDV"] = idv
+    tabela["IDV LDU"] = idv if repete_idv else indice(n_ldu)
+    tabela[nome_nonzero] = idv if repete_idv else indice(n_nz)
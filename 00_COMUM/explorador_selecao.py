@@ -0,0 +1,170 @@
+"""
+Exploração dos limites da seleção de estações (04_FILTRAGEM: 'Num Anos Validos' >= N e IDV >= x)
+para uma grade de (mínimo de anos, mínimo de IDV, período) de uma vez, sem refazer as etapas 04 a 06
+para cada escolha.
+
+Para cada período as chaves das estações (Num Anos Validos, IDV) são ordenadas uma vez pelo IDV
+(ExploradorSelecao). Para uma grade de limites:
+    - cada estação cai na maior célula da grade em que passa (busca binária nos limites); as
+      estações que passam em (anos, idv) são as das células com limites maiores ou iguais, então
+      um histograma 2-D acumulado de trás para frente (dominância) dá as contagens da grade toda;
+    - a cobertura espacial é o mesmo histograma por quadrícula de `celula` graus: a quadrícula
+      está coberta quando tem ao menos uma estação selecionada; a cobertura é a fração das
+      quadrículas que têm alguma estação candidata em qualquer período;
+    - a lista das estações de uma combinação é um prefixo da ordem por IDV filtrado pelos anos.
+
+As chaves vêm dos sumários de cada período (aba ANUAL, de_sumarios) ou do índice de
+disponibilidade da matriz do download, para qualquer período (de_disponibilidade).
+"""
+import numpy as np
+import pandas as pd
+
+from tabelas import le_tabela
+from janelas import nome_periodo
+
+COLUNAS = ["Codigo", "Latitude", "Longitude", "Num Anos Validos", "IDV"]
+
+
+def grade(texto, tipo=float):
+    """ '10:30' (passo 1), '50:100:5' (início:fim:passo, fim incluído) ou '20,24,28' -> lista de limites. """
+    if ':' in str(texto):
+        partes = [tipo(p) for p in str(texto).split(':')]
+        inicio, fim, passo = partes[0], partes[1], partes[2] if len(partes) > 2 else tipo(1)
+        return [tipo(v) for v in np.arange(inicio, fim + passo / 2, passo)]
+    return [tipo(p) for p in str(texto).split(',') if p.strip()]
+
+
+class ExploradorSelecao:
+    """ tabelas(dict): período -> DataFrame com COLUNAS (uma linha por estação candidata)
+        celula(float): lado das quadrículas da cobertura espacial, em graus
+    """
+    def __init__(self, tabelas, celula=0.5) -> None:
+        self.celula = celula
+        self.periodos = list(tabelas)
+        todas = pd.concat([t[["Codigo", "Latitude", "Longitude"]] for t in tabelas.values()], ignore_index=True)
+        quadriculas = self._quadriculas(todas)
+        self.quadriculas = np.unique(quadriculas[quadriculas >= 0])
+
+        self.chaves = {}
+        for periodo, tabela in tabelas.items():
+            idv = tabela['IDV'].to_numpy(dtype=np.float64)
+            ordem = np.argsort(-idv, kind='stable')
+            quadricula = self._quadriculas(tabela)
+            quadricula = np.where(quadricula >= 0, np.searchsorted(self.quadriculas, quadricula), -1)
+            self.chaves[periodo] = {
+                'codigo': tabela['Codigo'].astype(str).to_numpy()[ordem],
+                'idv': idv[ordem],                     # decrescente
+                'anos': tabela['Num Anos Validos'].to_numpy(dtype=np.float64)[ordem],
+                'quadricula': quadricula[ordem],
+            }
+
+    def _quadriculas(self, tabela):
+        # id da quadrícula de cada estação (-1 sem coordenadas)
+        lat = tabela['Latitude'].to_numpy(dtype=np.float64)
+        lon = tabela['Longitude'].to_numpy(dtype=np.float64)
+        valida = np.isfinite(lat) & np.isfinite(lon)
+        i = np.floor((np.nan_to_num(lat) + 90) / self.celula).astype(np.int64)
+        j = np.floor((np.nan_to_num(lon) + 180) / self.celula).astype(np.int64)
+        return np.where(valida, i * int(np.ceil(360 / self.celula)) + j, -1)
+
+    @classmethod
+    def de_sumarios(cls, sumarios, celula=0.5):
+        """ sumarios(dict): período -> caminho do sumário (lê só as COLUNAS da aba ANUAL). """
+        return cls({periodo: le_tabela(caminho, 'ANUAL', COLUNAS) for periodo, caminho in sumarios.items()}, celula)
+
+    @classmethod
+    def de_disponibilidade(cls, indice, identificacao, periodos, celula=0.5):
+        """ indice(IndiceDisponibilidade): índice da matriz do download (ArmazemMatriz.disponibilidade())
+            identificacao(DataFrame): Codigo, Latitude e Longitude das estações (ex.: aba ANUAL do sumário)
+            periodos(list): (inicio, fim) de cada período, datas inclusivas
+        """
+        coordenadas = identificacao[["Codigo", "Latitude", "Longitude"]].copy()
+        coordenadas['Codigo'] = coordenadas['Codigo'].astype(str)
+        codigos = [c for c in indice.codigos if c in set(coordenadas['Codigo'])]
+        tabelas = {}
+        for inicio, fim in periodos:
+            resumo = indice.resumo(inicio, fim, codigos)
+            resumo = resumo[resumo['Num Dados Válidos'] > 0]
+            tabelas[nome_periodo(inicio, fim)] = resumo.merge(coordenadas, on='Codigo', how='left')[COLUNAS]
+        return cls(tabelas, celula)
+
+    def estacoes(self, periodo, min_anos, min_idv):
+        """ Códigos das estações do período com Num Anos Validos >= min_anos e IDV >= min_idv. """
+        chaves = self.chaves[periodo]
+        k = np.searchsorted(-chaves['idv'], -min_idv, side='right')
+        return chaves['codigo'][:k][chaves['anos'][:k] >= min_anos].tolist()
+
+    def contagens(self, periodo, min_anos, min_idv):
+        """ (estações, quadrículas cobertas) para cada (min_anos, min_idv) da grade, matrizes
+            len(min_anos) x len(min_idv). Os limites devem estar em ordem crescente.
+        """
+        chaves = self.chaves[periodo]
+        min_anos = np.asarray(min_anos, dtype=np.float64)
+        min_idv = np.asarray(min_idv, dtype=np.float64)
+        # maior limite da grade em que a estação passa (-1: não passa em nenhum)
+        ka = np.searchsorted(min_anos, chaves['anos'], side='right') - 1
+        ki = np.searchsorted(min_idv, chaves['idv'], side='right') - 1
+        passa = (ka >= 0) & (ki >= 0)
+        num_quadriculas = len(self.quadriculas) + 1        # a última recebe as estações sem coordenadas
+        quadricula = np.where(chaves['quadricula'] >= 0, chaves['quadricula'], num_quadriculas - 1)
+        forma = (num_quadriculas, len(min_anos), len(min_idv))
+        plano = np.ravel_multi_index((quadricula[passa], ka[passa], ki[passa]), forma)
+        histograma = np.bincount(plano, minlength=int(np.prod(forma))).reshape(forma)
+        # dominância: passa em (a, i) quem está em uma célula (a' >= a, i' >= i)
+        histograma = histograma[:, ::-1, ::-1].cumsum(axis=1).cumsum(axis=2)[:, ::-1, ::-1]
+        return histograma.sum(axis=0), (histograma[:-1] > 0).sum(axis=0)
+
+    def tabela(self, min_anos, min_idv, periodos=None, lista=False):
+        """ Tabela de compromisso: uma linha por (período, min anos, min IDV) com o número de
+            estações, as quadrículas cobertas e a cobertura (%); lista=True inclui os códigos.
+        """
+        min_anos, min_idv = sorted(min_anos), sorted(min_idv)
+        linhas = []
+        for periodo in periodos or self.periodos:
+            estacoes, cobertas = self.contagens(periodo, min_anos, min_idv)
+            a, i = np.meshgrid(np.arange(len(min_anos)), np.arange(len(min_idv)), indexing='ij')
+            parte = pd.DataFrame({
+                'periodo': periodo,
+                'min anos': np.asarray(min_anos)[a.ravel()],
+                'min IDV': np.asarray(min_idv)[i.ravel()],
+                'estacoes': estacoes.ravel(),
+                'candidatas': len(self.chaves[periodo]['codigo']),
+                'quadriculas cobertas': cobertas.ravel(),
+                'cobertura (%)': cobertas.ravel() / max(len(self.quadriculas), 1) * 100,
+            })
+            if lista:
+                parte['codigos'] = [','.join(self.estacoes(periodo, anos, idv))
+                                    for anos, idv in zip(parte['min anos'], parte['min IDV'])]
+            linhas.append(parte)
+        return pd.concat(linhas, ignore_index=True)
+
+    def desenha(self, caminho, tabela):
+        """ Mapas de calor (min anos x min IDV) do número de estações (com a cobertura em cada
+            célula) de cada período da tabela, lado a lado.
+        """
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        periodos = list(dict.fromkeys(tabela['periodo']))
+        fig, eixos = plt.subplots(1, len(periodos), figsize=(6 * len(periodos), 5), squeeze=False)
+        for ax, periodo in zip(eixos[0], periodos):
+            parte = tabela[tabela['periodo'] == periodo]
+            estacoes = parte.pivot(index='min anos', columns='min IDV', values='estacoes')
+            cobertura = parte.pivot(index='min anos', columns='min IDV', values='cobertura (%)')
+            imagem = ax.imshow(estacoes.to_numpy(), origin='lower', aspect='auto', cmap='viridis')
+            ax.set_xticks(range(estacoes.shape[1]))
+            ax.set_xticklabels([f"{v:g}" for v in estacoes.columns], rotation=90, fontsize=7)
+            ax.set_yticks(range(estacoes.shape[0]))
+            ax.set_yticklabels([f"{v:g}" for v in estacoes.index], fontsize=7)
+            if estacoes.size <= 400:
+                for (y, x), n in np.ndenumerate(estacoes.to_numpy()):
+                    ax.text(x, y, f"{n}\n{cobertura.to_numpy()[y, x]:.0f}%", ha='center', va='center',
+                            fontsize=5, color='white')
+            ax.set_xlabel('IDV mínimo (%)')
+            ax.set_ylabel('Num Anos Validos mínimo')
+            ax.set_title(f"{periodo}: estações (cobertura)")
+            fig.colorbar(imagem, ax=ax, label='estações')
+        fig.tight_layout()
+        fig.savefig(caminho, dpi=150)
+        plt.close(fig)
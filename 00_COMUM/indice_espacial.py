@@ -0,0 +1,194 @@
+"""
+Índice espacial das estações do inventário, para escolher as estações pelo
+domínio da interpolação em vez do nome do estado (nmEstado).
+
+As coordenadas são convertidas para pontos (x, y, z) na esfera de raio 1 e
+organizadas em uma KD-tree (scipy.spatial.cKDTree): distâncias na esfera
+viram distâncias em linha reta (cordas), sem distorção perto dos polos ou da
+linha de data. Para caixas lat/lon há também a ordem das estações por
+latitude (busca binária na faixa de latitudes, filtro na longitude).
+
+O índice é gravado ao lado do inventário (inventario_BAHIA.xlsx ->
+inventario_BAHIA.espacial.pkl) e refeito sozinho quando o inventário muda.
+
+Consultas (dict, a mesma forma aceita pelo download):
+    {'caixa': (lon_min, lon_max, lat_min, lat_max)}
+    {'poligono': '../00_STUFF/BAHIA.shp', 'buffer_km': 50}
+    {'vizinhos': (lat, lon, k)}
+    {'raio': (lat, lon, km)}
+"""
+import os
+import pickle
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from tabelas import le_tabela, pasta_tabelas
+
+RAIO_TERRA_KM = 6371.0088
+CRS_METRICO = 5880      # SIRGAS 2000 / Brazil Polyconic, para o buffer em metros
+
+
+def arquivo_indice(inventario):
+    """ Arquivo do índice espacial do inventário (inventario_BAHIA.xlsx -> inventario_BAHIA.espacial.pkl). """
+    return os.path.splitext(str(inventario))[0] + '.espacial.pkl'
+
+
+def _xyz(latitude, longitude):
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _corda(km):
+    # distância em linha reta na esfera unitária correspondente a km ao longo da superfície
+    return 2.0 * np.sin(min(km / RAIO_TERRA_KM, np.pi) / 2.0)
+
+
+def _carimbo(caminho):
+    # muda sempre que o inventário (planilha ou pasta Parquet) é regravado
+    carimbo = []
+    for arquivo in (str(caminho), pasta_tabelas(caminho)):
+        if os.path.exists(arquivo):
+            estado = os.stat(arquivo)
+            carimbo.append((arquivo, estado.st_mtime_ns, estado.st_size))
+    return carimbo
+
+
+def _area(serie, buffer_km):
+    # Une as geometrias em uma área (linhas de contorno, como o BAHIA.shp, viram polígonos)
+    # e aplica o buffer em metros.
+    import shapely
+
+    if serie.crs is None:
+        serie = serie.set_crs(4326)
+    if buffer_km:
+        # o buffer é feito sobre a área já fechada, não sobre as linhas
+        serie = serie.__class__([_area(serie, 0)], crs=serie.crs)
+        serie = serie.to_crs(CRS_METRICO).buffer(buffer_km * 1000.0).to_crs(serie.crs)
+    area = serie.union_all()
+    if area.geom_type in ('LineString', 'MultiLineString'):
+        area = shapely.build_area(shapely.line_merge(area))
+    shapely.prepare(area)
+    return area
+
+
+@lru_cache(maxsize=16)
+def _area_arquivo(caminho, buffer_km):
+    # o shapefile é lido, fechado e preparado uma vez só para cada buffer
+    import geopandas as gpd
+    return _area(gpd.read_file(caminho).geometry, buffer_km)
+
+
+class IndiceEspacial:
+    """ codigos(list): código de cada estação
+        latitude, longitude(array): coordenadas em graus (estações sem coordenada ficam de fora)
+    """
+    def __init__(self, codigos, latitude, longitude) -> None:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        validas = np.isfinite(latitude) & np.isfinite(longitude)
+        self.codigos = np.array([str(c) for c in codigos], dtype=object)[validas]
+        self.latitude = latitude[validas]
+        self.longitude = longitude[validas]
+        self.arvore = cKDTree(_xyz(self.latitude, self.longitude))
+        self.ordem_lat = np.argsort(self.latitude, kind='stable')
+        self.lat_ordenada = self.latitude[self.ordem_lat]
+        self.carimbo = None
+
+    @classmethod
+    def do_inventario(cls, inventario, refaz=False):
+        """ Índice do inventário (planilha do 01_INVENTARIO), lido do arquivo gravado ao lado
+            dele ou construído (e gravado) se ainda não existe ou se o inventário mudou.
+        """
+        arquivo = arquivo_indice(inventario)
+        carimbo = _carimbo(inventario)
+        if not refaz and os.path.exists(arquivo):
+            with open(arquivo, 'rb') as entrada:
+                indice = pickle.load(entrada)
+            if isinstance(indice, cls) and indice.carimbo == carimbo:
+                return indice
+
+        tabela = le_tabela(inventario, colunas=['codigo', 'latitude', 'longitude'], tipos={'codigo': str})
+        indice = cls(tabela['codigo'].tolist(), tabela['latitude'], tabela['longitude'])
+        indice.carimbo = carimbo
+        temporario = arquivo + '.tmp'
+        with open(temporario, 'wb') as saida:
+            pickle.dump(indice, saida, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, arquivo)
+        return indice
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def _codigos(self, posicoes):
+        # códigos na ordem do inventário
+        return self.codigos[np.sort(np.asarray(posicoes, dtype=np.int64))].tolist()
+
+    def caixa(self, lon_min, lon_max, lat_min, lat_max):
+        """ Estações dentro da caixa (limites inclusivos, graus). """
+        i0 = np.searchsorted(self.lat_ordenada, lat_min, side='left')
+        i1 = np.searchsorted(self.lat_ordenada, lat_max, side='right')
+        faixa = self.ordem_lat[i0:i1]
+        longitude = self.longitude[faixa]
+        return self._codigos(faixa[(longitude >= lon_min) & (longitude <= lon_max)])
+
+    def poligono(self, geometria, buffer_km=0.0):
+        """ Estações dentro do polígono (ou a menos de buffer_km dele).
+            geometria: caminho de um shapefile/GeoJSON, GeoDataFrame/GeoSeries ou geometria shapely
+                (em graus, WGS84/SIRGAS)
+        """
+        import geopandas as gpd
+        import shapely
+
+        if isinstance(geometria, (str, os.PathLike)):
+            geometria = _area_arquivo(os.path.abspath(geometria), float(buffer_km))
+        elif isinstance(geometria, gpd.GeoDataFrame):
+            geometria = _area(geometria.geometry, buffer_km)
+        elif isinstance(geometria, gpd.GeoSeries):
+            geometria = _area(geometria, buffer_km)
+        else:
+            geometria = _area(gpd.GeoSeries([geometria]), buffer_km)
+
+        # candidatas pela caixa do polígono, teste exato só nelas
+        lon_min, lat_min, lon_max, lat_max = geometria.bounds
+        i0 = np.searchsorted(self.lat_ordenada, lat_min, side='left')
+        i1 = np.searchsorted(self.lat_ordenada, lat_max, side='right')
+        faixa = self.ordem_lat[i0:i1]
+        faixa = faixa[(self.longitude[faixa] >= lon_min) & (self.longitude[faixa] <= lon_max)]
+        # intersects: pontos exatamente na borda contam como dentro
+        dentro = shapely.intersects_xy(geometria, self.longitude[faixa], self.latitude[faixa])
+        return self._codigos(faixa[dentro])
+
+    def vizinhos(self, latitude, longitude, k=1):
+        """ As k estações mais próximas do ponto, da mais próxima para a mais distante.
+            Retorna (codigos, distancias_km).
+        """
+        k = min(int(k), len(self))
+        if k <= 0:
+            return [], np.array([])
+        corda, posicoes = self.arvore.query(_xyz([latitude], [longitude])[0], k=k)
+        corda, posicoes = np.atleast_1d(corda), np.atleast_1d(posicoes)
+        distancias = 2.0 * RAIO_TERRA_KM * np.arcsin(np.minimum(corda / 2.0, 1.0))
+        return self.codigos[posicoes].tolist(), distancias
+
+    def raio(self, latitude, longitude, km):
+        """ Estações a até km quilômetros (distância na superfície) do ponto. """
+        posicoes = self.arvore.query_ball_point(_xyz([latitude], [longitude])[0], _corda(km))
+        return self._codigos(posicoes)
+
+    def consulta(self, consulta):
+        """ Executa uma consulta no formato dict (ver o início do módulo) e devolve os códigos. """
+        consulta = dict(consulta)
+        if 'caixa' in consulta:
+            return self.caixa(*consulta['caixa'])
+        if 'poligono' in consulta:
+            return self.poligono(consulta['poligono'], consulta.get('buffer_km', 0.0))
+        if 'vizinhos' in consulta:
+            latitude, longitude, k = consulta['vizinhos']
+            codigos, _ = self.vizinhos(latitude, longitude, k)
+            return codigos
+        if 'raio' in consulta:
+            return self.raio(*consulta['raio'])
+        raise ValueError(f"Consulta espacial desconhecida: {consulta}")
@@ -0,0 +1,224 @@
+"""
+Estatísticas de períodos climatológicos (ex.: as normais 1981-2010 e 1991-2020) calculadas
+sobre a matriz estação-dia guardada pelo download (armazem_matriz), sem baixar as séries de novo.
+
+Para cada período o resultado tem as mesmas abas (ANUAL, ANUAIS e MENSAL) que o download
+gravaria com data_inicial/data_final iguais ao período:
+    - contagens, somas e somas dos quadrados (média, variância, desvio) vêm de somas acumuladas
+      no tempo, guardadas só nos inícios de mês e nos limites dos períodos (MomentosAcumulados):
+      cada período custa uma subtração por estação, mês e limiar;
+    - as estatísticas de ordem (mínimo, máximo, mediana, moda e percentis) precisam dos valores
+      do período ordenados: cada período ordena uma vez as colunas do bloco de estações (e as
+      linhas de cada mês, também como colunas densas), e os três limiares (válidos, non-zero e
+      LDU) saem da mesma ordenação (estatisticas.varredura_limiares);
+    - a aba ANUAIS dos anos inteiros dentro do período não depende do período: é calculada uma
+      vez para o armazenamento todo e só os anos incompletos nas pontas são recalculados.
+
+Diferenças para um download com as mesmas datas, porque a matriz só guarda os dados válidos:
+'Num Total de registros' conta os dias válidos, 'Data Inicial'/'Data Final' são o primeiro e o
+último dia válido no período e estações com menos de 2 dias válidos no período ficam de fora.
+Os períodos usam as datas exatas; o webservice da ANA devolve meses inteiros, então um período que
+não começa no dia 1 ou não termina no fim do mês difere do download pelos dias das pontas.
+Uso pela linha de comando: 02_DOWNLOAD_E_AVALIACAO/periodos_wb.py.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from matriz_estacoes import DECIMAIS
+from estatisticas import (ordena_colunas, varredura_limiares, estatisticas_agrupadas, junta_estatisticas,
+                          monta_anual, monta_mensal, monta_anos)
+
+# Colunas da aba ANUAL que identificam a estação (vêm do sumário completo)
+COLUNAS_IDENTIFICACAO = ["Codigo", "Num Total de registros", "Nome", "Latitude", "Longitude", "Altitude",
+                         "cidade", "UF", "Bacia", "Sub Bacia", "Rio", "orgao", "data Ultimo dado", "CONTAGEM"]
+LIMIAR_NZ = 0.1
+
+
+def le_periodo(texto):
+    """ '1981a2010' (anos inteiros) ou '01/03/1981a28/02/2011' (d/m/Y) -> (inicio, fim), inclusivos. """
+    inicio, fim = (parte.strip() for parte in str(texto).split('a'))
+    if inicio.isdigit() and fim.isdigit():
+        return pd.Timestamp(int(inicio), 1, 1), pd.Timestamp(int(fim), 12, 31)
+    return pd.to_datetime(inicio, dayfirst=True), pd.to_datetime(fim, dayfirst=True)
+
+
+def nome_periodo(inicio, fim):
+    """ Nome usado nos arquivos: '1981a2010' para anos inteiros, senão '19810301a20110228'. """
+    if (inicio.month, inicio.day, fim.month, fim.day) == (1, 1, 12, 31):
+        return f"{inicio.year}a{fim.year}"
+    return f"{inicio:%Y%m%d}a{fim:%Y%m%d}"
+
+
+def normais_deslizantes(ano_inicial, ano_final, anos=30, passo=10):
+    """ Períodos de `anos` anos inteiros começando em ano_inicial, ano_inicial + passo, ...
+        até o último que termina em ano_final (ex.: 1961a1990, 1971a2000, ..., 1991a2020).
+    """
+    return [(pd.Timestamp(ano, 1, 1), pd.Timestamp(ano + anos - 1, 12, 31))
+            for ano in range(ano_inicial, ano_final - anos + 2, passo)]
+
+
+def _acumula(momentos):
+    # (3, intervalos, ...) -> (3, intervalos + 1, ...) com zeros no início
+    zeros = np.zeros((momentos.shape[0], 1) + momentos.shape[2:])
+    return np.cumsum(np.concatenate([zeros, momentos], axis=1), axis=1)
+
+
+class MomentosAcumulados:
+    """ Contagem, soma e soma dos quadrados dos valores >= cada limiar, acumuladas no tempo por
+        estação e por estação e mês, só nos `cortes`.
+        matriz(ndarray float64): dias x estações, NaN onde não há dado
+        meses(ndarray int): mês (1 a 12) de cada linha
+        cortes(ndarray int): linhas onde começa cada intervalo, crescente, com 0 (inícios de mês e
+            limites dos períodos, para que cada intervalo fique dentro de um único mês)
+    """
+    def __init__(self, matriz, meses, cortes, limiares) -> None:
+        self.cortes = np.asarray(cortes, dtype=np.int64)
+        self.intervalos_mes = [np.flatnonzero(meses[self.cortes] == mes) for mes in range(1, 13)]
+        self.total, self.por_mes = {}, {}
+        for limiar in limiares:
+            acima = matriz >= limiar    # NaN fica de fora
+            valores = np.where(acima, matriz, 0.0)
+            momentos = np.stack([np.add.reduceat(acima.astype(np.float64), self.cortes, axis=0),
+                                 np.add.reduceat(valores, self.cortes, axis=0),
+                                 np.add.reduceat(valores * valores, self.cortes, axis=0)])
+            self.total[limiar] = _acumula(momentos)
+            self.por_mes[limiar] = [_acumula(momentos[:, intervalos]) for intervalos in self.intervalos_mes]
+
+    def periodo(self, i0, i1):
+        """ Momentos das linhas [i0, i1) (i0 e i1 precisam ser cortes ou o fim da matriz):
+            ({limiar: (3, estações)}, {limiar: (3, 12, estações)}) com contagem, soma e soma dos quadrados.
+        """
+        k0, k1 = np.searchsorted(self.cortes, [i0, i1])
+        total, mensal = {}, {}
+        for limiar, acumulado in self.total.items():
+            total[limiar] = acumulado[:, k1] - acumulado[:, k0]
+            meses = []
+            for intervalos, acumulado_mes in zip(self.intervalos_mes, self.por_mes[limiar]):
+                a, b = np.searchsorted(intervalos, [k0, k1])
+                meses.append(acumulado_mes[:, b] - acumulado_mes[:, a])
+            mensal[limiar] = np.stack(meses, axis=1)
+        return total, mensal
+
+
+def _ordem(parte, limiares, momentos):
+    # estatísticas de cada coluna para todos os limiares a partir de uma única ordenação
+    x, seg, inicio, n = ordena_colunas(parte)
+    return varredura_limiares(x, seg, inicio, n, limiares, moda=True, momentos=momentos)
+
+
+def _seleciona(est, selecao):
+    return {campo: valores[selecao] for campo, valores in est.items()}
+
+
+def tabelas_periodos(armazem, identificacao, periodos, limite_chuva=1.0, bloco=256):
+    """ Abas ANUAL, ANUAIS e MENSAL de cada período, lendo cada bloco de estações do armazenamento uma vez.
+        armazem(ArmazemMatriz): matriz estação-dia gravada pelo download
+        identificacao(DataFrame): a aba ANUAL do sumário completo (ou ao menos COLUNAS_IDENTIFICACAO);
+            estações do armazenamento sem identificação ficam de fora
+        periodos(list): (inicio, fim) de cada período, datas inclusivas
+        Retorna {(inicio, fim): {'ANUAL': df, 'ANUAIS': df, 'MENSAL': df}} (datas como pd.Timestamp), na
+        ordem das estações do armazenamento; períodos sem dados ficam de fora.
+    """
+    datas = armazem.datas
+    num_dias = len(datas)
+    linha_codigo = {str(codigo): i for i, codigo in enumerate(identificacao['Codigo'])}
+    codigos = [codigo for codigo in armazem.codigos if codigo in linha_codigo]
+    identificacao = identificacao[COLUNAS_IDENTIFICACAO].iloc[[linha_codigo[c] for c in codigos]].reset_index(drop=True)
+
+    meses = datas.month.to_numpy()
+    anos = datas.year.to_numpy()
+    limiares = (-np.inf, LIMIAR_NZ, limite_chuva)
+
+    # linhas [i0, i1) de cada período, limitadas ao armazenamento
+    linhas = []
+    for inicio, fim in periodos:
+        i0 = 0 if armazem.inicio is None else (pd.Timestamp(inicio) - armazem.inicio).days
+        i1 = 0 if armazem.inicio is None else (pd.Timestamp(fim) - armazem.inicio).days + 1
+        linhas.append((min(max(i0, 0), num_dias), min(max(i1, 0), num_dias)))
+    inicios_mes = np.flatnonzero(np.diff(meses, prepend=-1) != 0)
+    cortes = np.unique(np.concatenate([inicios_mes] + [[i0, i1] for i0, i1 in linhas]).astype(np.int64))
+    cortes = cortes[cortes < num_dias]
+    ano_inicial = int(anos.min()) if num_dias else 0
+
+    partes = [{'ANUAL': [], 'ANUAIS': [], 'MENSAL': []} for _ in periodos]
+    for j in range(0, len(codigos), bloco):
+        matriz = np.round(armazem.matriz(codigos[j:j + bloco]).astype(np.float64), DECIMAIS)
+        ident = identificacao.iloc[j:j + bloco].reset_index(drop=True)
+        momentos = MomentosAcumulados(matriz, meses, cortes, limiares)
+        # ANUAIS de todos os anos do armazenamento (os anos inteiros de cada período vêm daqui)
+        anuais = estatisticas_agrupadas(matriz, anos - ano_inicial, int(anos.max()) - ano_inicial + 1, limite_chuva) \
+            if num_dias else None
+
+        for k, (i0, i1) in enumerate(linhas):
+            if i1 <= i0:
+                continue
+            parte = matriz[i0:i1]
+            total, mensal = momentos.periodo(i0, i1)
+            selecionadas = np.flatnonzero(total[-np.inf][0] > 1)
+            if not len(selecionadas):
+                continue
+            parte = parte[:, selecionadas]
+
+            # Identificação e período de dados de cada estação no período
+            validos = ~np.isnan(parte)
+            primeiro = np.argmax(validos, axis=0)
+            ultimo = len(parte) - 1 - np.argmax(validos[::-1], axis=0)
+            metadados = ident.iloc[selecionadas].reset_index(drop=True)
+            metadados["Num Total de registros"] = validos.sum(axis=0)
+            metadados["Data Inicial"] = datas[i0 + primeiro]
+            metadados["Data Final"] = datas[i0 + ultimo]
+            metadados["Num de Dias"] = (ultimo - primeiro).astype(np.int64)
+            metadados["Num de Anos Total"] = [math.ceil(dias / 365.25) for dias in metadados["Num de Dias"]]
+
+            # ANUAL: uma ordenação por estação
+            est = _ordem(parte, limiares, {limiar: total[limiar][1:, selecionadas] for limiar in limiares})
+            partes[k]['ANUAL'].append(monta_anual(metadados, *(est[limiar] for limiar in limiares)))
+
+            # MENSAL: as linhas de cada mês ordenadas como colunas densas
+            grupos, ests = [], []
+            for mes in range(1, 13):
+                linhas_mes = np.flatnonzero(meses[i0:i1] == mes)
+                if not len(linhas_mes):
+                    continue
+                est = _ordem(parte[linhas_mes], limiares,
+                             {limiar: mensal[limiar][1:, mes - 1, selecionadas] for limiar in limiares})
+                com_dados = np.flatnonzero(est[-np.inf]['n'] > 0)
+                grupos.append(np.column_stack([com_dados, np.full(len(com_dados), mes)]))
+                ests.append({limiar: _seleciona(est[limiar], com_dados) for limiar in limiares})
+            if grupos:
+                grupos = np.concatenate(grupos)
+                ordem = np.lexsort((grupos[:, 1], grupos[:, 0]))
+                est = [_seleciona(junta_estatisticas([e[limiar] for e in ests]), ordem) for limiar in limiares]
+                partes[k]['MENSAL'].append(monta_mensal(metadados, grupos[ordem, 0], grupos[ordem, 1], *est))
+
+            # ANUAIS: anos inteiros do cálculo geral, anos incompletos das pontas recalculados
+            posicao = np.full(matriz.shape[1], -1)
+            posicao[selecionadas] = np.arange(len(selecionadas))
+            estacao, chave, *est = anuais
+            ano = chave + ano_inicial
+            # anos com todas as linhas do armazenamento dentro do período
+            anos_periodo = np.arange(anos[i0], anos[i1 - 1] + 1)
+            inteiros = anos_periodo[(np.searchsorted(anos, anos_periodo, 'left') >= i0)
+                                    & (np.searchsorted(anos, anos_periodo, 'right') <= i1)]
+            usa = np.isin(ano, inteiros) & (posicao[estacao] >= 0)
+            estacoes, ano_grupos, ests = [posicao[estacao[usa]]], [ano[usa]], [[_seleciona(e, usa) for e in est]]
+            for ano_ in np.setdiff1d(anos_periodo, inteiros):
+                linhas_ano = np.flatnonzero(anos[i0:i1] == ano_)
+                e_parcial, _, *est_parcial = estatisticas_agrupadas(
+                    parte[linhas_ano], np.zeros(len(linhas_ano), dtype=np.int64), 1, limite_chuva)
+                estacoes.append(e_parcial)
+                ano_grupos.append(np.full(len(e_parcial), ano_))
+                ests.append(est_parcial)
+            estacoes, ano_grupos = np.concatenate(estacoes), np.concatenate(ano_grupos)
+            ordem = np.lexsort((ano_grupos, estacoes))
+            est = [_seleciona(junta_estatisticas([e[i] for e in ests]), ordem) for i in range(3)]
+            partes[k]['ANUAIS'].append(monta_anos(metadados, estacoes[ordem], ano_grupos[ordem], *est))
+
+    resultado = {}
+    for (inicio, fim), abas in zip(periodos, partes):
+        if abas['ANUAL']:
+            resultado[pd.Timestamp(inicio), pd.Timestamp(fim)] = {
+                aba: pd.concat(tabelas, ignore_index=True) for aba, tabelas in abas.items()}
+    return resultado
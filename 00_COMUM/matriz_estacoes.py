@@ -0,0 +1,146 @@
+"""
+Matriz estação-dia com os dados de chuva de todas as estações.
+
+As séries são gravadas, à medida que chegam, em uma matriz densa float32
+(dias x estações) sobre um único índice diário global, com NaN nos dias sem
+dado. Isso substitui o pd.concat(axis=1) de milhares de séries com índices
+diferentes no final do download.
+
+Para redes muito esparsas (poucas estações com dados em cada dia) há o modo
+compacto, que guarda só os dias com dado de cada estação.
+"""
+import numpy as np
+import pandas as pd
+
+# float32 guarda ~7 dígitos significativos; a chuva da ANA tem 1 casa decimal.
+# Ao converter para float64 os valores são arredondados para recuperar o decimal original.
+DECIMAIS = 3
+
+
+def _dia(data):
+    # datas em texto seguem o formato do webservice da ANA (d/m/Y)
+    data = pd.to_datetime(data, dayfirst=True)
+    return int(np.datetime64(data, 'D').astype(np.int64))
+
+
+class MatrizEstacaoDia:
+    """ num_estacoes(int): número máximo de estações (colunas pré-alocadas)
+        data_inicio, data_fim: período conhecido de antemão (opcional, d/m/Y ou datetime); se não
+            for dado, o índice diário cresce conforme as séries chegam
+        compacta(bool): guarda só os dias com dado de cada estação (redes esparsas)
+    """
+    def __init__(self, num_estacoes, data_inicio=None, data_fim=None, compacta=False) -> None:
+        self.compacta = compacta
+        self.codigos = []
+        self.capacidade = max(int(num_estacoes), 1)
+        self.inicio = _dia(data_inicio) if data_inicio else None   # primeiro dia (dias desde 1970-01-01)
+        self.fim = _dia(data_fim) if data_fim else None            # último dia (inclusive)
+
+        if compacta:
+            self.colunas = []   # (dias, valores) de cada estação
+        else:
+            num_dias = self.fim - self.inicio + 1 if self.inicio is not None and self.fim is not None else 0
+            self.dados = np.full((num_dias, self.capacidade), np.nan, dtype=np.float32)
+            self.primeiro_alocado = self.inicio if num_dias else None
+
+    @property
+    def shape(self):
+        num_dias = 0 if self.inicio is None or self.fim is None else int(self.fim - self.inicio + 1)
+        return num_dias, len(self.codigos)
+
+    @property
+    def datas(self):
+        num_dias = self.shape[0]
+        if num_dias == 0:
+            return pd.DatetimeIndex([], name='date')
+        dias = np.arange(self.inicio, self.inicio + num_dias).astype('datetime64[D]')
+        return pd.DatetimeIndex(dias.astype('datetime64[ns]'), name='date')
+
+    def adiciona(self, codigo, serie):
+        """ Grava a série (pd.Series indexada por data) na próxima coluna. """
+        dias = serie.index.values.astype('datetime64[D]').astype(np.int64)
+        valores = serie.to_numpy(dtype=np.float32)
+        if len(dias):
+            primeiro, ultimo = int(dias.min()), int(dias.max())
+            self.inicio = primeiro if self.inicio is None else min(self.inicio, primeiro)
+            self.fim = ultimo if self.fim is None else max(self.fim, ultimo)
+
+        j = len(self.codigos)
+        self.codigos.append(str(codigo))
+        if self.compacta:
+            self.colunas.append((dias, valores))
+            return
+
+        if j >= self.capacidade:
+            self._realoca(self.capacidade * 2)
+        if len(dias):
+            self._garante_periodo()
+            self.dados[dias - self.primeiro_alocado, j] = valores
+
+    def _garante_periodo(self):
+        # Aumenta a matriz no tempo quando chega uma série fora do período alocado.
+        # A folga de metade do período atual evita realocar a cada nova estação.
+        if self.primeiro_alocado is None:
+            novo_inicio, novo_fim = self.inicio, self.fim
+        else:
+            alocado_fim = self.primeiro_alocado + self.dados.shape[0] - 1
+            if self.inicio >= self.primeiro_alocado and self.fim <= alocado_fim:
+                return
+            folga = self.dados.shape[0] // 2
+            novo_inicio = self.primeiro_alocado
+            if self.inicio < self.primeiro_alocado:
+                novo_inicio = min(self.inicio, self.primeiro_alocado - folga)
+            novo_fim = alocado_fim
+            if self.fim > alocado_fim:
+                novo_fim = max(self.fim, alocado_fim + folga)
+
+        novos = np.full((novo_fim - novo_inicio + 1, self.capacidade), np.nan, dtype=np.float32)
+        if self.primeiro_alocado is not None:
+            desloc = self.primeiro_alocado - novo_inicio
+            novos[desloc:desloc + self.dados.shape[0]] = self.dados
+        self.dados = novos
+        self.primeiro_alocado = novo_inicio
+
+    def _realoca(self, capacidade):
+        novos = np.full((self.dados.shape[0], capacidade), np.nan, dtype=np.float32)
+        novos[:, :self.capacidade] = self.dados
+        self.dados = novos
+        self.capacidade = capacidade
+
+    def bloco(self, colunas=slice(None)):
+        """ Colunas da matriz (todos os dias do índice global) em float32. """
+        num_dias, num_estacoes = self.shape
+        selecionadas = range(num_estacoes)[colunas]
+        if num_dias == 0:
+            return np.full((0, len(selecionadas)), np.nan, dtype=np.float32)
+        if not self.compacta:
+            desloc = self.inicio - self.primeiro_alocado
+            return self.dados[desloc:desloc + num_dias, :num_estacoes][:, colunas]
+
+        saida = np.full((num_dias, len(selecionadas)), np.nan, dtype=np.float32)
+        for i, j in enumerate(selecionadas):
+            dias, valores = self.colunas[j]
+            saida[dias - self.inicio, i] = valores
+        return saida
+
+    def __getitem__(self, chave):
+        """ matriz[linhas, colunas] em float64, com os valores arredondados (ver DECIMAIS). """
+        linhas, colunas = chave
+        return np.round(self.bloco(colunas)[linhas].astype(np.float64), DECIMAIS)
+
+    def para_dataframe(self):
+        """ DataFrame dias x estações (colunas = código), float64.
+            No modo compacto as colunas são esparsas (SparseDtype com NaN como valor padrão).
+        """
+        num_dias, num_estacoes = self.shape
+        if not self.compacta:
+            return pd.DataFrame(self[:, :], index=self.datas, columns=self.codigos)
+
+        colunas = []
+        for dias, valores in self.colunas:
+            densa = np.full(num_dias, np.nan)
+            densa[dias - self.inicio] = np.round(valores.astype(np.float64), DECIMAIS)
+            colunas.append(pd.Series(pd.arrays.SparseArray(densa, fill_value=np.nan), index=self.datas))
+        if not colunas:
+            return pd.DataFrame(index=self.datas, columns=self.codigos, dtype=np.float64)
+        return pd.concat(colunas, axis=1, keys=self.codigos)
@@ -0,0 +1,67 @@
+"""
+Pré-filtro das estações pelo inventário (HidroInventario), antes de qualquer
+pedido de série.
+
+A filtragem (04_FILTRAGEM) só aproveita estações com um número mínimo de
+anos válidos. Como os anos válidos nunca passam do período de operação da
+estação (PeriodoPluviometroInicio a PeriodoPluviometroFim), estações que
+operaram menos do que isso podem ser descartadas já no inventário, assim
+como as de outro tipo (TipoEstacao).
+"""
+import math
+
+import pandas as pd
+
+
+def _data(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)) or str(valor).strip() in ('', 'nan', 'NaT'):
+        return None
+    data = pd.to_datetime(valor, errors='coerce', dayfirst=isinstance(valor, str) and '/' in valor)
+    return None if pd.isna(data) else data
+
+
+def _texto(valor):
+    # códigos lidos do Excel podem vir como float (2.0)
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+class PrefiltroInventario:
+    """ Predicado aplicado a cada linha do inventário: devolve None se a estação deve
+        ser baixada ou o motivo (str) para ignorá-la.
+        tipos(list): valores aceitos de 'tipo' (TipoEstacao; 2 = pluviométrica). None aceita todos
+        min_anos(int): anos mínimos de operação, contados como 'Num de Anos Total' no download
+            (ceil(dias / 365.25)), dentro do período pedido. None não verifica
+        data_i, data_f(str): período do download (d/m/Y); vazio = sem limite
+        Estações sem o período de operação no inventário não são descartadas por ele.
+    """
+    def __init__(self, tipos=None, min_anos=None, data_i='', data_f='') -> None:
+        self.tipos = None if tipos is None else {_texto(tipo) for tipo in tipos}
+        self.min_anos = min_anos
+        self.data_i = _data(data_i)
+        self.data_f = _data(data_f)
+
+    def periodo(self, linha):
+        """ Período de operação da estação limitado ao período pedido, ou None. """
+        inicio = _data(linha.get('PeriodoPluviometroInicio'))
+        if inicio is None:
+            return None
+        fim = _data(linha.get('PeriodoPluviometroFim')) or pd.Timestamp.now().normalize()
+        if self.data_i is not None:
+            inicio = max(inicio, self.data_i)
+        if self.data_f is not None:
+            fim = min(fim, self.data_f)
+        return inicio, fim
+
+    def __call__(self, linha):
+        if self.tipos is not None and _texto(linha.get('tipo')) not in self.tipos:
+            return f"tipo {linha.get('tipo')}"
+        if self.min_anos:
+            periodo = self.periodo(linha)
+            if periodo is not None:
+                inicio, fim = periodo
+                anos = math.ceil(max((fim - inicio).days, 0) / 365.25)
+                if anos < self.min_anos:
+                    return f"{anos} anos de operação"
+        return None
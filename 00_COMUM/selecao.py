@@ -0,0 +1,132 @@
+"""
+Seleção das estações de um sumário (04_FILTRAGEM): um filtro declarativo aplicado à aba ANUAL
+escolhe as estações e todas as abas (ANUAL, ANUAIS, MENSAL e MENSAL_<m>) ficam só com elas.
+
+Cada sumário é lido uma vez, só com as colunas pedidas: ANUAL, ANUAIS e MENSAL. As abas
+MENSAL_<m> são a MENSAL separada por mês (como o download as grava) e saem da MENSAL já filtrada,
+sem ler as 12 abas. As estações selecionadas viram um índice (hash) e cada aba é filtrada por uma
+única consulta dos seus códigos nesse índice. Sumários antigos, sem a aba MENSAL, têm as abas
+MENSAL_<m> lidas e filtradas uma a uma.
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+
+from tabelas import lista_abas, le_tabela, colunas_tabela, usa_parquet, grava_tabelas, exporta_excel
+
+OPERADORES = {
+    '>=': operator.ge, '>': operator.gt, '<=': operator.le, '<': operator.lt, '==': operator.eq, '!=': operator.ne,
+    'em': lambda serie, valores: serie.isin(valores),
+    'fora': lambda serie, valores: ~serie.isin(valores),
+}
+
+
+class FiltroEstacoes:
+    """ Condições sobre as colunas da aba ANUAL, combinadas com 'e'.
+        condicoes(list): (coluna, operador, valor); operadores: >=, >, <=, <, ==, != e
+            'em'/'fora' (valor: lista, ex.: ('UF', 'em', ['BA', 'SE']))
+        Ex.: FiltroEstacoes([('Num Anos Validos', '>=', 24), ('IDV', '>=', 80)])
+    """
+    def __init__(self, condicoes) -> None:
+        self.condicoes = [tuple(condicao) for condicao in condicoes]
+        for coluna, operador, valor in self.condicoes:
+            if operador not in OPERADORES:
+                raise ValueError(f"Operador desconhecido em {coluna!r}: {operador!r} (use {', '.join(OPERADORES)})")
+
+    @property
+    def colunas(self):
+        return list(dict.fromkeys(coluna for coluna, _, _ in self.condicoes))
+
+    def mascara(self, anual):
+        """ Linhas da aba ANUAL que passam em todas as condições (array bool). """
+        faltando = [coluna for coluna in self.colunas if coluna not in anual.columns]
+        if faltando:
+            raise KeyError(f"Colunas do filtro fora da aba ANUAL: {faltando}")
+        aceita = np.ones(len(anual), dtype=bool)
+        for coluna, operador, valor in self.condicoes:
+            aceita &= OPERADORES[operador](anual[coluna], valor).to_numpy(dtype=bool)
+        return aceita
+
+    def __str__(self):
+        return ' e '.join(f"{coluna} {operador} {valor}" for coluna, operador, valor in self.condicoes)
+
+
+def _mes(aba):
+    # MENSAL_3 -> 3; None se não for uma aba mensal numerada
+    prefixo, _, sufixo = aba.partition('_')
+    return int(sufixo) if prefixo == 'MENSAL' and sufixo.isdigit() else None
+
+
+def _projecao(disponiveis, colunas, obrigatorias):
+    if colunas is None:
+        return None
+    return [coluna for coluna in disponiveis if coluna in set(colunas) | set(obrigatorias)]
+
+
+def _abas_lidas(abas):
+    return [aba for aba in abas if aba in ('ANUAL', 'ANUAIS', 'MENSAL') or (_mes(aba) is not None and 'MENSAL' not in abas)]
+
+
+def le_sumario(caminho, colunas=None, extras=()):
+    """ Abas ANUAL, ANUAIS e MENSAL do sumário (cada uma lida uma vez) e a lista de todas as abas.
+        colunas(list): lê só estas colunas (mais 'Codigo', 'mes' e `extras`); None = todas
+        Sumários sem a aba MENSAL trazem as abas MENSAL_<m> lidas uma a uma.
+    """
+    obrigatorias = ['Codigo', 'mes', *extras]
+    if usa_parquet(caminho):
+        abas = lista_abas(caminho)
+        tabelas = {aba: le_tabela(caminho, aba, _projecao(colunas_tabela(caminho, aba), colunas, obrigatorias))
+                   for aba in _abas_lidas(abas)}
+        return tabelas, abas
+
+    # só a planilha: uma única leitura do arquivo para todas as abas
+    with pd.ExcelFile(caminho) as planilha:
+        abas = planilha.sheet_names
+        tabelas = planilha.parse(_abas_lidas(abas))
+    if colunas is not None:
+        tabelas = {aba: df[_projecao(df.columns, colunas, obrigatorias)] for aba, df in tabelas.items()}
+    return tabelas, abas
+
+
+def seleciona_sumario(caminho, filtro, colunas=None):
+    """ Abas do sumário só com as estações que passam no filtro, na ordem das abas do sumário.
+        filtro(FiltroEstacoes): condições sobre a aba ANUAL
+        colunas(list): colunas mantidas em todas as abas (mais 'Codigo' e 'mes'); None = todas
+    """
+    tabelas, abas = le_sumario(caminho, colunas, extras=filtro.colunas)
+    anual = tabelas['ANUAL']
+    selecionadas = pd.Index(pd.unique(anual.loc[filtro.mascara(anual), 'Codigo']))
+
+    def filtra(tabela):
+        return tabela[selecionadas.get_indexer(tabela['Codigo']) >= 0]
+
+    selecao = {}
+    mensal = filtra(tabelas['MENSAL']) if 'MENSAL' in tabelas else None
+    meses = dict(tuple(mensal.groupby('mes', sort=False))) if mensal is not None and 'mes' in mensal else {}
+    for aba in abas:
+        if aba in tabelas:
+            selecao[aba] = mensal if aba == 'MENSAL' else filtra(tabelas[aba])
+        elif _mes(aba) is not None and mensal is not None:
+            selecao[aba] = meses.get(_mes(aba), mensal.iloc[:0])
+    # as colunas só usadas pelo filtro não vão para a seleção
+    if colunas is not None:
+        descarta = [coluna for coluna in filtro.colunas if coluna not in set(colunas) | {'Codigo', 'mes'}]
+        selecao = {aba: tabela.drop(columns=[c for c in descarta if c in tabela.columns])
+                   for aba, tabela in selecao.items()}
+    return selecao
+
+
+def grava_selecoes(periodos, filtro, colunas=None, excel=True):
+    """ Seleciona e grava cada sumário de `periodos` ({sumário: seleção .xlsx}) com o mesmo filtro:
+        Parquet para as etapas seguintes e, com excel=True, a planilha entregável.
+        Retorna {seleção: número de estações}.
+    """
+    resultado = {}
+    for sumario, saida in periodos.items():
+        selecao = seleciona_sumario(sumario, filtro, colunas)
+        grava_tabelas(saida, selecao, {'origem': str(sumario), 'filtro': filtro.condicoes})
+        if excel:
+            exporta_excel(saida, selecao)
+        resultado[saida] = len(selecao['ANUAL'])
+    return resultado
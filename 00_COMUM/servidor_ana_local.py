@@ -0,0 +1,306 @@
+"""
+Servidor HTTP local que imita o webservice da ANA (HidroInventario e
+HidroSerieHistorica), para medir o download sem depender do servidor real.
+
+As respostas seguem o formato XML da ANA (DataTable / diffgram /
+DocumentElement). Os dados são sintéticos, gerados de forma determinística a
+partir do código da estação (a mesma estação devolve sempre a mesma série),
+ou lidos de respostas gravadas (pasta de fixtures):
+
+    fixtures/
+        inventario.xml        (resposta do HidroInventario)
+        <codigo>.xml          (resposta do HidroSerieHistorica da estação)
+
+Latência, variação da latência, taxa de erro (HTTP 503) e tamanho das séries
+são configuráveis. GET /estatisticas devolve (em JSON) o número de requisições,
+erros e bytes enviados desde o início ou o último GET /estatisticas?zera=1.
+
+Uso:
+    python servidor_ana_local.py --porta 8765 --estacoes 500 --anos 60 --latencia 0.2 --variacao 0.1 --taxa-erro 0.02
+
+URL a configurar no lugar de cliente_ana.URL_ANA: http://127.0.0.1:8765/ServiceANA.asmx/
+"""
+import argparse
+import calendar
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+CODIGO_INICIAL = 1000000
+
+_CABECALHO = ('<?xml version="1.0" encoding="utf-8"?>'
+              '<DataTable xmlns="http://MRCS/">'
+              '<xs:schema id="NewDataSet" xmlns="" xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+              'xmlns:msdata="urn:schemas-microsoft-com:xml-msdata">'
+              '<xs:element name="NewDataSet" msdata:IsDataSet="true" /></xs:schema>'
+              '<diffgr:diffgram xmlns:msdata="urn:schemas-microsoft-com:xml-msdata" '
+              'xmlns:diffgr="urn:schemas-microsoft-com:xml-diffgram-v1">'
+              '<DocumentElement xmlns="">')
+_RODAPE = '</DocumentElement></diffgr:diffgram></DataTable>'
+
+
+def _data(texto):
+    # d/m/Y (parâmetros do webservice) -> (ano, mês, dia); None se vazio
+    if not texto:
+        return None
+    dia, mes, ano = (int(parte) for parte in texto.split('/'))
+    return ano, mes, dia
+
+
+class DadosSinteticos:
+    """ Gera o inventário e as séries de chuva.
+        num_estacoes(int): estações do inventário (códigos CODIGO_INICIAL, CODIGO_INICIAL+1, ...)
+        anos(int): anos de dados de cada estação (define o tamanho das respostas), terminando em ano_final
+        ano_final(int): último ano das séries
+        falhas(float): fração de dias sem leitura
+        sem_dados(float): fração de estações sem série (resposta sem registros)
+        semente(int): muda todas as séries geradas
+    """
+    def __init__(self, num_estacoes=100, anos=60, ano_final=2020, falhas=0.03, sem_dados=0.05, semente=0) -> None:
+        self.num_estacoes = num_estacoes
+        self.anos = anos
+        self.ano_final = ano_final
+        self.falhas = falhas
+        self.sem_dados = sem_dados
+        self.semente = semente
+        self.codigos = [str(CODIGO_INICIAL + i) for i in range(num_estacoes)]
+
+    def _aleatorio(self, codigo):
+        return random.Random(f"{self.semente}-{codigo}")
+
+    def inventario(self, estado=''):
+        partes = [_CABECALHO]
+        for i, codigo in enumerate(self.codigos):
+            rnd = self._aleatorio(codigo)
+            inicio = self.ano_final - self.anos + 1 + rnd.randrange(0, max(self.anos // 4, 1))
+            fim = f"{self.ano_final}-12-01 00:00:00" if rnd.random() < 0.7 else f"{inicio + self.anos // 2}-12-01 00:00:00"
+            alteracao = f"{self.ano_final + 1}-{1 + i % 12:02d}-01 00:00:00"
+            partes.append(
+                f'<Table diffgr:id="Table{i + 1}" msdata:rowOrder="{i}">'
+                f'<Codigo>{codigo}</Codigo><Nome>ESTACAO {i}</Nome><TipoEstacao>2</TipoEstacao>'
+                f'<Latitude>{rnd.uniform(-18.3, -8.6):.4f}</Latitude><Longitude>{rnd.uniform(-46.5, -37.4):.4f}</Longitude>'
+                f'<Altitude>{rnd.randrange(0, 1500) if rnd.random() < 0.8 else ""}</Altitude>'
+                f'<nmEstado>{estado or "BAHIA"}</nmEstado><nmMunicipio>MUNICIPIO {i % 417}</nmMunicipio>'
+                f'<BaciaCodigo>5</BaciaCodigo><SubBaciaCodigo>5{i % 10}</SubBaciaCodigo><RioCodigo />'
+                f'<ResponsavelSigla>{"ANA" if i % 3 else "INMET"}</ResponsavelSigla>'
+                f'<UltimaAtualizacao>{alteracao}</UltimaAtualizacao><DataIns>2000-01-01 00:00:00</DataIns>'
+                f'<DataAlt>{alteracao}</DataAlt>'
+                f'<PeriodoPluviometroInicio>{inicio}-01-01 00:00:00</PeriodoPluviometroInicio>'
+                f'<PeriodoPluviometroFim>{fim}</PeriodoPluviometroFim>'
+                f'</Table>')
+        partes.append(_RODAPE)
+        return ''.join(partes).encode('utf-8')
+
+    def serie_historica(self, codigo, data_inicio=None, data_fim=None, consistencia='1'):
+        rnd = self._aleatorio(codigo)
+        if codigo not in self.codigos or rnd.random() < self.sem_dados:
+            return (_CABECALHO + '<Error>Nenhum dado encontrado</Error>' + _RODAPE).encode('utf-8')
+
+        primeiro = self.ano_final - self.anos + 1 + rnd.randrange(0, max(self.anos // 4, 1))
+        partes = [_CABECALHO]
+        i = 0
+        # a ANA devolve os meses do mais recente para o mais antigo
+        for ano in range(self.ano_final, primeiro - 1, -1):
+            for mes in range(12, 0, -1):
+                ultimo_dia = calendar.monthrange(ano, mes)[1]
+                # o mês é sorteado mesmo fora do período pedido, para que os dados de um mês não
+                # dependam de data_inicio/data_fim (como na ANA)
+                falta_mes = rnd.random() < 0.02     # meses inteiros faltando
+                if falta_mes:
+                    continue
+                dias = [None if dia > ultimo_dia or rnd.random() < self.falhas
+                        else 0.0 if rnd.random() < 0.6 else round(rnd.expovariate(0.1), 1)
+                        for dia in range(1, 32)]
+                if data_inicio and (ano, mes, ultimo_dia) < data_inicio:
+                    continue
+                if data_fim and (ano, mes, 1) > data_fim:
+                    continue
+                partes.append(
+                    f'<SerieHistorica diffgr:id="SerieHistorica{i + 1}" msdata:rowOrder="{i}">'
+                    f'<EstacaoCodigo>{codigo}</EstacaoCodigo><NivelConsistencia>{consistencia or 1}</NivelConsistencia>'
+                    f'<DataHora>{ano}-{mes:02d}-01 00:00:00</DataHora><TipoMedicaoChuvas>1</TipoMedicaoChuvas>')
+                chuvas = []
+                for dia, valor in enumerate(dias, start=1):
+                    if valor is None:
+                        partes.append(f'<Chuva{dia:02d} />')
+                        continue
+                    chuvas.append(valor)
+                    partes.append(f'<Chuva{dia:02d}>{valor}</Chuva{dia:02d}>')
+                partes.append(f'<Maxima>{max(chuvas, default=0.0)}</Maxima>'
+                              f'<Total>{round(sum(chuvas), 1)}</Total>'
+                              f'<NumDiasDeChuva>{sum(v > 0 for v in chuvas)}</NumDiasDeChuva>')
+                partes.extend(f'<Chuva{dia:02d}Status>{0 if dia > ultimo_dia else 1}</Chuva{dia:02d}Status>'
+                              for dia in range(1, 32))
+                partes.append('</SerieHistorica>')
+                i += 1
+        partes.append(_RODAPE)
+        return ''.join(partes).encode('utf-8')
+
+
+class Fixtures:
+    """ Respostas gravadas em uma pasta (ver o início do módulo); as estações sem arquivo
+        caem nos dados sintéticos.
+    """
+    def __init__(self, pasta, sinteticos) -> None:
+        self.pasta = pasta
+        self.sinteticos = sinteticos
+
+    def _le(self, nome):
+        caminho = os.path.join(self.pasta, nome)
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as arquivo:
+                return arquivo.read()
+        return None
+
+    def inventario(self, estado=''):
+        return self._le('inventario.xml') or self.sinteticos.inventario(estado)
+
+    def serie_historica(self, codigo, data_inicio=None, data_fim=None, consistencia='1'):
+        return self._le(f'{codigo}.xml') or self.sinteticos.serie_historica(codigo, data_inicio, data_fim, consistencia)
+
+
+class ServidorANALocal:
+    """ Servidor em uma thread de fundo.
+        dados: DadosSinteticos ou Fixtures
+        latencia(float): segundos de espera antes de cada resposta
+        variacao(float): desvio padrão (s) somado à latência (nunca abaixo de zero)
+        taxa_erro(float): fração das requisições respondidas com HTTP 503
+        gzip(bool): compacta as respostas quando o cliente aceita gzip
+        porta(int): 0 escolhe uma porta livre
+    """
+    def __init__(self, dados=None, latencia=0.0, variacao=0.0, taxa_erro=0.0, gzip=True, porta=0,
+                 semente=0, tamanho_cache=256) -> None:
+        self.dados = dados if dados is not None else DadosSinteticos(semente=semente)
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erro = taxa_erro
+        self.gzip = gzip
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.estatisticas = {'requisicoes': 0, 'erros': 0, 'bytes': 0}
+        # as respostas mais pedidas não são geradas de novo a cada requisição
+        self._resposta = lru_cache(maxsize=tamanho_cache)(self._gera)
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', porta), self._manipulador())
+        self.servidor.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.servidor.server_address[1]}/ServiceANA.asmx/'
+
+    def _gera(self, servico, chave):
+        if servico == 'HidroInventario':
+            return self.dados.inventario(chave[0])
+        codigo, inicio, fim, consistencia = chave
+        return self.dados.serie_historica(codigo, _data(inicio), _data(fim), consistencia)
+
+    def _conta(self, **valores):
+        with self.lock:
+            for nome, valor in valores.items():
+                self.estatisticas[nome] += valor
+
+    def _espera(self):
+        with self.lock:
+            espera = self.latencia + (self.aleatorio.gauss(0.0, self.variacao) if self.variacao else 0.0)
+            erro = self.aleatorio.random() < self.taxa_erro
+        if espera > 0:
+            time.sleep(espera)
+        return erro
+
+    def _manipulador(self):
+        servidor = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'       # keep-alive, como o servidor da ANA
+
+            def log_message(self, *args):
+                pass
+
+            def _envia(self, status, corpo, tipo='text/xml; charset=utf-8'):
+                cabecalhos = {'Content-Type': tipo}
+                if servidor.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    corpo = gzip.compress(corpo, compresslevel=1)
+                    cabecalhos['Content-Encoding'] = 'gzip'
+                self.send_response(status)
+                for nome, valor in cabecalhos.items():
+                    self.send_header(nome, valor)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+                return len(corpo)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parametros = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+                servico = url.path.rstrip('/').rsplit('/', 1)[-1]
+
+                if servico == 'estatisticas':
+                    with servidor.lock:
+                        corpo = json.dumps(servidor.estatisticas).encode('utf-8')
+                        if parametros.get('zera'):
+                            servidor.estatisticas = {nome: 0 for nome in servidor.estatisticas}
+                    self._envia(200, corpo, 'application/json')
+                    return
+                if servico not in ('HidroInventario', 'HidroSerieHistorica'):
+                    self._envia(404, b'Not Found', 'text/plain')
+                    return
+
+                if servidor._espera():
+                    enviados = self._envia(503, b'Service Unavailable', 'text/plain')
+                    servidor._conta(requisicoes=1, erros=1, bytes=enviados)
+                    return
+                if servico == 'HidroInventario':
+                    chave = (parametros.get('nmEstado', ''),)
+                else:
+                    chave = (parametros.get('codEstacao', ''), parametros.get('dataInicio', ''),
+                             parametros.get('dataFim', ''), parametros.get('nivelConsistencia', '1'))
+                enviados = self._envia(200, servidor._resposta(servico, chave))
+                servidor._conta(requisicoes=1, bytes=enviados)
+
+        return Manipulador
+
+    def inicia(self):
+        self.thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def para(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.inicia()
+
+    def __exit__(self, *args):
+        self.para()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor local que imita o webservice da ANA.")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta (padrão: 8765)")
+    parser.add_argument("--estacoes", type=int, default=100, help="Estações do inventário sintético")
+    parser.add_argument("--anos", type=int, default=60, help="Anos de dados por estação (tamanho das respostas)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência de cada resposta (s)")
+    parser.add_argument("--variacao", type=float, default=0.0, help="Desvio padrão da latência (s)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas HTTP 503")
+    parser.add_argument("--sem-gzip", action="store_true", help="Não compacta as respostas")
+    parser.add_argument("--fixtures", type=str, default=None, help="Pasta com respostas gravadas")
+    parser.add_argument("--semente", type=int, default=0, help="Semente dos dados e dos erros")
+    args = parser.parse_args()
+
+    dados = DadosSinteticos(args.estacoes, args.anos, semente=args.semente)
+    if args.fixtures:
+        dados = Fixtures(args.fixtures, dados)
+    servidor = ServidorANALocal(dados, args.latencia, args.variacao, args.taxa_erro, not args.sem_gzip,
+                                args.porta, args.semente)
+    print(f"Servidor ANA local em {servidor.url}", flush=True)
+    try:
+        servidor.servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.servidor.server_close()
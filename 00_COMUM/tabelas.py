@@ -0,0 +1,201 @@
+"""
+Tabelas intermediárias entre as etapas (sumário, seleção, classificação) em Parquet.
+
+Cada planilha vira uma pasta com o mesmo nome e extensão .parquet, com um
+arquivo por aba:
+
+    sumario_BAHIA.xlsx  ->  sumario_BAHIA.parquet/
+                                abas.json          (ordem das abas)
+                                ANUAL.parquet
+                                ANUAIS.parquet
+                                MENSAL.parquet
+                                MENSAL_1.parquet ...
+
+As colunas ficam tipadas (números, datas, texto) e a leitura pode pedir só
+algumas colunas. Os scripts continuam configurados com o caminho da planilha
+.xlsx: le_tabela lê o Parquet quando existe e, se não, a própria planilha.
+Se a planilha foi alterada depois do Parquet (regravada ou editada à mão), a
+planilha é que vale (usa_parquet); a planilha exportada junto com o Parquet
+fica registrada na pasta (marca_planilha) e não conta como alteração.
+O Excel fica só como entregável final (exporta_excel): todas as abas são
+escritas de uma vez, linha a linha, pelo xlsxwriter em modo de memória
+constante, sem reabrir a planilha para acrescentar abas.
+"""
+import datetime
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+ABAS = 'abas.json'
+METADADOS = 'metadados.json'
+
+
+def pasta_tabelas(caminho):
+    """ Pasta Parquet correspondente à planilha (sumario_BAHIA.xlsx -> sumario_BAHIA.parquet). """
+    base, extensao = os.path.splitext(str(caminho))
+    return (base if extensao.lower() in ('.xlsx', '.xls', '.parquet') else str(caminho)) + '.parquet'
+
+
+def usa_parquet(caminho):
+    """ True se as tabelas de `caminho` devem ser lidas da pasta Parquet: ela existe e a planilha não
+        foi alterada depois dela. Com a planilha mais nova, avisa e devolve False.
+    """
+    pasta = pasta_tabelas(caminho)
+    if not os.path.isdir(pasta):
+        return False
+    if os.path.exists(caminho) and os.path.getmtime(caminho) > os.path.getmtime(os.path.join(pasta, ABAS)):
+        warnings.warn(f"{caminho} é mais nova que {pasta}: lendo a planilha")
+        return False
+    return True
+
+
+def marca_planilha(caminho):
+    """ Registra na pasta Parquet que a planilha acabou de ser gravada a partir das mesmas tabelas,
+        para que usa_parquet continue lendo a pasta.
+    """
+    arquivo = os.path.join(pasta_tabelas(caminho), ABAS)
+    if os.path.exists(arquivo):
+        os.utime(arquivo)
+
+
+def _tipa(df):
+    # Colunas texto com tipos misturados (ex.: datas lidas como texto em algumas linhas)
+    # são convertidas para um único tipo, que o Parquet exige.
+    df = df.copy()
+    df.columns = [str(coluna) for coluna in df.columns]
+    for coluna in df.columns[df.dtypes.eq(object)]:
+        tipo = pd.api.types.infer_dtype(df[coluna], skipna=True)
+        if tipo in ('datetime', 'datetime64', 'date'):
+            df[coluna] = pd.to_datetime(df[coluna])
+        elif tipo in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+            df[coluna] = pd.to_numeric(df[coluna])
+        elif tipo not in ('string', 'empty'):
+            df[coluna] = df[coluna].where(df[coluna].isna(), df[coluna].astype(str))
+    return df
+
+
+def grava_tabelas(caminho, abas, metadados=None):
+    """ Grava as abas ({nome: DataFrame}) na pasta Parquet da planilha `caminho`,
+        substituindo o conteúdo anterior.
+        metadados(dict): informações extras sobre as tabelas (JSON), lidas por le_metadados
+    """
+    pasta = pasta_tabelas(caminho)
+    temporaria = pasta + '.tmp'
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+    for nome, df in abas.items():
+        _tipa(df).to_parquet(os.path.join(temporaria, f"{nome}.parquet"), index=False)
+    with open(os.path.join(temporaria, ABAS), 'w') as arquivo:
+        json.dump(list(abas), arquivo)
+    if metadados is not None:
+        with open(os.path.join(temporaria, METADADOS), 'w') as arquivo:
+            json.dump(metadados, arquivo)
+
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.replace(temporaria, pasta)
+
+
+def lista_abas(caminho):
+    """ Nomes das abas, na ordem em que foram gravadas. """
+    pasta = pasta_tabelas(caminho)
+    if usa_parquet(caminho):
+        with open(os.path.join(pasta, ABAS)) as arquivo:
+            return json.load(arquivo)
+    return pd.ExcelFile(caminho).sheet_names
+
+
+def le_metadados(caminho):
+    """ Metadados gravados com as tabelas ({} se não houver). """
+    arquivo = os.path.join(pasta_tabelas(caminho), METADADOS)
+    if not os.path.exists(arquivo):
+        return {}
+    with open(arquivo) as entrada:
+        return json.load(entrada)
+
+
+def colunas_tabela(caminho, aba):
+    """ Nomes das colunas de uma aba, sem ler os dados (esquema do Parquet ou cabeçalho da planilha). """
+    pasta = pasta_tabelas(caminho)
+    if usa_parquet(caminho):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(os.path.join(pasta, f"{aba}.parquet")).names)
+    return [str(coluna) for coluna in pd.read_excel(caminho, sheet_name=aba, nrows=0).columns]
+
+
+def le_tabela(caminho, aba=None, colunas=None, tipos=None):
+    """ Lê uma aba (a primeira, se aba=None) da pasta Parquet da planilha `caminho`;
+        se a pasta não existir, ou a planilha for mais nova (ver usa_parquet), lê da própria planilha.
+        colunas(list): lê só estas colunas
+        tipos(dict): tipo de algumas colunas nas duas origens, ex.: {'codigo': str} (da planilha,
+            o pandas leria códigos como números e perderia os zeros à esquerda)
+    """
+    pasta = pasta_tabelas(caminho)
+    if usa_parquet(caminho):
+        if aba is None:
+            aba = lista_abas(caminho)[0]
+        df = pd.read_parquet(os.path.join(pasta, f"{aba}.parquet"), columns=colunas)
+        return df if tipos is None else df.astype(tipos)
+    return pd.read_excel(caminho, sheet_name=0 if aba is None else aba, usecols=colunas, dtype=tipos)
+
+
+def _valores_coluna(serie):
+    # Valores da coluna prontos para o xlsxwriter, com None onde não há dado
+    # (células vazias não são escritas, como no pandas).
+    if pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.astype(object).where(serie.notna(), None).tolist(), 'escreve'
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        if np.isinf(valores).any():
+            # o pandas escreve infinito como texto
+            return [None if v != v else (v if abs(v) != np.inf else str(v)) for v in valores.tolist()], 'escreve'
+        return [None if v != v else v for v in valores.tolist()], 'numero'
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        datas = pd.DatetimeIndex(serie).tz_localize(None).to_pydatetime()
+        return [None if v is pd.NaT else v for v in datas], 'data'
+    valores = serie.astype(object)
+    return valores.where(valores.notna(), None).tolist(), 'escreve'
+
+
+def exporta_excel(caminho, abas, indice=(), bloco=10000):
+    """ Grava as abas ({nome: DataFrame}) na planilha entregável, de uma vez.
+        As linhas são escritas em ordem pelo xlsxwriter em modo constant_memory:
+        só a linha atual fica na memória, qualquer que seja o tamanho da planilha.
+        indice(iterável): abas em que o índice do DataFrame é escrito como primeira coluna
+        bloco(int): linhas convertidas por vez
+    """
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    cabecalho = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    formato_data = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+    for nome, df in abas.items():
+        if nome in indice:
+            df = df.reset_index()
+        worksheet = workbook.add_worksheet(str(nome))
+        for j, coluna in enumerate(df.columns):
+            worksheet.write_string(0, j, str(coluna), cabecalho)
+
+        def escreve_data(i, j, valor, worksheet=worksheet):
+            worksheet.write_datetime(i, j, valor, formato_data)
+
+        def escreve(i, j, valor, worksheet=worksheet):
+            if isinstance(valor, (datetime.datetime, datetime.date)):
+                worksheet.write_datetime(i, j, valor, formato_data)
+            else:
+                worksheet.write(i, j, valor)
+
+        funcoes = {'numero': worksheet.write_number, 'data': escreve_data, 'escreve': escreve}
+        for inicio in range(0, len(df), bloco):
+            parte = df.iloc[inicio:inicio + bloco]
+            colunas = [_valores_coluna(parte.iloc[:, j]) for j in range(parte.shape[1])]
+            escritas = [funcoes[tipo] for _, tipo in colunas]
+            for i, linha in enumerate(zip(*[valores for valores, _ in colunas]), start=inicio + 1):
+                for j, valor in enumerate(linha):
+                    if valor is not None:
+                        escritas[j](i, j, valor)
+    workbook.close()
+    marca_planilha(caminho)
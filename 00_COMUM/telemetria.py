@@ -0,0 +1,250 @@
+"""
+Telemetria do download: o que aconteceu em cada requisição e em cada estação,
+para dimensionar a concorrência e achar períodos lentos ou com limitação do
+servidor (respostas 429/503, novas tentativas).
+
+Registra:
+    - por requisição: latência, bytes recebidos (compactados e do XML), status,
+      novas tentativas (Retry do urllib3) e se veio do cache;
+    - por estação: status, tempo de leitura do XML (parse);
+    - por bloco de estações: tempo das estatísticas;
+    - progresso: estações/s (média da última janela) e tempo restante estimado (ETA).
+
+Saídas:
+    - log JSON-lines (um evento por linha, com o instante 't' em segundos desde o início);
+    - arquivo texto no formato do Prometheus (coletor "textfile" do node_exporter),
+      regravado a cada `intervalo` segundos e no final;
+    - resumo no final com p50/p95/p99 (resumo()).
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+# Limites dos histogramas do Prometheus (segundos)
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PREFIXO = 'wb_download'
+
+
+def cronometra(funcao, *args, **kwargs):
+    """ Executa funcao(*args, **kwargs) e devolve (resultado, segundos).
+        Função de módulo para poder rodar no pool de processos.
+    """
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+
+def percentis(valores, qs=(50, 95, 99)):
+    if not len(valores):
+        return {f"p{q}": None for q in qs}
+    return {f"p{q}": float(v) for q, v in zip(qs, np.percentile(np.asarray(valores, dtype=np.float64), qs))}
+
+
+class Telemetria:
+    """ total_estacoes(int): estações a processar (para o ETA)
+        arquivo_log(str): log JSON-lines; None = sem log
+        arquivo_prometheus(str): arquivo .prom; None = sem exportação
+        intervalo(float): segundos entre as linhas de progresso e as regravações do .prom
+        janela(float): segundos considerados na taxa de estações/s
+        imprime(bool): imprime o progresso a cada `intervalo`
+    """
+    def __init__(self, total_estacoes=0, arquivo_log=None, arquivo_prometheus=None, intervalo=10.0, janela=60.0,
+                 imprime=True) -> None:
+        self.total_estacoes = total_estacoes
+        self.arquivo_prometheus = arquivo_prometheus
+        self.intervalo = intervalo
+        self.janela = janela
+        self.imprime = imprime
+        self.lock = threading.Lock()
+        self.inicio = time.monotonic()
+        self.ultimo_progresso = self.inicio
+
+        self.latencias = []
+        self.leituras = []
+        self.estatisticas = []
+        self.tentativas = Counter()             # novas tentativas -> requisições
+        self.status_requisicoes = Counter()
+        self.status_estacoes = Counter()
+        self.bytes = 0
+        self.bytes_xml = 0
+        self.requisicoes_cache = 0
+        self.concluidas = deque()                # instantes das estações concluídas na janela
+        self.num_concluidas = 0
+
+        self.log = None
+        if arquivo_log:
+            pasta = os.path.dirname(os.path.abspath(arquivo_log))
+            os.makedirs(pasta, exist_ok=True)
+            self.log = open(arquivo_log, 'a', encoding='utf-8')
+            self._evento('inicio', total_estacoes=total_estacoes)
+
+    def _agora(self):
+        return time.monotonic() - self.inicio
+
+    def _evento(self, evento, **campos):
+        # chamado com o lock (ou antes de existir concorrência)
+        if self.log is not None:
+            registro = {'t': round(self._agora(), 4), 'evento': evento}
+            registro.update(campos)
+            self.log.write(json.dumps(registro, default=str) + '\n')
+
+    def requisicao(self, latencia, status, tamanho=0, tamanho_xml=0, tentativas=0, cache=False, codigo=None):
+        """ Uma requisição ao webservice (chamado pelo ClienteANA, em qualquer thread).
+            status: código HTTP ou 'erro' (exceção de rede depois das tentativas)
+        """
+        with self.lock:
+            self.status_requisicoes[str(status)] += 1
+            if cache:
+                self.requisicoes_cache += 1
+            else:
+                self.latencias.append(latencia)
+                self.tentativas[int(tentativas)] += 1
+                self.bytes += int(tamanho)
+            self.bytes_xml += int(tamanho_xml)
+            self._evento('requisicao', codigo=codigo, latencia=round(latencia, 4), status=status,
+                         bytes=int(tamanho), bytes_xml=int(tamanho_xml), tentativas=int(tentativas), cache=cache)
+
+    def estacao(self, codigo, status, leitura=None):
+        """ Estação concluída (chamado por quem escreve as saídas). leitura: segundos de parse do XML. """
+        with self.lock:
+            agora = time.monotonic()
+            self.status_estacoes[status] += 1
+            self.num_concluidas += 1
+            self.concluidas.append(agora)
+            while self.concluidas and agora - self.concluidas[0] > self.janela:
+                self.concluidas.popleft()
+            if leitura is not None:
+                self.leituras.append(leitura)
+            self._evento('estacao', codigo=codigo, status=status,
+                         leitura=None if leitura is None else round(leitura, 4))
+            progresso = agora - self.ultimo_progresso >= self.intervalo
+            if progresso:
+                self.ultimo_progresso = agora
+                taxa, eta = self.taxa()
+                self._evento('progresso', estacoes=self.num_concluidas, estacoes_s=round(taxa, 3),
+                             eta_s=None if eta is None else round(eta, 1))
+        if progresso:
+            if self.imprime:
+                print(self.linha_progresso())
+            self.grava_prometheus()
+
+    def bloco_estatisticas(self, num_estacoes, segundos):
+        """ Tempo das estatísticas (calcula_tabelas) de um bloco de estações. """
+        with self.lock:
+            self.estatisticas.append(segundos)
+            self._evento('estatisticas', estacoes=num_estacoes, segundos=round(segundos, 4))
+
+    def taxa(self):
+        """ (estações/s na janela, segundos restantes estimados ou None). """
+        agora = time.monotonic()
+        recentes = [t for t in self.concluidas if agora - t <= self.janela]
+        duracao = min(self.janela, agora - self.inicio)
+        taxa = len(recentes) / duracao if duracao > 0 else 0.0
+        restantes = max(self.total_estacoes - self.num_concluidas, 0)
+        return taxa, (restantes / taxa if taxa > 0 else None)
+
+    def linha_progresso(self):
+        taxa, eta = self.taxa()
+        eta_texto = '-' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))
+        return (f"Progresso: {self.num_concluidas} de {self.total_estacoes} estações, "
+                f"{taxa:.2f} estações/s, {self.bytes / 2**20:.1f} MB, ETA {eta_texto}")
+
+    def grava_prometheus(self):
+        """ Regrava o arquivo .prom (em arquivo temporário + rename, como pede o coletor textfile). """
+        if not self.arquivo_prometheus:
+            return
+        with self.lock:
+            linhas = self._metricas()
+        temporario = self.arquivo_prometheus + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('\n'.join(linhas) + '\n')
+        os.replace(temporario, self.arquivo_prometheus)
+
+    def _metricas(self):
+        taxa, eta = self.taxa()
+        linhas = []
+
+        def metrica(nome, tipo, ajuda, valores):
+            linhas.append(f"# HELP {PREFIXO}_{nome} {ajuda}")
+            linhas.append(f"# TYPE {PREFIXO}_{nome} {tipo}")
+            for rotulos, valor in valores:
+                linhas.append(f"{PREFIXO}_{nome}{rotulos} {valor}")
+
+        def histograma(nome, ajuda, amostras):
+            amostras = np.asarray(amostras, dtype=np.float64)
+            valores = [(f'{{le="{limite}"}}', int((amostras <= limite).sum())) for limite in BUCKETS]
+            valores.append(('{le="+Inf"}', len(amostras)))
+            linhas.append(f"# HELP {PREFIXO}_{nome} {ajuda}")
+            linhas.append(f"# TYPE {PREFIXO}_{nome} histogram")
+            for rotulos, valor in valores:
+                linhas.append(f"{PREFIXO}_{nome}_bucket{rotulos} {valor}")
+            linhas.append(f"{PREFIXO}_{nome}_sum {float(amostras.sum())}")
+            linhas.append(f"{PREFIXO}_{nome}_count {len(amostras)}")
+
+        metrica('requisicoes_total', 'counter', 'Requisições ao webservice por status HTTP',
+                [(f'{{status="{status}"}}', n) for status, n in sorted(self.status_requisicoes.items())])
+        metrica('requisicoes_cache_total', 'counter', 'Requisições atendidas pelo cache', [('', self.requisicoes_cache)])
+        metrica('novas_tentativas_total', 'counter', 'Novas tentativas de requisição (Retry)',
+                [('', sum(n * k for k, n in self.tentativas.items()))])
+        metrica('bytes_total', 'counter', 'Bytes recebidos (compactados)', [('', self.bytes)])
+        metrica('bytes_xml_total', 'counter', 'Bytes de XML recebidos (descompactados)', [('', self.bytes_xml)])
+        metrica('estacoes_total', 'counter', 'Estações concluídas por status',
+                [(f'{{status="{status}"}}', n) for status, n in sorted(self.status_estacoes.items())])
+        metrica('estacoes_restantes', 'gauge', 'Estações ainda não concluídas',
+                [('', max(self.total_estacoes - self.num_concluidas, 0))])
+        metrica('estacoes_por_segundo', 'gauge', 'Estações concluídas por segundo na janela recente', [('', taxa)])
+        metrica('eta_segundos', 'gauge', 'Tempo restante estimado', [('', 'NaN' if eta is None else eta)])
+        histograma('latencia_segundos', 'Latência das requisições (sem cache)', self.latencias)
+        histograma('leitura_segundos', 'Tempo de leitura do XML por estação', self.leituras)
+        histograma('estatisticas_segundos', 'Tempo das estatísticas por bloco de estações', self.estatisticas)
+        return linhas
+
+    def resumo(self):
+        """ Resumo da execução (dict), com p50/p95/p99 de latência, leitura e estatísticas. """
+        with self.lock:
+            duracao = self._agora()
+            return {
+                'duracao_s': round(duracao, 3),
+                'estacoes': self.num_concluidas,
+                'estacoes_por_status': dict(self.status_estacoes),
+                'estacoes_s': round(self.num_concluidas / duracao, 3) if duracao > 0 else None,
+                'requisicoes_por_status': dict(self.status_requisicoes),
+                'requisicoes_cache': self.requisicoes_cache,
+                'novas_tentativas': sum(n * k for k, n in self.tentativas.items()),
+                'requisicoes_com_nova_tentativa': sum(n for k, n in self.tentativas.items() if k > 0),
+                'mb': round(self.bytes / 2**20, 3),
+                'mb_s': round(self.bytes / 2**20 / duracao, 3) if duracao > 0 else None,
+                'latencia_s': percentis(self.latencias),
+                'leitura_s': percentis(self.leituras),
+                'estatisticas_s': percentis(self.estatisticas),
+            }
+
+    def encerra(self):
+        """ Grava o resumo no log e o .prom final; devolve o resumo. """
+        resumo = self.resumo()
+        with self.lock:
+            self._evento('resumo', **resumo)
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+        self.grava_prometheus()
+        return resumo
+
+    def imprime_resumo(self, resumo=None):
+        resumo = resumo or self.resumo()
+
+        def ms(valores):
+            return ' '.join(f"{q}={'-' if v is None else f'{1000 * v:.0f}ms'}" for q, v in valores.items())
+
+        print(f"Resumo do download: {resumo['estacoes']} estações em {resumo['duracao_s']:.1f} s "
+              f"({resumo['estacoes_s']} estações/s, {resumo['mb']} MB, {resumo['mb_s']} MB/s)")
+        print(f"  estações por status: {resumo['estacoes_por_status']}")
+        print(f"  requisições por status: {resumo['requisicoes_por_status']}, cache: {resumo['requisicoes_cache']}, "
+              f"novas tentativas: {resumo['novas_tentativas']} (em {resumo['requisicoes_com_nova_tentativa']} requisições)")
+        print(f"  latência: {ms(resumo['latencia_s'])}")
+        print(f"  leitura do XML: {ms(resumo['leitura_s'])}")
+        print(f"  estatísticas (por bloco): {ms(resumo['estatisticas_s'])}")
@@ -0,0 +1,136 @@
+"""
+Leitura das respostas XML do webservice da ANA.
+
+As respostas são lidas em fluxo (iterparse): só os campos usados são
+extraídos e cada registro é descartado assim que lido, sem montar a
+árvore XML inteira nem DataFrames intermediários.
+"""
+import io
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+
+def _nome(tag):
+    # remove o namespace ({http://MRCS/}Tag -> Tag)
+    return tag.rsplit('}', 1)[-1]
+
+
+def tem_registros(conteudo):
+    """ True se a resposta tem ao menos um registro: um mês da série (<SerieHistorica>) ou uma
+        estação do inventário (<Table>). Respostas 200 vazias ou com mensagem de erro dão False.
+    """
+    return any(marca in conteudo for marca in (b'<SerieHistorica ', b'<SerieHistorica>', b'<Table ', b'<Table>'))
+
+
+def le_serie_historica(conteudo, var='Chuva'):
+    """ Lê a resposta do HidroSerieHistorica.
+        conteudo(bytes): corpo da resposta
+        var(str): prefixo das colunas diárias (Chuva, Cota ou Vazao)
+        Retorna (codigo, datahora, valores) ou None se não houver registros:
+            codigo(str): EstacaoCodigo do primeiro registro
+            datahora(ndarray str): DataHora de cada registro mensal
+            valores(ndarray float): matriz (meses x 31) com var01..var31, NaN onde vazio
+    """
+    # Cada <SerieHistorica> é um mês: a contagem dá o tamanho exato da matriz
+    n_meses = conteudo.count(b'<SerieHistorica ') + conteudo.count(b'<SerieHistorica>')
+    if n_meses == 0:
+        return None
+
+    valores = np.full((n_meses, 31), np.nan)
+    datahora = np.empty(n_meses, dtype=object)
+    colunas = {f"{var}{dia:02d}": dia - 1 for dia in range(1, 32)}
+    codigo = None
+    documento = None
+    i = 0
+
+    for evento, elem in ET.iterparse(io.BytesIO(conteudo), events=('start', 'end')):
+        tag = _nome(elem.tag)
+        if evento == 'start':
+            if tag == 'DocumentElement':
+                documento = elem
+            continue
+        j = colunas.get(tag)
+        if j is not None:
+            if elem.text:
+                valores[i, j] = float(elem.text)
+        elif tag == 'DataHora':
+            datahora[i] = elem.text
+        elif tag == 'EstacaoCodigo' and codigo is None:
+            codigo = elem.text
+        elif tag == 'SerieHistorica':
+            i += 1
+            # descarta o registro já lido (e os anteriores) da árvore
+            if documento is not None:
+                documento.clear()
+            else:
+                elem.clear()
+
+    if i == 0:
+        return None
+    return codigo, datahora[:i], valores[:i]
+
+
+# Campos do HidroInventario (tag XML -> coluna do inventário)
+CAMPOS_INVENTARIO = {
+    "Codigo": "codigo",
+    "Nome": "nome",
+    "TipoEstacao": "tipo",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "Altitude": "altitude",
+    "nmEstado": "estado",
+    "nmMunicipio": "municipio",
+    "BaciaCodigo": "BaciaCodigo",
+    "SubBaciaCodigo": "SubBaciaCodigo",
+    "RioCodigo": "Rio",
+    "ResponsavelSigla": "responsavel",
+    "UltimaAtualizacao": "Ultima Atualizacao",
+    "DataIns": "data_ins",
+    "DataAlt": "data_alt",
+    "PeriodoPluviometroInicio": "PeriodoPluviometroInicio",
+    "PeriodoPluviometroFim": "PeriodoPluviometroFim",
+}
+COLUNAS_NUMERICAS = ("latitude", "longitude", "altitude")
+COLUNAS_CATEGORICAS = ("estado", "responsavel")
+
+
+def le_inventario(conteudo):
+    """ Lê a resposta do HidroInventario em um único DataFrame (uma linha por <Table>),
+        com as colunas de CAMPOS_INVENTARIO: coordenadas numéricas (NaN se vazias),
+        estado e responsável categóricos e os demais campos como texto (None se vazios).
+    """
+    colunas = {coluna: [] for coluna in CAMPOS_INVENTARIO.values()}
+    registro = None
+    documento = None
+
+    for evento, elem in ET.iterparse(io.BytesIO(conteudo), events=('start', 'end')):
+        tag = _nome(elem.tag)
+        if evento == 'start':
+            if tag == 'DocumentElement':
+                documento = elem
+            elif tag == 'Table':
+                registro = {}
+            continue
+        if registro is None:
+            continue
+        coluna = CAMPOS_INVENTARIO.get(tag)
+        if coluna is not None:
+            registro[coluna] = elem.text or None
+        elif tag == 'Table':
+            for coluna, valores in colunas.items():
+                valores.append(registro.get(coluna))
+            registro = None
+            # descarta a estação já lida (e as anteriores) da árvore
+            if documento is not None:
+                documento.clear()
+            else:
+                elem.clear()
+
+    inventario = pd.DataFrame(colunas)
+    for coluna in COLUNAS_NUMERICAS:
+        inventario[coluna] = pd.to_numeric(inventario[coluna], errors='coerce')
+    for coluna in COLUNAS_CATEGORICAS:
+        inventario[coluna] = inventario[coluna].astype('category')
+    return inventario
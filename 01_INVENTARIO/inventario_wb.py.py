@@ -1,12 +1,32 @@
 import argparse
-import numpy as np
+import sys
 import xml.etree.ElementTree as ET
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
 import pandas as pd
+from requests import RequestException
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from cliente_ana import ClienteANA, URL_ANA
+from cache_ana import CacheRespostas
+from xml_ana import le_inventario, COLUNAS_CATEGORICAS
+from tabelas import grava_tabelas, marca_planilha, pasta_tabelas
+from indice_espacial import IndiceEspacial, arquivo_indice
+
+# UFs como aparecem em nmEstado no HidroInventario ("ALL" pede todas)
+UFS = [
+    "ACRE", "ALAGOAS", "AMAPÁ", "AMAZONAS", "BAHIA", "CEARÁ", "DISTRITO FEDERAL",
+    "ESPÍRITO SANTO", "GOIÁS", "MARANHÃO", "MATO GROSSO", "MATO GROSSO DO SUL",
+    "MINAS GERAIS", "PARÁ", "PARAÍBA", "PARANÁ", "PERNAMBUCO", "PIAUÍ", "RIO DE JANEIRO",
+    "RIO GRANDE DO NORTE", "RIO GRANDE DO SUL", "RONDÔNIA", "RORAIMA", "SANTA CATARINA",
+    "SÃO PAULO", "SERGIPE", "TOCANTINS",
+]
 
 class ServiceANA:
-    def __init__(self):
-        self.url = 'http://telemetriaws1.ana.gov.br/ServiceANA.asmx/'
+    def __init__(self, cliente=None):
+        self.url = URL_ANA
+        self.cliente = cliente if cliente is not None else ClienteANA()
 
     def inventario(self, estado=''):
         url = self.url + (
@@ -16,37 +36,47 @@ class ServiceANA:
             f'&sgResp=&sgOper=&telemetrica='
         )
 
-        resposta = requests.get(url)
-        tree = ET.ElementTree(ET.fromstring(resposta.content))
-        root = tree.getroot()
+        status, conteudo = self.cliente.conteudo(url)
+        if status != 200:
+            raise RequestException(f"HTTP {status} ao pedir o inventário de {estado}")
+        inventario = le_inventario(conteudo)
+        if inventario.empty:
+            return pd.DataFrame()
+        return inventario.set_index("codigo")
 
-        estacoes = []
-        for estacao in root.iter("Table"):
-            dados = {
-                "codigo": [estacao.find("Codigo").text],
-                "nome": [estacao.find("Nome").text],				
-                "tipo": [estacao.find("TipoEstacao").text],
-                "latitude": [float(estacao.find("Latitude").text)],
-                "longitude": [float(estacao.find("Longitude").text)],
-                "altitude": [float(estacao.find("Altitude").text) if estacao.find("Altitude").text else np.nan],
-                "estado": [estacao.find("nmEstado").text],
-                "municipio": [estacao.find("nmMunicipio").text],
-                "BaciaCodigo": [estacao.find("BaciaCodigo").text], 
-                "SubBaciaCodigo": [estacao.find("SubBaciaCodigo").text], 
-                "Rio": [estacao.find("RioCodigo").text], 				
-                "responsavel": [estacao.find("ResponsavelSigla").text],
-                "Ultima Atualizacao": [estacao.find("UltimaAtualizacao").text],
-                "data_ins": [estacao.find("DataIns").text],
-                "data_alt": [estacao.find("DataAlt").text]
-            }
-            df = pd.DataFrame.from_dict(dados)
-            df.set_index("codigo", inplace=True)
-            estacoes.append(df)
+    def inventario_ufs(self, ufs, num_workers=8):
+        """ Inventário de várias UFs, pedidas em paralelo.
+            Retorna (partes, falhas): partes = {uf: DataFrame} na ordem de ufs (UFs sem estações
+            ficam de fora) e falhas = {uf: mensagem} das UFs cujo pedido falhou.
+        """
+        partes, falhas = {}, {}
+        with ThreadPoolExecutor(max_workers=max(min(num_workers, len(ufs)), 1)) as executor:
+            futuros = {uf: executor.submit(self.inventario, uf) for uf in ufs}
+            for uf, futuro in futuros.items():
+                try:
+                    parte = futuro.result()
+                except (RequestException, ET.ParseError) as erro:
+                    falhas[uf] = str(erro)
+                    continue
+                if not parte.empty:
+                    partes[uf] = parte
+        return partes, falhas
 
-        if estacoes:
-            return pd.concat(estacoes)
-        else:
-            return pd.DataFrame()
+    @staticmethod
+    def combina(partes):
+        """ Junta os inventários das UFs em um só, com a coluna 'uf' (partição de origem).
+            Estações que aparecem em mais de uma UF ficam uma vez só, com o registro
+            alterado mais recentemente (data_alt); no empate, o da primeira UF.
+        """
+        combinado = pd.concat([parte.assign(uf=uf) for uf, parte in partes.items()])
+        combinado["_posicao"] = np.arange(len(combinado))
+        combinado["_alteracao"] = pd.to_datetime(combinado["data_alt"], errors="coerce")
+        combinado = combinado.sort_values(["_alteracao", "_posicao"], ascending=[False, True], na_position="last")
+        combinado = combinado[~combinado.index.duplicated()].sort_values("_posicao")
+        combinado = combinado.drop(columns=["_posicao", "_alteracao"])
+        for coluna in COLUNAS_CATEGORICAS + ("uf",):
+            combinado[coluna] = combinado[coluna].astype("category")
+        return combinado
 
     def salvar_xlsx(self, inventario, filename):
         if not inventario.empty:
@@ -58,12 +88,45 @@ class ServiceANA:
 # Argumentos
 parser = argparse.ArgumentParser(description="Gerador de inventário de estações ANA por UF.")
 parser.add_argument("-s", "--saida", type=str, required=True, help="Nome do arquivo Excel de saída")
-parser.add_argument("-u", "--uf", type=str, required=True, help="Nome da Unidade da Federação (ex: RIO DE JANEIRO)")
+parser.add_argument("-u", "--uf", type=str, required=True,
+                    help="Nome da Unidade da Federação (ex: RIO DE JANEIRO), lista separada por vírgulas "
+                         "(ex: BAHIA,SERGIPE,ALAGOAS) ou ALL para todas")
+parser.add_argument("-w", "--workers", type=int, default=8, help="UFs pedidas em paralelo (padrão: 8)")
+parser.add_argument("-c", "--cache", type=str, default=None, help="Pasta do cache das respostas da ANA (opcional)")
+parser.add_argument("--validade-cache", type=float, default=1.0, help="Dias até uma resposta do cache vencer (padrão: 1)")
 args = parser.parse_args()
 
+if args.uf.strip().upper() == "ALL":
+    ufs = list(UFS)
+else:
+    ufs = list(dict.fromkeys(uf.strip() for uf in args.uf.split(",") if uf.strip()))
+
 # Execução
-service = ServiceANA()
-print(f"Gerando inventário para o estado: {args.uf}")
-inventario = service.inventario(args.uf)
-service.salvar_xlsx(inventario, args.saida)
-print(f"Arquivo gerado: {args.saida}")
+cache = CacheRespostas(args.cache, args.validade_cache * 86400) if args.cache else None
+service = ServiceANA(ClienteANA(tamanho_pool=max(args.workers, 1), cache=cache))
+print(f"Gerando inventário para: {', '.join(ufs)}")
+partes, falhas = service.inventario_ufs(ufs, args.workers)
+for uf, erro in falhas.items():
+    print(f"Falha ao obter o inventário de {uf}: {erro}")
+if not partes:
+    print("Nenhuma estação encontrada.")
+    sys.exit(1 if falhas else 0)
+
+inventario = service.combina(partes)
+duplicadas = sum(len(parte) for parte in partes.values()) - len(inventario)
+if duplicadas:
+    print(f"{duplicadas} estações repetidas entre UFs foram mantidas uma vez só")
+
+# Inventário particionado (uma tabela por UF) e o índice combinado, sem repetições,
+# como primeira tabela (a lida por le_tabela)
+abas = {"INDICE": inventario.reset_index()}
+abas.update({uf: parte.reset_index() for uf, parte in partes.items()})
+grava_tabelas(args.saida, abas, {"ufs": list(partes), "falhas": falhas, "duplicadas": int(duplicadas)})
+service.salvar_xlsx(inventario.drop(columns="uf"), args.saida)
+marca_planilha(args.saida)
+# índice espacial das coordenadas, para escolher as estações por área no download
+IndiceEspacial.do_inventario(args.saida, refaz=True)
+print(f"Arquivo gerado: {args.saida} ({len(inventario)} estações de {len(partes)} UFs; "
+      f"partições em {pasta_tabelas(args.saida)}, índice espacial em {arquivo_indice(args.saida)})")
+if falhas:
+    sys.exit(1)
@@ -0,0 +1,179 @@
+"""
+Benchmark do download (baixar_dados_por_estacao) contra o servidor local que
+imita a ANA (00_COMUM/servidor_ana_local.py), sem acessar a rede.
+
+O servidor roda em outro processo, para que o tempo de CPU medido seja só o do
+download (requisições, leitura do XML, estatísticas e gravação, inclusive nos
+processos do pipeline). Para cada
+combinação de workers (threads de rede) e processos (leitura e estatísticas) são medidos:
+    estações/s, MB/s recebidos, CPU (ms) por estação, requisições, erros HTTP 503 e,
+    pela telemetria do download (00_COMUM/telemetria.py), latência p50/p95 e novas tentativas.
+Com --cache cada configuração roda duas vezes: cache vazio (frio) e cheio (quente).
+
+Exemplo:
+    python benchmark_download.py --estacoes 300 --anos 60 --latencia 0.1 --variacao 0.05 --workers 1,8,16 --processos 0,4
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+import pandas as pd
+
+PASTA = Path(__file__).resolve().parent
+sys.path.append(str(PASTA.parent / '00_COMUM'))
+from cliente_ana import ClienteANA
+from cache_ana import CacheRespostas
+from telemetria import Telemetria
+
+
+def carrega_download():
+    # o script termina em .py.py e não pode ser importado pelo nome
+    spec = importlib.util.spec_from_file_location('download_processa_wb', PASTA / 'download_processa_wb.py.py')
+    modulo = importlib.util.module_from_spec(spec)
+    # registrado para que o pool de processos encontre as funções do módulo
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def inicia_servidor(args, porta):
+    comando = [sys.executable, str(PASTA.parent / '00_COMUM' / 'servidor_ana_local.py'),
+               '--porta', str(porta), '--estacoes', str(args.estacoes), '--anos', str(args.anos),
+               '--latencia', str(args.latencia), '--variacao', str(args.variacao),
+               '--taxa-erro', str(args.taxa_erro), '--semente', str(args.semente)]
+    if args.fixtures:
+        comando += ['--fixtures', args.fixtures]
+    if args.sem_gzip:
+        comando.append('--sem-gzip')
+    processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            estatisticas(porta)
+            return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.kill()
+    raise RuntimeError("O servidor local não respondeu")
+
+
+def estatisticas(porta, zera=False):
+    url = f'http://127.0.0.1:{porta}/ServiceANA.asmx/estatisticas' + ('?zera=1' if zera else '')
+    with urlopen(url, timeout=5) as resposta:
+        return json.load(resposta)
+
+
+def tempo_cpu():
+    # CPU deste processo e dos processos filhos já encerrados (o pool de processos do download
+    # é encerrado no fim de baixar_dados_por_estacao; o servidor só no fim do benchmark)
+    tempos = os.times()
+    return tempos.user + tempos.system + tempos.children_user + tempos.children_system
+
+
+def executa(download, url, inventario, pasta, num_workers, num_processos, porta, cache=None):
+    """ Um download completo do inventário em `pasta`; devolve as medidas. """
+    os.makedirs(pasta, exist_ok=True)
+    download.historico = os.path.join(pasta, 'historico.csv')
+    download.resultado_completo_path = os.path.join(pasta, 'sumario.xlsx')
+
+    telemetria = Telemetria(len(inventario), imprime=False)
+    cliente = ClienteANA(tamanho_pool=max(num_workers, 1), cache=cache, telemetria=telemetria)
+    service = download.ServiceANA(cliente)
+    service.url = url
+
+    estatisticas(porta, zera=True)
+    inicio, cpu = time.perf_counter(), tempo_cpu()
+    # o download imprime uma linha por estação; aqui só interessam as medidas
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        service.baixar_dados_por_estacao(inventario, tipoDados='2', consistencia='1', num_workers=num_workers,
+                                         num_processos=num_processos, pasta_estacoes=os.path.join(pasta, 'estacoes'),
+                                         pasta_matriz=os.path.join(pasta, 'dados'), telemetria=telemetria)
+    tempo, cpu = time.perf_counter() - inicio, tempo_cpu() - cpu
+    servidor = estatisticas(porta)
+    cliente.close()
+    resumo = telemetria.encerra()
+    latencia = {q: None if v is None else round(1000 * v, 1) for q, v in resumo['latencia_s'].items()}
+
+    num_estacoes = len(inventario)
+    return {
+        'workers': num_workers,
+        'processos': num_processos,
+        'estacoes': num_estacoes,
+        'tempo (s)': round(tempo, 3),
+        'estacoes/s': round(num_estacoes / tempo, 2),
+        'MB/s': round(servidor['bytes'] / tempo / 2**20, 3),
+        'CPU ms/estacao': round(1000 * cpu / num_estacoes, 2),
+        'requisicoes': servidor['requisicoes'],
+        'erros 503': servidor['erros'],
+        'novas tentativas': resumo['novas_tentativas'],
+        'latencia p50 (ms)': latencia['p50'],
+        'latencia p95 (ms)': latencia['p95'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark do download contra o servidor ANA local.")
+    parser.add_argument("--estacoes", type=int, default=100, help="Estações do inventário (padrão: 100)")
+    parser.add_argument("--anos", type=int, default=60, help="Anos de dados por estação (padrão: 60)")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latência de cada resposta em s (padrão: 0.05)")
+    parser.add_argument("--variacao", type=float, default=0.02, help="Desvio padrão da latência em s (padrão: 0.02)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas HTTP 503 (padrão: 0)")
+    parser.add_argument("--workers", type=str, default="1,8", help="Números de workers a medir (padrão: 1,8)")
+    parser.add_argument("--processos", type=str, default="0", help="Números de processos a medir (padrão: 0)")
+    parser.add_argument("--cache", action="store_true", help="Mede também com o cache de respostas (frio e quente)")
+    parser.add_argument("--sem-gzip", action="store_true", help="Servidor sem compactação gzip")
+    parser.add_argument("--fixtures", type=str, default=None, help="Pasta com respostas gravadas da ANA")
+    parser.add_argument("--semente", type=int, default=0, help="Semente dos dados e dos erros")
+    parser.add_argument("-s", "--saida", type=str, default=None, help="Grava os resultados em CSV")
+    args = parser.parse_args()
+
+    download = carrega_download()
+    porta = porta_livre()
+    servidor = inicia_servidor(args, porta)
+    url = f'http://127.0.0.1:{porta}/ServiceANA.asmx/'
+    pasta = tempfile.mkdtemp(prefix='benchmark_download_')
+    resultados = []
+    try:
+        service = download.ServiceANA(ClienteANA())
+        service.url = url
+        inventario = service.inventario2(estado='BAHIA').reset_index()
+        print(f"Inventário: {len(inventario)} estações; resultados temporários em {pasta}")
+
+        combinacoes = [(int(w), int(p)) for w in args.workers.split(',') for p in args.processos.split(',')]
+        for num_workers, num_processos in combinacoes:
+            nome = f'w{num_workers}_p{num_processos}'
+            if args.cache:
+                pasta_cache = os.path.join(pasta, f'cache_{nome}')
+                for rodada in ('frio', 'quente'):
+                    resultado = executa(download, url, inventario, os.path.join(pasta, f'{nome}_{rodada}'),
+                                        num_workers, num_processos, porta, CacheRespostas(pasta_cache))
+                    resultados.append({**resultado, 'cache': rodada})
+            else:
+                resultado = executa(download, url, inventario, os.path.join(pasta, nome),
+                                    num_workers, num_processos, porta)
+                resultados.append({**resultado, 'cache': '-'})
+    finally:
+        servidor.terminate()
+        servidor.wait()
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    tabela = pd.DataFrame(resultados)
+    print()
+    print(tabela.to_string(index=False))
+    if args.saida:
+        tabela.to_csv(args.saida, index=False)
@@ -0,0 +1,51 @@
+"""
+Disponibilidade dos dados a partir do índice de bits gravado com a matriz do download
+(pasta_matriz/disponibilidade.npz, ver 00_COMUM/disponibilidade.py): IDV e 'Num Anos Validos'
+por estação no período, as estações que passam nos limites da filtragem e o raster estação x ano.
+
+Exemplos:
+    python disponibilidade_wb.py -p 1981a2010 --min-anos 24 --min-idv 80
+    python disponibilidade_wb.py -p 01/03/1981a28/02/2011 -s disponibilidade_1981a2010.csv --raster raster_BAHIA.png
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from armazem_matriz import ArmazemMatriz
+from janelas import le_periodo
+
+parser = argparse.ArgumentParser(description="Disponibilidade dos dados por estação e período.")
+parser.add_argument("-m", "--matriz", type=str, default="dados_BAHIA", help="Pasta da matriz estação-dia (pasta_matriz do download)")
+parser.add_argument("-p", "--periodo", type=str, default=None, help="1981a2010 (anos inteiros) ou 01/03/1981a28/02/2011; padrão: tudo")
+parser.add_argument("--min-anos", type=int, default=None, help="Mínimo de 'Num Anos Validos' no período")
+parser.add_argument("--min-idv", type=float, default=None, help="Mínimo de IDV (%%) no período")
+parser.add_argument("-s", "--saida", type=str, default=None, help="Grava o resumo por estação (CSV ou .xlsx)")
+parser.add_argument("--raster", type=str, default=None, help="Grava a figura estação x ano do IDV anual (PNG)")
+args = parser.parse_args()
+
+inicio = time.perf_counter()
+indice = ArmazemMatriz(args.matriz).disponibilidade()
+data_inicio, data_fim = le_periodo(args.periodo) if args.periodo else (None, None)
+
+resumo = indice.resumo(data_inicio, data_fim)
+aceita = resumo['Num Dados Válidos'] > 0
+if args.min_anos is not None:
+    aceita &= resumo['Num Anos Validos'] >= args.min_anos
+if args.min_idv is not None:
+    aceita &= resumo['IDV'] >= args.min_idv
+resumo['Selecionada'] = aceita
+print(f"{int(aceita.sum())} de {len(resumo)} estações selecionadas ({time.perf_counter() - inicio:.2f} s)")
+
+if args.saida:
+    if args.saida.endswith('.xlsx'):
+        resumo.to_excel(args.saida, index=False)
+    else:
+        resumo.to_csv(args.saida, index=False)
+
+if args.raster:
+    ano_inicial = data_inicio.year if data_inicio is not None else None
+    ano_final = data_fim.year if data_fim is not None else None
+    indice.desenha_raster(args.raster, ano_inicial, ano_final, titulo=f"Disponibilidade de dados {args.periodo or ''}".strip())
+    print(f"Raster gravado em {args.raster}")
@@ -1,20 +1,191 @@
 import os
 import numpy as np
-import xml.etree.ElementTree as ET
-import requests
-import xmltodict
 import pandas as pd
 import geopandas as gpd
-import pendulum
 import plotly.figure_factory as ff
 import csv 
 from datetime import datetime
 import math
 from pathlib import Path
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from requests import RequestException
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from cliente_ana import ClienteANA, URL_ANA
+from cache_ana import CacheRespostas
+from xml_ana import le_serie_historica, le_inventario
+from estatisticas import calcula_tabelas, atualiza_tabela, tabela_limiares
+from matriz_estacoes import MatrizEstacaoDia
+from armazem_matriz import grava_armazem
+from tabelas import grava_tabelas, exporta_excel, le_tabela, le_metadados
+from prefiltro import PrefiltroInventario
+from indice_espacial import IndiceEspacial
+from telemetria import Telemetria, cronometra
+
+
+def serie_diaria(meses, valores, cod):
+    """ Monta a série diária a partir da tabela mensal do HidroSerieHistorica.
+        meses(ndarray datetime64): data de referência de cada linha (só ano e mês são usados)
+        valores(ndarray float): matriz (meses x 31) com as colunas Chuva01..Chuva31
+        cod(str): código da estação, nome da coluna de saída
+        Dias inexistentes (ex.: 30/02) e valores vazios são descartados.
+    """
+    inicio_mes = meses.astype('datetime64[M]')
+    dias_no_mes = ((inicio_mes + 1).astype('datetime64[D]') - inicio_mes.astype('datetime64[D]')).astype(int)
+    deslocamento = np.arange(31)
+
+    datas = inicio_mes.astype('datetime64[D]')[:, None] + deslocamento
+    validos = (deslocamento < dias_no_mes[:, None]) & ~np.isnan(valores) & ~np.isnat(meses)[:, None]
+
+    indice = pd.DatetimeIndex(datas[validos].astype('datetime64[ns]'), name='date')
+    return pd.DataFrame({cod: valores[validos]}, index=indice).sort_index(kind='stable')
+
+
+def interpreta_serie(conteudo, tipoDados='2'):
+    """ Lê o corpo de uma resposta 200 do HidroSerieHistorica (ver ServiceANA.pede_serie) e devolve
+        (df, data_min, data_max), com df=None se não há dados.
+    """
+    data_min = ''
+    data_max = ''
+
+    if tipoDados == '2':  # Modifiquei para tipoDados 2 (Chuva)
+        serie = le_serie_historica(conteudo, 'Chuva')
+        if serie is not None:
+            cod, datahora, valores = serie
+
+            # Data de cada mês convertida uma única vez para a série toda
+            try:
+                meses = pd.to_datetime(datahora, format='%Y-%m-%d %H:%M:%S').to_numpy()
+            except ValueError:
+                return None, data_min, data_max
+            df = serie_diaria(meses, valores, cod)
+
+            # Calculando as datas mínimas e máximas
+            data_min = df.index.min()
+            data_max = df.index.max()
+
+            return df, data_min, data_max
+    return None, data_min, data_max
+
+
+# Resultado da etapa de rede do download (ver ServiceANA.obtem_pedido):
+#   resultado: (df, data_min, data_max) quando a série já está pronta (lida do disco, sem dados, ...)
+#   resposta: corpo da resposta do HidroSerieHistorica ainda não lido, quando resultado é None
+#   base: (serie_local, inicio) no modo incremental, para juntar a série guardada aos dados novos
+#   carimbo: carimbo_inventario gravado com a série baixada
+PedidoSerie = namedtuple('PedidoSerie', ['resultado', 'resposta', 'base', 'carimbo'], defaults=(None, None, None))
+
+
+def conclui_serie(pedido, tipoDados='2'):
+    """ Termina o pedido: lê a resposta e junta à série guardada (modo incremental).
+        Devolve (df, data_min, data_max), como serie_historica.
+    """
+    if pedido.resposta is None:
+        return pedido.resultado
+    novos, data_min, data_max = interpreta_serie(pedido.resposta, tipoDados)
+    if pedido.base is None:
+        return novos, data_min, data_max
+    local, inicio = pedido.base
+    if novos is None:
+        dados = local
+    else:
+        dados = pd.concat([local[local.index < inicio], novos])
+    dados.attrs = {}
+    return dados, dados.index.min(), dados.index.max()
+
+
+def processa_serie(codigo, pedido, tipoDados='2', pasta_estacoes=None):
+    """ Etapa de CPU do download de uma estação (roda em outro processo, ver series_processadas):
+        lê a resposta, grava a série bruta em `pasta_estacoes` e separa os dados válidos.
+        Devolve None se a estação não tem dados, ou
+        (dados_validos, tamanho, num_dados_totais, data_min, data_max, inalterada, leitura),
+        com leitura = segundos gastos lendo a resposta (telemetria).
+    """
+    inicio = time.perf_counter()
+    dados_estacao, data_min, data_max = conclui_serie(pedido, tipoDados)
+    leitura = time.perf_counter() - inicio
+    if dados_estacao is None or len(dados_estacao) <= 1:
+        return None
+
+    if pasta_estacoes and not dados_estacao.attrs.get('local'):
+        dados_estacao.attrs['carimbo'] = pedido.carimbo
+        grava_serie_local(pasta_estacoes, codigo, dados_estacao)
+    dados_estacao[str(codigo)] = pd.to_numeric(dados_estacao[str(codigo)], errors='ignore')
+    tamanho = len(dados_estacao)
+
+    # Estatísticas
+    dados_totais = dados_estacao[str(codigo)]
+    num_dados_totais = len(dados_totais)
+    dados_validos = dados_estacao[str(codigo)][dados_estacao[str(codigo)] >= 0.0].dropna()
+    dados_validos = dados_validos.loc[~dados_validos.index.duplicated(keep='first')]
+    return (dados_validos, tamanho, num_dados_totais, data_min, data_max, bool(dados_estacao.attrs.get('inalterada')),
+            leitura)
+
+
+# Funções para guardar localmente a série bruta de cada estação baixada (usadas na retomada)
+def caminho_serie_local(pasta_estacoes, codigo):
+    return os.path.join(pasta_estacoes, f"{codigo}.pkl.gz")
+
+def grava_serie_local(pasta_estacoes, codigo, dados_estacao):
+    os.makedirs(pasta_estacoes, exist_ok=True)
+    caminho = caminho_serie_local(pasta_estacoes, codigo)
+    # grava em arquivo temporário e renomeia, para não deixar arquivo incompleto se o processo cair
+    dados_estacao.to_pickle(caminho + ".tmp", compression='gzip')
+    os.replace(caminho + ".tmp", caminho)
+
+def carrega_serie_local(pasta_estacoes, codigo):
+    if not pasta_estacoes:
+        return None
+    caminho = caminho_serie_local(pasta_estacoes, codigo)
+    if not os.path.exists(caminho):
+        return None
+    return pd.read_pickle(caminho, compression='gzip')
+
+
+def carimbo_inventario(linha):
+    """ Versão dos dados da estação segundo o inventário (Ultima Atualizacao e data_alt).
+        Se não mudou desde o último download, a série guardada continua valendo.
+    """
+    return f"{linha.get('Ultima Atualizacao', '')}|{linha.get('data_alt', '')}"
+
+
+# Funções para ler e reorganizar o histórico (checkpoint) do download
+def le_historico(historico):
+    """ Devolve {codigo: status} com o último status gravado para cada estação. """
+    if not os.path.exists(historico):
+        return {}
+    with open(historico, newline='') as file:
+        linhas = list(csv.reader(file))
+    if not linhas or 'codigo' not in linhas[0]:
+        return {}
+    i_codigo = linhas[0].index('codigo')
+    return {linha[i_codigo]: linha[-1] for linha in linhas[1:] if linha}
+
+def compacta_historico(historico, codigos):
+    """ Deixa uma linha por estação (a mais recente), na ordem do inventário. """
+    with open(historico, newline='') as file:
+        linhas = list(csv.reader(file))
+    cabecalho, linhas = linhas[0], [linha for linha in linhas[1:] if linha]
+    i_codigo = cabecalho.index('codigo')
+    ultima = {linha[i_codigo]: linha for linha in linhas}
+    ordem = [str(codigo) for codigo in codigos]
+    ordem += [codigo for codigo in ultima if codigo not in set(ordem)]
+    with open(historico + ".tmp", mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(cabecalho)
+        writer.writerows(ultima[codigo] for codigo in ordem if codigo in ultima)
+    os.replace(historico + ".tmp", historico)
+
 
 class ServiceANA:
-    def __init__(self) -> None:
-        self.url = 'http://telemetriaws1.ana.gov.br/ServiceANA.asmx/'
+    def __init__(self, cliente=None) -> None:
+        self.url = URL_ANA
+        self.cliente = cliente if cliente is not None else ClienteANA()
 
     def inventario2(self,estacao='',estado='',orgao=''):
         string = ''
@@ -24,56 +195,12 @@ class ServiceANA:
             f'&codBacia={string}&nmMunicipio={string}&nmEstado={estado}' + \
             f'&sgResp={orgao}&sgOper={string}&telemetrica={string}'
 
-        resposta = requests.get(url)
-
-        tree = ET.ElementTree(ET.fromstring(resposta.content))
-        root = tree.getroot()
-
-        estacoes = list()
-       
-        for estacao in root.iter("Table"):
-            dados = {
-                "codigo": [estacao.find("Codigo").text],
-                "nome": [estacao.find("Nome").text],                
-                "tipo": [estacao.find("TipoEstacao").text],
-                "latitude": [float(estacao.find("Latitude").text)],
-                "longitude": [float(estacao.find("Longitude").text)],
-                "altitude": [float(estacao.find("Altitude").text) if estacao.find("Altitude").text else np.nan],
-                "estado": [estacao.find("nmEstado").text],
-                "municipio": [estacao.find("nmMunicipio").text],
-                "BaciaCodigo": [estacao.find("BaciaCodigo").text], 
-                "SubBaciaCodigo": [estacao.find("SubBaciaCodigo").text], 
-                "Rio": [estacao.find("RioCodigo").text],                
-                "responsavel": [estacao.find("ResponsavelSigla").text],
-                "Ultima Atualizacao": [estacao.find("UltimaAtualizacao").text],
-                "data_ins": [estacao.find("DataIns").text],
-                "data_alt": [estacao.find("DataAlt").text]
-            }
-
-            df = pd.DataFrame.from_dict(dados)
-            df.set_index("codigo", inplace=True)
-            estacoes.append(df)
-
-        if len(estacoes) == 0:
-            inventario = []
-        else:
-            inventario = pd.concat(estacoes)
-
-        return inventario
-
-
-
-
-
-
-
-
-
-
-
-
-
+        _, conteudo = self.cliente.conteudo(url)
 
+        inventario = le_inventario(conteudo)
+        if inventario.empty:
+            return []
+        return inventario.set_index("codigo")
 
     def salvar_inventario_xlsx(self, inventario, filename):
         if not inventario.empty:
@@ -93,6 +220,15 @@ class ServiceANA:
             tipoDados(str): 1-Cotas, 2-Chuvas ou 3-Vazões
             consistencia(str): 1-Bruto ou 2-Consistido
         """
+        return interpreta_serie(self.pede_serie(codigo, tipoDados, data_i, data_f, consistencia), tipoDados)
+
+    def pede_serie(self, codigo, tipoDados='', data_i='', data_f='', consistencia='', usa_cache=True):
+        """ Só a requisição do HidroSerieHistorica: devolve o corpo da resposta, sem ler o XML.
+            usa_cache(bool): False não consulta nem grava o cache de respostas do ClienteANA
+            Qualquer status diferente de 200 (inclusive 429/5xx depois das novas tentativas do
+            ClienteANA) levanta RequestException: a estação fica como 'FALHA' no histórico e é
+            pedida de novo na retomada. 'NO DATA' fica só para respostas 200 sem série.
+        """
         params = {'codEstacao': codigo,
                 'dataInicio': data_i,
                 'dataFim': data_f,
@@ -100,64 +236,196 @@ class ServiceANA:
                 'nivelConsistencia': consistencia}
 
         url = self.url + '/HidroSerieHistorica'
-        r = requests.get(url, params)
-        data_min = ''
-        data_max = ''
-        
-        if r.status_code == 200:
-            xml = xmltodict.parse(r.content)
-            element = xml.get("DataTable", {}).get('diffgr:diffgram', {}).get('DocumentElement', {})
-            
-            if 'SerieHistorica' in element:
-                serie_historica = element['SerieHistorica']
-                
-                if isinstance(serie_historica, list) and len(serie_historica) > 0:
-                    df = pd.DataFrame(serie_historica)
-                    if not df.empty:
-                        if tipoDados == '2':  # Modifiquei para tipoDados 2 (Chuva)
-                            var = 'Chuva'
-                            cod = str(df['EstacaoCodigo'][0])
-                            cols_vaz = [f"{var}%02d" % (i,) for i in range(1, 32)]
-                            cols = ['DataHora'] + cols_vaz
-                            df = df[cols]
-                            df = df.melt(id_vars=['DataHora'], value_vars=cols_vaz).rename(columns={'value': f'{cod}'}).dropna()
-
-                            try:
-                                df['date_m'] = df.apply(lambda row: pendulum.from_format(row['DataHora'], 'YYYY-MM-DD HH:mm:ss').naive(), axis=1)
-                            except ValueError:
-                                return None, data_min, data_max
-                            
-                            def safe_date(row):
-                                try:
-                                    return pendulum.datetime(row['date_m'].year, row['date_m'].month, int(row['variable'][-2:])).naive()
-                                except ValueError:
-                                    return None
-                            
-                            df['date'] = df.apply(safe_date, axis=1)
-                            df = df.dropna(subset=['date'])
-                            df = df[['date', cod]].set_index('date').sort_index()
-                            
-                            # Calculando as datas mínimas e máximas
-                            data_min = df.index.min()
-                            data_max = df.index.max()
-
-                            return df.astype(float), data_min, data_max
-                elif isinstance(serie_historica, dict):
-                    df = pd.DataFrame([serie_historica])
-                    
-                    # Calculando as datas mínimas e máximas
-                    data_min = df['DataHora'].min()
-                    data_max = df['DataHora'].max()
-
-                    return df, data_min, data_max
-        else:
-            print(f"Request error: {r.status_code}")
-        return None, data_min, data_max
+        status, corpo = self.cliente.conteudo(url, params, usa_cache=usa_cache)
+        if status != 200:
+            raise RequestException(f"HTTP {status} ao pedir a série da estação {codigo}")
+        return corpo
+
+    def obtem_serie(self, codigo, tipoDados='', data_i='', data_f='', consistencia='', pasta_estacoes=None, retomadas=None,
+                    carimbo=None):
+        """ Devolve a série da estação, como serie_historica.
+            Estações marcadas como 'OK' em `retomadas` são lidas de `pasta_estacoes`, sem acessar a rede;
+            estações marcadas 'NO DATA' não são consultadas de novo.
+            carimbo(str): modo incremental (ver atualiza_serie), com o carimbo_inventario da estação
+        """
+        return conclui_serie(self.obtem_pedido(codigo, tipoDados, data_i, data_f, consistencia, pasta_estacoes,
+                                               retomadas, carimbo), tipoDados)
 
+    def obtem_pedido(self, codigo, tipoDados='', data_i='', data_f='', consistencia='', pasta_estacoes=None,
+                     retomadas=None, carimbo=None):
+        """ Etapa de rede de obtem_serie: faz a requisição, mas deixa a leitura do XML para
+            conclui_serie / processa_serie. Devolve um PedidoSerie.
+        """
+        status = (retomadas or {}).get(str(codigo))
+        if status == 'OK':
+            dados = carrega_serie_local(pasta_estacoes, codigo)
+            if dados is not None:
+                dados.attrs['local'] = True
+                return PedidoSerie((dados, dados.index.min(), dados.index.max()), carimbo=carimbo)
+        elif status == 'NO DATA':
+            return PedidoSerie((None, '', ''), carimbo=carimbo)
+        if carimbo is not None:
+            return self.pedido_atualizacao(codigo, carimbo, tipoDados, data_i, data_f, consistencia, pasta_estacoes)
+        return PedidoSerie(None, self.pede_serie(codigo, tipoDados, data_i, data_f, consistencia))
+
+
+    def atualiza_serie(self, codigo, carimbo, tipoDados='', data_i='', data_f='', consistencia='', pasta_estacoes=None):
+        """ Modo incremental: parte da série guardada em `pasta_estacoes`.
+            - carimbo igual ao da série guardada: usa a série guardada, sem acessar a rede
+              (attrs['inalterada']=True);
+            - carimbo diferente: pede só os dados a partir do mês do último dado guardado
+              (esse mês pode ter sido completado ou revisto) e junta à série guardada;
+            - estação sem série guardada: baixa a série toda.
+            O pedido dos dados novos não usa o cache de respostas. Resposta diferente de 200 levanta
+            RequestException (estação em FALHA): a série guardada e o seu carimbo não mudam.
+        """
+        return conclui_serie(self.pedido_atualizacao(codigo, carimbo, tipoDados, data_i, data_f, consistencia,
+                                                     pasta_estacoes), tipoDados)
+
+    def pedido_atualizacao(self, codigo, carimbo, tipoDados='', data_i='', data_f='', consistencia='', pasta_estacoes=None):
+        """ Etapa de rede de atualiza_serie (ver obtem_pedido). """
+        local = carrega_serie_local(pasta_estacoes, codigo)
+        if local is None or len(local) == 0:
+            return PedidoSerie(None, self.pede_serie(codigo, tipoDados, data_i, data_f, consistencia), carimbo=carimbo)
+
+        if local.attrs.get('carimbo') == carimbo:
+            local.attrs['local'] = True
+            local.attrs['inalterada'] = True
+            return PedidoSerie((local, local.index.min(), local.index.max()), carimbo=carimbo)
+
+        inicio = local.index.max().replace(day=1)
+        if data_i:
+            inicio = max(inicio, pd.to_datetime(data_i, dayfirst=True))
+        # O pedido dos dados novos não passa pelo cache: a chave é só o período (aberto, dataFim='') e o
+        # mesmo início se repete enquanto não chegam dias novos, então o cache devolveria a resposta antiga.
+        # Se o pedido falhar (RequestException), a série guardada e o carimbo antigo ficam como estão
+        # e a estação é pedida de novo na próxima atualização.
+        resposta = self.pede_serie(codigo, tipoDados, inicio.strftime('%d/%m/%Y'), data_f, consistencia,
+                                   usa_cache=False)
+        return PedidoSerie(None, resposta, (local, inicio), carimbo)
+
+
+    def series_em_ordem(self, codigos, obtem, num_workers=1):
+        """ Executa obtem(codigo) para várias estações em paralelo e devolve os resultados
+            na mesma ordem de `codigos`, como (codigo, resultado, erro).
+            erro é a exceção de rede que impediu o download (resultado=None), ou None.
+            num_workers(int): número de downloads simultâneos. Com 1, baixa em sequência.
+            No máximo 2*num_workers séries ficam em memória aguardando a vez.
+        """
+        def resultado(futuro):
+            try:
+                return futuro.result(), None
+            except RequestException as erro:
+                return None, erro
+
+        if num_workers <= 1:
+            for codigo in codigos:
+                try:
+                    yield codigo, obtem(codigo), None
+                except RequestException as erro:
+                    yield codigo, None, erro
+            return
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pendentes = deque()
+            for codigo in codigos:
+                pendentes.append((codigo, executor.submit(obtem, codigo)))
+                if len(pendentes) >= 2 * num_workers:
+                    codigo_pronto, futuro = pendentes.popleft()
+                    yield (codigo_pronto, *resultado(futuro))
+            while pendentes:
+                codigo_pronto, futuro = pendentes.popleft()
+                yield (codigo_pronto, *resultado(futuro))
+
+
+    def series_processadas(self, codigos, obtem, processa, num_workers=1, processos=None, tamanho_fila=None):
+        """ Pipeline do download, com as etapas sobrepostas:
+            - rede: num_workers threads executam obtem(codigo) (só as requisições);
+            - CPU: processa(codigo, pedido) roda no pool de processos `processos` (leitura do XML,
+              gravação da série, dados válidos), fora do GIL, enquanto outras requisições esperam a rede;
+            - escrita: quem consome este gerador (uma única thread), na ordem de `codigos`.
+            Devolve (codigo, resultado, erro) como series_em_ordem. Sem pool de processos, obtem e
+            processa rodam juntos nas threads de rede (series_em_ordem).
+            tamanho_fila(int): máximo de estações em andamento (em alguma etapa ou esperando a
+                escrita); padrão 4 * num_workers
+        """
+        if processos is None:
+            yield from self.series_em_ordem(codigos, lambda codigo: processa(codigo, obtem(codigo)), num_workers)
+            return
 
-  
+        if tamanho_fila is None:
+            tamanho_fila = 4 * max(num_workers, 1)
 
-    def baixar_dados_por_estacao(self, df, tipoDados='2', data_i='', data_f='', consistencia='1'):
+        def copia(origem, destino):
+            erro = origem.exception()
+            if erro is not None:
+                destino.set_exception(erro)
+            else:
+                destino.set_result(origem.result())
+
+        with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as rede:
+            def inicia(codigo):
+                final = Future()
+
+                def baixou(futuro):
+                    if futuro.exception() is not None:
+                        copia(futuro, final)
+                        return
+                    try:
+                        processos.submit(processa, codigo, futuro.result()).add_done_callback(
+                            lambda processado: copia(processado, final))
+                    except Exception as erro:   # pool encerrado
+                        final.set_exception(erro)
+
+                rede.submit(obtem, codigo).add_done_callback(baixou)
+                return final
+
+            def resultado(futuro):
+                try:
+                    return futuro.result(), None
+                except RequestException as erro:
+                    return None, erro
+
+            pendentes = deque()
+            for codigo in codigos:
+                pendentes.append((codigo, inicia(codigo)))
+                if len(pendentes) >= tamanho_fila:
+                    codigo_pronto, futuro = pendentes.popleft()
+                    yield (codigo_pronto, *resultado(futuro))
+            while pendentes:
+                codigo_pronto, futuro = pendentes.popleft()
+                yield (codigo_pronto, *resultado(futuro))
+
+
+    def baixar_dados_por_estacao(self, df, tipoDados='2', data_i='', data_f='', consistencia='1', num_workers=1,
+                                 retomar=False, pasta_estacoes=None, matriz_compacta=False, pasta_matriz=None,
+                                 incremental=False, prefiltro=None, num_processos=0, tamanho_fila=None,
+                                 bloco_estatisticas=256, telemetria=None, limiares=None):
+        """ num_workers(int): requisições simultâneas (threads de rede)
+            num_processos(int): processos que leem o XML, gravam as séries e calculam as estatísticas
+                enquanto as requisições seguintes esperam a rede (ver series_processadas).
+                0 = tudo nas threads de rede e estatísticas no final, neste processo
+            tamanho_fila(int): máximo de estações em andamento no pipeline (padrão 2*(num_workers+num_processos))
+            bloco_estatisticas(int): com num_processos > 0, as estatísticas de cada bloco de estações
+                vão para o pool de processos assim que o bloco fica completo
+            retomar(bool): continua um download interrompido a partir do histórico (checkpoint).
+                Estações já 'OK' são lidas de `pasta_estacoes`; só as que faltam ou falharam são baixadas.
+            pasta_estacoes(str): pasta onde a série bruta de cada estação baixada é guardada.
+            matriz_compacta(bool): guarda só os dias com dado de cada estação (ver MatrizEstacaoDia)
+            pasta_matriz(str): pasta onde a matriz estação-dia é gravada em formato binário (ver armazem_matriz)
+            incremental(bool): atualiza as séries guardadas em `pasta_estacoes` (ver atualiza_serie) e
+                recalcula o sumário só das estações que mudaram; as demais linhas vêm do sumário anterior.
+                Se o pedido de uma estação falha, a série guardada continua na matriz e no sumário e
+                só o histórico marca 'FALHA' (a estação é pedida de novo na próxima atualização).
+            prefiltro(callable): recebe a linha do inventário (dict) e devolve o motivo para não baixar a
+                estação, ou None (ver PrefiltroInventario). As estações ignoradas ficam no histórico
+                com status 'IGNORADA', sem nenhum pedido de série.
+            limiares(list): limiares de chuva (mm) da varredura (ver estatisticas.tabela_limiares): grava
+                também as abas LIMIARES (por estação) e LIMIARES_ANUAIS (por estação e ano), com dias,
+                frequência, total, média, desvio e percentis acima de cada limiar. None = não calcula
+            telemetria(Telemetria): recebe o status e o tempo de leitura de cada estação e o tempo das
+                estatísticas de cada bloco (as requisições são registradas pelo ClienteANA)
+        """
     
         # Função para calcular o número de dias entre duas datas
         def calcular_num_dias(data_min, data_max):
@@ -190,404 +458,223 @@ class ServiceANA:
                     writer.writerow(linha)
 
 
-        # Função para verificar se um ano é bissexto
-        def eh_bissexto(ano):
-            return (ano % 4 == 0 and ano % 100 != 0) or (ano % 400 == 0)
-
-        # Função para calcular o número total de dias em um mês específico entre dois anos
-        def total_dias_mes(mes, data_min, data_max):
-            formato = "%Y-%m-%d %H:%M:%S"
-            #data_min = datetime.strptime(data_min, formato)
-           # data_max = datetime.strptime(data_max, formato)
-            ano_inicio=data_min.year
-            ano_fim=data_max.year
-            
-            dias_no_mes = 0
-            
-            for ano in range(ano_inicio, ano_fim + 1):
-                if mes == 2:
-                    if eh_bissexto(ano):
-                        dias_no_mes += 29
-                    else:
-                        dias_no_mes += 28
-                elif mes in [4, 6, 9, 11]:
-                    dias_no_mes += 30
-                else:
-                    dias_no_mes += 31
-            
-            return dias_no_mes
-
-
-
         codigos = df['codigo']
-        dados_estado = []
-        num_estacao = len(codigos)   
+        num_estacao = len(codigos)
+        # Matriz dias x estações pré-alocada; cada estação válida ocupa a próxima coluna
+        dados_estado = MatrizEstacaoDia(num_estacao, data_i, data_f, compacta=matriz_compacta)   
         k = -1 
         resultados_completos = []
-        estatisticas_mensais=[]
-        estatisticas_anuais = []
-        
-        grava_historico(historico, df, 0, "w", 0, 0, 0, '')  # Inicializando o histórico
-
-        for codigo in codigos:
-            k += 1
-            lon = df.iloc[k]['longitude']
-            lat = df.iloc[k]['latitude']
-            altitude = df.iloc[k]['altitude']
-            nome = df.iloc[k]['nome']
-            cidade = df.iloc[k]['municipio']
-            UF = df.iloc[k]['estado']
-            bacia = df.iloc[k]['BaciaCodigo']
-            subbacia = df.iloc[k]['SubBaciaCodigo']
-            rio = df.iloc[k]['Rio']
-            orgao = df.iloc[k]['responsavel']
-            data_ultimo_dado = df.iloc[k]['Ultima Atualizacao']
-            
-            #print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF)
-            dados_estacao, data_min, data_max = self.serie_historica(codigo, tipoDados, data_i, data_f, consistencia)
-           
-            
-            num_de_dias, num_anos = calcular_num_dias(data_min, data_max)
-
-            if dados_estacao is not None and len(dados_estacao) > 1:
-                dados_estacao[str(codigo)] = pd.to_numeric(dados_estacao[str(codigo)], errors='ignore')
-                tamanho = len(dados_estacao)
-
-                # Estatísticas
-                dados_totais = dados_estacao[str(codigo)]
-                num_dados_totais = len(dados_totais)
-                dados_validos = dados_estacao[str(codigo)][dados_estacao[str(codigo)] >= 0.0].dropna()
-                dados_validos = dados_validos.loc[~dados_validos.index.duplicated(keep='first')]
-                num_dados_validos = len(dados_validos)
-                limite_chuva = 1.0
-                dados_LDU = dados_estacao[str(codigo)][dados_estacao[str(codigo)] >= limite_chuva].dropna()
-                dados_LDU = dados_LDU.loc[~dados_LDU.index.duplicated(keep='first')]
-                num_dados_validos_acima_limite = len(dados_LDU)
-                chuva_non_zero = dados_estacao[str(codigo)][dados_estacao[str(codigo)] >= 0.1].dropna()
-                chuva_non_zero = chuva_non_zero.loc[~chuva_non_zero.index.duplicated(keep='first')]
-                num_chuva_non_zero = len(chuva_non_zero)
-
-                idv = (num_dados_validos / num_de_dias) * 100 if num_de_dias else 0
-                idv_limite = (num_dados_validos_acima_limite / num_de_dias) * 100 if num_de_dias else 0
-                id_nonzero = (num_chuva_non_zero / num_de_dias) * 100 if num_de_dias else 0
-
-                resultados_completos.append({
-                    "Codigo": codigo,
-                    "Num Total de registros": num_dados_totais,
-                    "Nome": nome,
-                    "Latitude": lat,
-                    "Longitude": lon,
-                    "Altitude": altitude,
-                    "cidade": cidade,
-                    "UF": UF,
-                    "Bacia": bacia,
-                    "Sub Bacia": subbacia,
-                    "Rio": rio,
-                    "orgao": orgao,
-                    "data Ultimo dado": data_ultimo_dado,
-                    "CONTAGEM": " - ",
-                    "Data Inicial": data_min,
-                    "Data Final": data_max,
-                    "Num de Dias": num_de_dias,
-                    "Num de Anos Total": num_anos,
-                    "Num Anos Validos": math.ceil(num_anos * (idv / 100)),
-                    "Num Dados Válidos": len(dados_validos),
-                    "Num Dados chuva non_zero": len(chuva_non_zero),
-                    "Num Dados >= LDU": len(dados_LDU),
-                    "IDV": idv,
-                    "IDV LDU": idv_limite,
-                    "IDV Nonzero": id_nonzero,
-                    "STAT-ALL": " - ",
-                    "Média mm/dia": dados_validos.mean(),
-                    "Média mm/mes": dados_validos.mean()*30,
-                    "Média mm/ano": dados_validos.mean()*365,
-                    "Mediana": dados_validos.median(),
-                    "Moda": float(dados_validos.mode().iloc[0]) if not dados_validos.mode().empty else None,
-                    "Máximo": dados_validos.max(),
-                    "Mínimo": dados_validos.min(),
-                    "Desvio Padrao": dados_validos.std(),
-                    "Variancia": dados_validos.var(),
-                    "P25": dados_validos.quantile(0.25) if not dados_validos.empty else None,
-                    "P50": dados_validos.quantile(0.50) if not dados_validos.empty else None,
-                    "P75": dados_validos.quantile(0.75) if not dados_validos.empty else None,
-                    "P90": dados_validos.quantile(0.90) if not dados_validos.empty else None,
-                    "P95": dados_validos.quantile(0.95) if not dados_validos.empty else None,
-                    "P99": dados_validos.quantile(0.99) if not dados_validos.empty else None,
-                    "CHUVA NON-ZERO": " - ",
-                    "Média NZ mm/dia": chuva_non_zero.mean(),
-                    "Média NZ mm/mes": chuva_non_zero.mean()*30,
-                    "Média NZ mm/ano": chuva_non_zero.mean()*365,
-                    "Mediana NZ": chuva_non_zero.median(),
-                    "Moda NZ": float(chuva_non_zero.mode().iloc[0]) if not chuva_non_zero.mode().empty else None,
-                    "Máximo NZ": chuva_non_zero.max(),
-                    "Mínimo NZ": chuva_non_zero.min(),
-                    "Desvio Padrao NZ": chuva_non_zero.std(),
-                    "Variancia NZ": chuva_non_zero.var(),
-                    "P25 NZ": chuva_non_zero.quantile(0.25) if not chuva_non_zero.empty else None,
-                    "P50 NZ": chuva_non_zero.quantile(0.50) if not chuva_non_zero.empty else None,
-                    "P75 NZ": chuva_non_zero.quantile(0.75) if not chuva_non_zero.empty else None,
-                    "P90 NZ": chuva_non_zero.quantile(0.90) if not chuva_non_zero.empty else None,
-                    "P95 NZ": chuva_non_zero.quantile(0.95) if not chuva_non_zero.empty else None,
-                    "P99 NZ": chuva_non_zero.quantile(0.99) if not chuva_non_zero.empty else None,
-                    "CHUVA LDU": " - ",
-                    "Média LDU mm/dia": dados_LDU.mean(),
-                    "Média LDU mm/mes": dados_LDU.mean()*30,
-                    "Média LDU mm/ano": dados_LDU.mean()*365,
-                    "Mediana LDU": dados_LDU.median(),
-                    "Moda LDU": float(dados_LDU.mode().iloc[0]) if not dados_LDU.mode().empty else None,
-                    "Máximo LDU": dados_LDU.max(),
-                    "Mínimo LDU": dados_LDU.min(),
-                    "Desvio Padrao LDU": dados_LDU.std(),
-                    "Variancia LDU": dados_LDU.var(),
-                    "P25(LDU)": dados_LDU.quantile(0.25) if not dados_LDU.empty else None,
-                    "P50(LDU)": dados_LDU.quantile(0.50) if not dados_LDU.empty else None,
-                    "P75(LDU)": dados_LDU.quantile(0.75) if not dados_LDU.empty else None,
-                    "P90(LDU)": dados_LDU.quantile(0.90) if not dados_LDU.empty else None,
-                    "P95(LDU)": dados_LDU.quantile(0.95) if not dados_LDU.empty else None,
-                    "P99(LDU)": dados_LDU.quantile(0.99) if not dados_LDU.empty else None
-                })
-                # Cálculo de estatísticas mensais
-
-                idv = (num_dados_validos / num_de_dias) * 100 if num_de_dias else 0
-                idv_limite = (num_dados_validos_acima_limite / num_de_dias) * 100 if num_de_dias else 0
-                id_nonzero = (num_chuva_non_zero / num_de_dias) * 100 if num_de_dias else 0
-                for mes in range(1, 13):
-                    # 
-                    # numero de dias do mes 
-                    #
-                    total_dias_no_mes=total_dias_mes(mes,data_min,data_max)
-                    #
-                    #
-                    #
-                    dados_mes = dados_validos[dados_validos.index.month == mes]
-                    dados_mes_non_zero = chuva_non_zero[chuva_non_zero.index.month == mes]
-                    dados_mes_LDU = dados_LDU[dados_LDU.index.month == mes]
-                    #
-                    #
-                    #
-                    num_dias_mes_validos=len(dados_mes)
-                    idv_mes=(num_dias_mes_validos/total_dias_no_mes) * 100 if total_dias_no_mes else 0
-                    num_dias_mes_validos_noz_zero=len(dados_mes_non_zero)
-                    idv_mes_non_zero=(num_dias_mes_validos_noz_zero/total_dias_no_mes) * 100 if total_dias_no_mes else 0
-                    num_dias_mes_validos_LDU=len(dados_mes_LDU)
-                    idv_mes_LDU=(num_dias_mes_validos_LDU/total_dias_no_mes) * 100 if total_dias_no_mes else 0
-                    
-
 
+        # Carimbo de cada estação no inventário; fica guardado com a série baixada e com o sumário
+        registros = df.to_dict('records')
+        carimbos = {str(c): carimbo_inventario(linha) for c, linha in zip(codigos, registros)}
+
+        # Estações descartadas pelo pré-filtro do inventário: {codigo: motivo}
+        ignoradas = {}
+        if prefiltro is not None:
+            for c, linha in zip(codigos, registros):
+                motivo = prefiltro(linha)
+                if motivo:
+                    ignoradas[str(c)] = motivo
+            print("Pré-filtro do inventário: ", len(ignoradas), " de ", num_estacao, " estações ignoradas")
+        parametros = {'tipoDados': tipoDados, 'data_i': data_i, 'data_f': data_f,
+                      'consistencia': consistencia, 'limite_chuva': limite_chuva}
+
+        # Modo incremental: estações com o mesmo carimbo do sumário anterior (calculado com os
+        # mesmos parâmetros) não são recalculadas; só as demais vão para a matriz `alteradas`
+        sumario_anterior = None
+        if incremental:
+            if not pasta_estacoes:
+                raise ValueError("O modo incremental precisa de pasta_estacoes (séries já baixadas)")
+            anterior = le_metadados(resultado_completo_path)
+            if anterior.get('parametros') == parametros:
+                sumario_anterior = anterior.get('carimbos', {})
+        reaproveitadas = set()
+        if sumario_anterior is not None:
+            alteradas = MatrizEstacaoDia(1, data_i, data_f, compacta=matriz_compacta)   # cresce conforme necessário
+            metadados_alteradas = []
+        else:
+            alteradas, metadados_alteradas = dados_estado, resultados_completos
 
-                    
-                    if not dados_mes.empty:
-                       estatisticas_mensais.append (
-                            {
-
-                                "Codigo": codigo,
-                                "Nome": nome,
-                                "Latitude": lat,
-                                "Longitude": lon,
-                                "Altitude": altitude,
-                                "cidade": cidade,
-                                "UF": UF,
-                                "Bacia": bacia,
-                                "Sub Bacia": subbacia,
-                                "Rio": rio,
-                                "orgao": orgao,
-                                "CONTAGEM": " - ",
-                                "mes":mes,
-                                "Data Inicial": data_min,
-                                "Data Final": data_max,
-                                "Num de Dias": total_dias_no_mes,
-                                "Num de Dias válidos": num_dias_mes_validos,
-                                "Num Dias Validos": math.ceil(total_dias_no_mes * (idv_mes / 100)),
-                                "Num Dados chuva non_zero": num_dias_mes_validos_noz_zero,
-                                "Num Dados >= LDU": num_dias_mes_validos_LDU,
-                                "IDV": idv_mes,
-                                "IDV LDU": idv_mes_LDU,
-                                "ID Nonzero": idv_mes_non_zero,
-                                "STAT-ALL": " - ", #--------------------------------------------------------------------------------------
-                                "Média mm/dia":  dados_mes.mean(),
-                                "Média mm/mes":  dados_mes.mean()*30,
-                                "Média mm/ano":  dados_mes.mean()*365,
-                                "Mediana":  dados_mes.median(),
-                                "Moda": float( dados_mes.mode().iloc[0]) if not  dados_mes.mode().empty else None,
-                                "Máximo":  dados_mes.max(),
-                                "Mínimo":  dados_mes.min(),
-                                "Desvio Padrao":  dados_mes.std(),
-                                "Variancia":  dados_mes.var(),
-                                "P25":  dados_mes.quantile(0.25) if not  dados_mes.empty else None,
-                                "P50":  dados_mes.quantile(0.50) if not  dados_mes.empty else None,
-                                "P75":  dados_mes.quantile(0.75) if not  dados_mes.empty else None,
-                                "P90":  dados_mes.quantile(0.90) if not  dados_mes.empty else None,
-                                "P95":  dados_mes.quantile(0.95) if not  dados_mes.empty else None,
-                                "P99":  dados_mes.quantile(0.99) if not  dados_mes.empty else None,
-                                "CHUVA NON-ZERO": " - ",
-                                "Média NZ mm/dia": dados_mes_non_zero.mean(),
-                                "Média NZ mm/mes": dados_mes_non_zero.mean()*30,
-                                "Média NZ mm/ano": dados_mes_non_zero.mean()*365,
-                                "Mediana NZ": dados_mes_non_zero.median(),
-                                "Moda NZ": float(dados_mes_non_zero.mode().iloc[0]) if not dados_mes_non_zero.mode().empty else None,
-                                "Máximo NZ": dados_mes_non_zero.max(),
-                                "Mínimo NZ": dados_mes_non_zero.min(),
-                                "Desvio Padrao NZ": dados_mes_non_zero.std(),
-                                "Variancia NZ": dados_mes_non_zero.var(),
-                                "P25 NZ": dados_mes_non_zero.quantile(0.25) if not dados_mes_non_zero.empty else None,
-                                "P50 NZ": dados_mes_non_zero.quantile(0.50) if not dados_mes_non_zero.empty else None,
-                                "P75 NZ": dados_mes_non_zero.quantile(0.75) if not dados_mes_non_zero.empty else None,
-                                "P90 NZ": dados_mes_non_zero.quantile(0.90) if not dados_mes_non_zero.empty else None,
-                                "P95 NZ": dados_mes_non_zero.quantile(0.95) if not dados_mes_non_zero.empty else None,
-                                "P99 NZ": dados_mes_non_zero.quantile(0.99) if not dados_mes_non_zero.empty else None,
-                                "CHUVA LDU": " - ",
-                                "Média LDU mm/dia":  dados_mes_LDU.mean(),
-                                "Média LDU mm/mes":  dados_mes_LDU.mean()*30,
-                                "Média LDU mm/ano":  dados_mes_LDU.mean()*365,
-                                "Mediana LDU":  dados_mes_LDU.median(),
-                                "Moda LDU": float( dados_mes_LDU.mode().iloc[0]) if not  dados_mes_LDU.mode().empty else None,
-                                "Máximo LDU":  dados_mes_LDU.max(),
-                                "Mínimo LDU":  dados_mes_LDU.min(),
-                                "Desvio Padrao LDU":  dados_mes_LDU.std(),
-                                "Variancia LDU":  dados_mes_LDU.var(),
-                                "P25(LDU)":  dados_mes_LDU.quantile(0.25) if not  dados_mes_LDU.empty else None,
-                                "P50(LDU)":  dados_mes_LDU.quantile(0.50) if not  dados_mes_LDU.empty else None,
-                                "P75(LDU)":  dados_mes_LDU.quantile(0.75) if not  dados_mes_LDU.empty else None,
-                                "P90(LDU)":  dados_mes_LDU.quantile(0.90) if not  dados_mes_LDU.empty else None,
-                                "P95(LDU)":  dados_mes_LDU.quantile(0.95) if not  dados_mes_LDU.empty else None,
-                                "P99(LDU)":  dados_mes_LDU.quantile(0.99) if not  dados_mes_LDU.empty else None
-                            })
-
- 
-     
-                            # Salvando estatísticas mensais na aba correspondente do Excel
-                            # df_estatisticas_mensais = pd.DataFrame([estatisticas_mensais])
-                            # df_estatisticas_mensais.to_excel(writer, sheet_name=f"Mensal_{mes}", index=False, header=not writer.sheets)
-
-               
-               
-
-                for ano in range(dados_validos.index.year.min(), dados_validos.index.year.max() + 1):
-                    
-                    dados_ano = dados_validos[dados_validos.index.year == ano]
-                    dados_ano_non_zero = chuva_non_zero[chuva_non_zero.index.year == ano]
-                    dados_ano_LDU = dados_LDU[dados_LDU.index.year == ano]
-
-                    num_dias_ano = len(pd.date_range(start=f'{ano}-01-01', end=f'{ano}-12-31'))
-                    num_dias_ano_validos = len(dados_ano)
-                    num_dias_ano_validos_nonzero = len(dados_ano_non_zero)
-                    num_dias_ano_validos_LDU = len(dados_ano_LDU)
-                    
-                    idv_ano = (num_dias_ano_validos / num_dias_ano) * 100 if num_dias_ano else 0
-                    idv_ano_non_zero = (num_dias_ano_validos / num_dias_ano) * 100 if num_dias_ano else 0
-                    idv_ano_LDU = (num_dias_ano_validos / num_dias_ano) * 100 if num_dias_ano else 0
-                    
-                    if not dados_ano.empty:
-                       estatisticas_anuais.append (
-                            {
-
-                                "Codigo": codigo,
-                                "Nome": nome,
-                                "Latitude": lat,
-                                "Longitude": lon,
-                                "Altitude": altitude,
-                                "cidade": cidade,
-                                "UF": UF,
-                                "Bacia": bacia,
-                                "Sub Bacia": subbacia,
-                                "Rio": rio,
-                                "orgao": orgao,
-                                "CONTAGEM": " - ",
-                                "ano":ano,
-                                "Data Inicial": data_min,
-                                "Data Final": data_max,
-                                "Num de Dias": num_dias_ano,
-                                "Num de Dias válidos": num_dias_ano_validos,
-                                "Num Dias Validos": math.ceil(num_dias_ano * (idv_ano / 100)),
-                                "Num Dados chuva non_zero": num_dias_ano_validos_nonzero,
-                                "Num Dados >= LDU": num_dias_ano_validos_LDU,
-                                "IDV": idv_ano,
-                                "IDV LDU": idv_ano_LDU,
-                                "IDV Nonzero": idv_ano_non_zero,
-                                "STAT-ALL": " - ", #--------------------------------------------------------------------------------------
-                                "Média mm/dia":  dados_ano.mean(),
-                                "Média mm/ano":  dados_ano.mean()*30,
-                                "Média mm/ano":  dados_ano.mean()*365,
-                                "Mediana":  dados_ano.median(),
-                                "Moda": float( dados_ano.mode().iloc[0]) if not  dados_ano.mode().empty else None,
-                                "Máximo":  dados_ano.max(),
-                                "Mínimo":  dados_ano.min(),
-                                "Desvio Padrao":  dados_ano.std(),
-                                "Variancia":  dados_ano.var(),
-                                "P25":  dados_ano.quantile(0.25) if not  dados_ano.empty else None,
-                                "P50":  dados_ano.quantile(0.50) if not  dados_ano.empty else None,
-                                "P75":  dados_ano.quantile(0.75) if not  dados_ano.empty else None,
-                                "P90":  dados_ano.quantile(0.90) if not  dados_ano.empty else None,
-                                "P95":  dados_ano.quantile(0.95) if not  dados_ano.empty else None,
-                                "P99":  dados_ano.quantile(0.99) if not  dados_ano.empty else None,
-                                "CHUVA NON-ZERO": " - ",
-                                "Média NZ mm/dia": dados_ano_non_zero.mean(),
-                                "Média NZ mm/ano": dados_ano_non_zero.mean()*30,
-                                "Média NZ mm/ano": dados_ano_non_zero.mean()*365,
-                                "Mediana NZ": dados_ano_non_zero.median(),
-                                "Moda NZ": float(dados_ano_non_zero.mode().iloc[0]) if not dados_ano_non_zero.mode().empty else None,
-                                "Máximo NZ": dados_ano_non_zero.max(),
-                                "Mínimo NZ": dados_ano_non_zero.min(),
-                                "Desvio Padrao NZ": dados_ano_non_zero.std(),
-                                "Variancia NZ": dados_ano_non_zero.var(),
-                                "P25 NZ": dados_ano_non_zero.quantile(0.25) if not dados_ano_non_zero.empty else None,
-                                "P50 NZ": dados_ano_non_zero.quantile(0.50) if not dados_ano_non_zero.empty else None,
-                                "P75 NZ": dados_ano_non_zero.quantile(0.75) if not dados_ano_non_zero.empty else None,
-                                "P90 NZ": dados_ano_non_zero.quantile(0.90) if not dados_ano_non_zero.empty else None,
-                                "P95 NZ": dados_ano_non_zero.quantile(0.95) if not dados_ano_non_zero.empty else None,
-                                "P99 NZ": dados_ano_non_zero.quantile(0.99) if not dados_ano_non_zero.empty else None,
-                                "CHUVA LDU": " - ",
-                                "Média LDU mm/dia":  dados_ano_LDU.mean(),
-                                "Média LDU mm/ano":  dados_ano_LDU.mean()*30,
-                                "Média LDU mm/ano":  dados_ano_LDU.mean()*365,
-                                "Mediana LDU":  dados_ano_LDU.median(),
-                                "Moda LDU": float( dados_ano_LDU.mode().iloc[0]) if not  dados_ano_LDU.mode().empty else None,
-                                "Máximo LDU":  dados_ano_LDU.max(),
-                                "Mínimo LDU":  dados_ano_LDU.min(),
-                                "Desvio Padrao LDU":  dados_ano_LDU.std(),
-                                "Variancia LDU":  dados_ano_LDU.var(),
-                                "P25(LDU)":  dados_ano_LDU.quantile(0.25) if not  dados_ano_LDU.empty else None,
-                                "P50(LDU)":  dados_ano_LDU.quantile(0.50) if not  dados_ano_LDU.empty else None,
-                                "P75(LDU)":  dados_ano_LDU.quantile(0.75) if not  dados_ano_LDU.empty else None,
-                                "P90(LDU)":  dados_ano_LDU.quantile(0.90) if not  dados_ano_LDU.empty else None,
-                                "P95(LDU)":  dados_ano_LDU.quantile(0.95) if not  dados_ano_LDU.empty else None,
-                                "P99(LDU)":  dados_ano_LDU.quantile(0.99) if not  dados_ano_LDU.empty else None
-                            })
-
-                
-                grava_historico(historico, df, k, "a", tamanho, data_min, data_max, 'OK')
-                dados_estado.append(dados_validos)
-                print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF," ",data_min," ",data_max, "tamanho:",tamanho)
+        retomadas = le_historico(historico) if retomar else {}
+        if retomadas:
+            print("Retomando download: ", sum(1 for st in retomadas.values() if st == 'OK'), " estações já concluídas")
+        else:
+            grava_historico(historico, df, 0, "w", 0, 0, 0, '')  # Inicializando o histórico
+
+        def obtem(codigo):
+            if str(codigo) in ignoradas:
+                return PedidoSerie((None, '', ''))
+            pedido = self.obtem_pedido(codigo, tipoDados, data_i, data_f, consistencia, pasta_estacoes, retomadas,
+                                       carimbos[str(codigo)] if incremental else None)
+            return pedido._replace(carimbo=carimbos[str(codigo)])
+        processa = partial(processa_serie, tipoDados=tipoDados, pasta_estacoes=pasta_estacoes)
+
+        # Estatísticas por bloco de estações: com o pool de processos, cada bloco é calculado
+        # assim que fica completo, junto com o download das estações seguintes
+        blocos_estatisticas = []
+        def calcula_bloco(fim):
+            inicio = sum(n for n, _ in blocos_estatisticas)
+            if fim <= inicio:
+                return
+            matriz = alteradas.bloco(slice(inicio, fim))
+            datas = alteradas.datas
+            # só os dias com algum dado do bloco vão para o outro processo
+            linhas = np.flatnonzero(~np.isnan(matriz).all(axis=1))
+            if len(linhas):
+                matriz, datas = matriz[linhas[0]:linhas[-1] + 1], datas[linhas[0]:linhas[-1] + 1]
+            metadados = pd.DataFrame(metadados_alteradas[inicio:fim])
+            if processos is not None:
+                # cópia: o bloco é enviado ao processo depois, enquanto a matriz continua crescendo
+                futuro = processos.submit(cronometra, calcula_tabelas, metadados, np.array(matriz), datas, limite_chuva)
+                blocos_estatisticas.append((fim - inicio, futuro))
             else:
-                grava_historico(historico, df, k, "a", 0, '', '', 'NO DATA')
-                print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF,"  NAO CONTÉM DADOS ")
-
-        if dados_estado:
-            dados_estado_df = pd.concat(dados_estado, axis=1)
-            dados_estado_df = dados_estado_df.loc[~dados_estado_df.index.duplicated(keep='first')]
-            df_resultados_completos = pd.DataFrame(resultados_completos)
-            #df_resultados_completos.to_excel(resultado_completo_path, sheet_name="ANUAL" , index=False)
-
-            df_estatisticas_mensais = pd.DataFrame(estatisticas_mensais)
-            # # Crie o arquivo vazio se ele não existir
-            # if not Path(resultado_completo_path).exists():
-            #    with open(resultado_completo_path, 'w') as f:
-            #         pass
-            df_estatisticas_anuais = pd.DataFrame(estatisticas_anuais)   
-
-            with pd.ExcelWriter(resultado_completo_path, mode='w', engine='openpyxl') as writer:
-                df_resultados_completos.to_excel(writer, sheet_name="ANUAL", index=False)
-
-            with pd.ExcelWriter(resultado_completo_path, mode='a', engine='openpyxl',if_sheet_exists='replace') as writer:    
-                df_estatisticas_anuais.to_excel(writer, sheet_name="ANUAIS", index=False)
-                df_estatisticas_mensais.to_excel(writer, sheet_name="MENSAL", index=False)
-                for mes in df_estatisticas_mensais['mes'].unique():
-                    df_mes = df_estatisticas_mensais[df_estatisticas_mensais['mes'] == mes]
-                    df_mes.to_excel(writer, sheet_name=f"MENSAL_{mes}", index=False)        
-
-            return dados_estado_df
+                blocos_estatisticas.append((fim - inicio, cronometra(calcula_tabelas, metadados, matriz, datas, limite_chuva)))
+
+        processos = ProcessPoolExecutor(max_workers=num_processos) if num_processos > 0 else None
+        if tamanho_fila is None:
+            tamanho_fila = 2 * (max(num_workers, 1) + num_processos)
+        try:
+            for codigo, serie, erro in self.series_processadas(codigos, obtem, processa, num_workers, processos, tamanho_fila):
+                k += 1
+                lon = df.iloc[k]['longitude']
+                lat = df.iloc[k]['latitude']
+                altitude = df.iloc[k]['altitude']
+                nome = df.iloc[k]['nome']
+                cidade = df.iloc[k]['municipio']
+                UF = df.iloc[k]['estado']
+                bacia = df.iloc[k]['BaciaCodigo']
+                subbacia = df.iloc[k]['SubBaciaCodigo']
+                rio = df.iloc[k]['Rio']
+                orgao = df.iloc[k]['responsavel']
+                data_ultimo_dado = df.iloc[k]['Ultima Atualizacao']
+
+                #print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF)
+                if str(codigo) in ignoradas:
+                    grava_historico(historico, df, k, "a", 0, '', '', 'IGNORADA')
+                    if telemetria is not None:
+                        telemetria.estacao(codigo, 'IGNORADA')
+                    print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF,"  IGNORADA: ", ignoradas[str(codigo)])
+                    continue
+                status = 'OK'
+                if erro is not None:
+                    status = 'FALHA'
+                    print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF,"  FALHA NO DOWNLOAD: ", erro)
+                    # Modo incremental: uma falha temporária não tira a estação da matriz nem do sumário,
+                    # que seguem com a série guardada (recalculada, com o carimbo da série guardada)
+                    local = carrega_serie_local(pasta_estacoes, codigo) if incremental else None
+                    serie = None
+                    if local is not None and len(local):
+                        local.attrs['local'] = True
+                        carimbos[str(codigo)] = local.attrs.get('carimbo')
+                        serie = processa(codigo, PedidoSerie((local, local.index.min(), local.index.max())))
+                    if serie is None:
+                        grava_historico(historico, df, k, "a", 0, '', '', 'FALHA')
+                        if telemetria is not None:
+                            telemetria.estacao(codigo, 'FALHA')
+                        continue
+
+                if serie is not None:
+                    dados_validos, tamanho, num_dados_totais, data_min, data_max, inalterada, leitura = serie
+                    num_de_dias, num_anos = calcular_num_dias(data_min, data_max)
+
+                    # Identificação da estação; as estatísticas (abas ANUAL, ANUAIS e MENSAL) são
+                    # calculadas por blocos de estações (calcula_bloco)
+                    resultados_completos.append({
+                        "Codigo": codigo,
+                        "Num Total de registros": num_dados_totais,
+                        "Nome": nome,
+                        "Latitude": lat,
+                        "Longitude": lon,
+                        "Altitude": altitude,
+                        "cidade": cidade,
+                        "UF": UF,
+                        "Bacia": bacia,
+                        "Sub Bacia": subbacia,
+                        "Rio": rio,
+                        "orgao": orgao,
+                        "data Ultimo dado": data_ultimo_dado,
+                        "CONTAGEM": " - ",
+                        "Data Inicial": data_min,
+                        "Data Final": data_max,
+                        "Num de Dias": num_de_dias,
+                        "Num de Anos Total": num_anos,
+                    })
+                    grava_historico(historico, df, k, "a", tamanho, data_min, data_max, status)
+                    if telemetria is not None:
+                        telemetria.estacao(codigo, status, leitura)
+                    dados_estado.adiciona(codigo, dados_validos)
+                    if sumario_anterior is not None:
+                        if inalterada and sumario_anterior.get(str(codigo)) == carimbos[str(codigo)]:
+                            reaproveitadas.add(str(codigo))
+                        else:
+                            alteradas.adiciona(codigo, dados_validos)
+                            metadados_alteradas.append(resultados_completos[-1])
+                    if processos is not None and alteradas.shape[1] % bloco_estatisticas == 0:
+                        calcula_bloco(alteradas.shape[1])
+                    print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF," ",data_min," ",data_max, "tamanho:",tamanho)
+                else:
+                    grava_historico(historico, df, k, "a", 0, '', '', 'NO DATA')
+                    if telemetria is not None:
+                        telemetria.estacao(codigo, 'NO DATA')
+                    print("Código:", codigo, k, " de ", num_estacao, " ", nome, " ", UF,"  NAO CONTÉM DADOS ")
+
+            for fim in range(bloco_estatisticas, alteradas.shape[1] + bloco_estatisticas, bloco_estatisticas):
+                calcula_bloco(min(fim, alteradas.shape[1]))
+            tabelas_blocos = []
+            for num_estacoes, bloco in blocos_estatisticas:
+                tabelas, segundos = bloco if processos is None else bloco.result()
+                tabelas_blocos.append(tabelas)
+                if telemetria is not None:
+                    telemetria.bloco_estatisticas(num_estacoes, segundos)
+        finally:
+            if processos is not None:
+                processos.shutdown(cancel_futures=True)
+
+        if retomar:
+            compacta_historico(historico, codigos)
+
+        if dados_estado.shape[1]:
+            if pasta_matriz:
+                grava_armazem(pasta_matriz, dados_estado)
+            df_resultados_completos = df_estatisticas_mensais = df_estatisticas_anuais = None
+            if tabelas_blocos:
+                # Abas ANUAL, MENSAL (estação, mês) e ANUAIS (estação, ano) dos blocos, na ordem das estações
+                df_resultados_completos, df_estatisticas_mensais, df_estatisticas_anuais = (
+                    pd.concat(partes, ignore_index=True) for partes in zip(*tabelas_blocos))
+                #df_resultados_completos.to_excel(resultado_completo_path, sheet_name="ANUAL" , index=False)
+
+            if reaproveitadas:
+                # Estações sem alteração: linhas do sumário anterior, na ordem das estações
+                print("Modo incremental: ", len(reaproveitadas), " estações sem alteração, ", alteradas.shape[1], " recalculadas")
+                ordem = dados_estado.codigos
+                df_resultados_completos = atualiza_tabela(le_tabela(resultado_completo_path, 'ANUAL'),
+                                                          df_resultados_completos, ordem, reaproveitadas)
+                df_estatisticas_anuais = atualiza_tabela(le_tabela(resultado_completo_path, 'ANUAIS'),
+                                                         df_estatisticas_anuais, ordem, reaproveitadas, 'ano')
+                df_estatisticas_mensais = atualiza_tabela(le_tabela(resultado_completo_path, 'MENSAL'),
+                                                          df_estatisticas_mensais, ordem, reaproveitadas, 'mes')
+
+            # Tabelas em Parquet para as etapas seguintes (04_FILTRAGEM em diante)
+            abas = {"ANUAL": df_resultados_completos, "ANUAIS": df_estatisticas_anuais, "MENSAL": df_estatisticas_mensais}
+            for mes in df_estatisticas_mensais['mes'].unique():
+                abas[f"MENSAL_{mes}"] = df_estatisticas_mensais[df_estatisticas_mensais['mes'] == mes]
+            if limiares:
+                # Varredura de limiares sobre a matriz inteira: uma ordenação por estação para todos os limiares
+                abas["LIMIARES"] = tabela_limiares(df_resultados_completos, dados_estado, limiares)
+                abas["LIMIARES_ANUAIS"] = tabela_limiares(df_resultados_completos, dados_estado, limiares,
+                                                          dados_estado.datas, por='ano')
+            grava_tabelas(resultado_completo_path, abas,
+                          {'parametros': parametros, 'carimbos': {c: carimbos[c] for c in dados_estado.codigos}})
+
+            # Planilha do sumário: todas as abas escritas de uma vez, linha a linha
+            exporta_excel(resultado_completo_path, abas)
+
+            return dados_estado.para_dataframe()
         else:
             grava_historico(historico, df, k, "a", 0, '', '', 'NO DATA2')
+            if retomar:
+                compacta_historico(historico, codigos)
             print("Nenhum dado disponível para as estações dadas")
             return None
 
@@ -610,14 +697,23 @@ file_path =        => local da planilha do inventario
     exemplo:
     '../01_INVENTARIO/inventario_BAHIA.xlsx'
 
-resultado_completo_path = Nome da planilha com o sumário das estações. 
+resultado_completo_path = Nome da planilha com o sumário das estações. As mesmas abas são gravadas
+                          em Parquet na pasta de mesmo nome com extensão .parquet (ver 00_COMUM/tabelas.py),
+                          que é o que as etapas seguintes leem.
 
     exemplo:
         'sumario_BAHIA.xlsx'
 
-arquivos_dados         > Nome dos arquivos que contém os dados de chuva 
+pasta_matriz           > Pasta com a matriz de dados de chuva (dias x estações) em formato binário,
+                         lida pelas etapas seguintes (ex.: 09_ESTUDO_PASSADO/gera_estudo.py), com o índice
+                         de disponibilidade dos dados (periodos_wb.py, disponibilidade_wb.py)
+    exemplo:
+        'dados_BAHIA'
+
+arquivos_dados         > Nome dos arquivos que contém os dados de chuva (exportação opcional em Excel)
     exemplo:
         'dados_BAHIA.xlsx'         
+exporta_dados_excel=True => grava também arquivos_dados (lento para milhares de estações)
 
         
         Datas inicial e final. Se tdeixadas em braco vão baixar todo o inventário 
@@ -627,47 +723,132 @@ arquivos_dados         > Nome dos arquivos que contém os dados de chuva
 data_inicial=''
 data_final=''
 
+num_workers        => número de estações baixadas simultaneamente (1 = sequencial)
+num_processos      => processos que leem o XML, gravam as séries e calculam as estatísticas enquanto
+                      as requisições seguintes esperam a rede (0 = tudo neste processo). Para ocupar
+                      todos os núcleos: número de núcleos - 1 (este processo monta as saídas)
+max_req_por_segundo => limite de requisições por segundo ao servidor da ANA (None = sem limite)
+
+retomar=True       => continua um download interrompido: lê o histórico, pula as estações já 'OK'
+                      (lidas de pasta_estacoes) e baixa só as que faltam ou falharam
+pasta_estacoes     => pasta com a série bruta de cada estação baixada
+
+pasta_cache        => pasta do cache das respostas da ANA (None = sem cache). Rodar de novo com
+                      as mesmas datas lê as respostas do cache, sem acessar a rede
+validade_cache_dias => dias até uma resposta do cache vencer
+tamanho_cache_mb   => tamanho máximo do cache; as respostas menos usadas são apagadas
+
+incremental=True  => atualiza um download anterior: para cada estação, pede só os dados a partir do último
+                      mês guardado em pasta_estacoes, e não acessa a rede se 'Ultima Atualizacao'/'data_alt'
+                      do inventário não mudaram. O sumário só é recalculado para as estações que mudaram.
+
+prefiltro_tipos     => tipos de estação baixados (TipoEstacao do inventário: 2 = pluviométrica); None = todos
+prefiltro_min_anos  => anos mínimos do período de operação (PeriodoPluviometroInicio/Fim do inventário)
+                      dentro de data_inicial/data_final. Estações que nunca chegariam aos anos válidos
+                      exigidos na 04_FILTRAGEM não são baixadas (status 'IGNORADA' no histórico).
+                      None = baixa todas
+
+matriz_compacta=True => guarda na memória só os dias com dado de cada estação, em vez da matriz
+                      densa dias x estações (útil para redes muito esparsas ou períodos longos)
+
+consulta_estacoes  => baixa só as estações do inventário que atendem a consulta espacial
+                      (00_COMUM/indice_espacial.py); None = todas as estações do inventário.
+                      Use um inventário de várias UFs (01_INVENTARIO -u BAHIA,MINAS GERAIS,... ou ALL)
+                      para pegar as estações vizinhas de outros estados.
+    exemplos:
+        {'caixa': (-47.9, -37, -19.9, -8)}                          (domínio da krigagem: lon_min, lon_max, lat_min, lat_max)
+        {'poligono': '../00_STUFF/BAHIA.shp', 'buffer_km': 50}      (estado e 50 km em volta)
+        {'vizinhos': (-12.97, -38.51, 20)}                         (as 20 mais próximas do ponto lat, lon)
+        {'raio': (-12.97, -38.51, 100)}                            (a até 100 km do ponto lat, lon)
+
+arquivo_telemetria => log JSON-lines do download (00_COMUM/telemetria.py): uma linha por requisição
+                      (latência, bytes, status, novas tentativas, cache), por estação (status, tempo de
+                      leitura do XML), por bloco de estatísticas e de progresso; no final, o resumo com
+                      p50/p95/p99. None = sem log (o progresso e o resumo continuam na tela)
+arquivo_prometheus => arquivo .prom com contadores e histogramas do download, regravado a cada
+                      intervalo_telemetria segundos (coletor textfile do node_exporter); None = não grava
+intervalo_telemetria => segundos entre as linhas de progresso (estações/s e tempo restante)
+
+limiares_varredura => limiares de chuva (mm) para os índices de dias chuvosos e de chuva forte: grava as
+                      abas LIMIARES (por estação) e LIMIARES_ANUAIS (por estação e ano) com dias,
+                      frequência, total, média, desvio e percentis acima de cada limiar, todos de uma vez.
+                      None = não grava
+    exemplo:
+        [0.1, 1, 2.5, 5, 10, 20, 50]
+
 """
 historico="historico_BAHIA.csv"
 limite_chuva=1.0
 file_path = '../01_INVENTARIO/inventario_BAHIA.xlsx'
 resultado_completo_path = 'sumario_BAHIA.xlsx'
+pasta_matriz='dados_BAHIA'
 arquivos_dados='dados_BAHIA.xlsx'
+exporta_dados_excel=False
 data_inicial=''
 data_final=''
-
-
-
-
-
-# Instanciando a classe e obtendo o inventário
-service = ServiceANA()
-
-# Lendo o arquivo Excel e especificando que queremos apenas a coluna 'código'
-df= pd.read_excel(file_path, usecols=['codigo'],index_col=None)
-codigos = df['codigo'].tolist()
-
-df= pd.read_excel(file_path,index_col=None)
-dados_rj = service.baixar_dados_por_estacao(df, tipoDados='2', data_i=data_inicial, data_f=data_final, consistencia='1')
-
-
-
-# Ler o CSV
-historico_df = pd.read_csv(historico)
-historico_df = historico_df[historico_df['status'] == 'OK']
-
-
-
-
-# Salvando os dados em uma planilha XLSX
-if dados_rj is not None:
-    dados_rj.to_excel(arquivos_dados)
-
-    with pd.ExcelWriter(arquivos_dados, mode='a', engine='openpyxl') as writer:
-        historico_df.to_excel(writer, sheet_name='Historico', index=False)
-else:
-    print("Nenhum dado de chuva disponível para o estado do Rio de Janeiro.")
-
- 
-
-
+num_workers=8
+num_processos=max((os.cpu_count() or 2) - 1, 1)
+max_req_por_segundo=10
+retomar=False
+pasta_estacoes='estacoes_BAHIA'
+pasta_cache='cache_ana'
+validade_cache_dias=30
+tamanho_cache_mb=4096
+matriz_compacta=False
+incremental=False
+prefiltro_tipos=None
+prefiltro_min_anos=None
+consulta_estacoes=None
+arquivo_telemetria='telemetria_BAHIA.jsonl'
+arquivo_prometheus=None
+intervalo_telemetria=10
+limiares_varredura=None
+
+
+
+
+
+# Execução (o módulo também é importado, ex.: benchmark_download.py)
+if __name__ == '__main__':
+    # Lendo o arquivo Excel e especificando que queremos apenas a coluna 'código'
+    # (como texto, igual ao índice espacial: códigos com zeros à esquerda não viram números)
+    df= pd.read_excel(file_path, usecols=['codigo'], dtype={'codigo': str}, index_col=None)
+    codigos = df['codigo'].tolist()
+
+    df= pd.read_excel(file_path,index_col=None)
+    if consulta_estacoes is not None:
+        selecionadas = set(IndiceEspacial.do_inventario(file_path).consulta(consulta_estacoes))
+        df = df[[codigo in selecionadas for codigo in codigos]].reset_index(drop=True)
+        print("Consulta espacial: ", len(df), " estações selecionadas")
+    prefiltro = None
+    if prefiltro_tipos is not None or prefiltro_min_anos:
+        prefiltro = PrefiltroInventario(prefiltro_tipos, prefiltro_min_anos, data_inicial, data_final)
+
+    # Instanciando a classe
+    cache = CacheRespostas(pasta_cache, validade_cache_dias * 86400, tamanho_cache_mb * 2**20) if pasta_cache else None
+    telemetria = Telemetria(len(df), arquivo_telemetria, arquivo_prometheus, intervalo_telemetria)
+    cliente = ClienteANA(tamanho_pool=max(num_workers, 1), max_req_por_segundo=max_req_por_segundo, cache=cache,
+                         telemetria=telemetria)
+    service = ServiceANA(cliente)
+    dados_rj = service.baixar_dados_por_estacao(df, tipoDados='2', data_i=data_inicial, data_f=data_final, consistencia='1', num_workers=num_workers,
+                                                retomar=retomar, pasta_estacoes=pasta_estacoes, matriz_compacta=matriz_compacta,
+                                                pasta_matriz=pasta_matriz, incremental=incremental, prefiltro=prefiltro,
+                                                num_processos=num_processos, telemetria=telemetria,
+                                                limiares=limiares_varredura)
+    telemetria.imprime_resumo(telemetria.encerra())
+
+
+
+    # Ler o CSV
+    historico_df = pd.read_csv(historico)
+    historico_df = historico_df[historico_df['status'] == 'OK']
+
+
+
+
+    # Salvando os dados em uma planilha XLSX
+    if dados_rj is not None:
+        if exporta_dados_excel:
+            exporta_excel(arquivos_dados, {'Sheet1': dados_rj, 'Historico': historico_df}, indice=['Sheet1'])
+    else:
+        print("Nenhum dado de chuva disponível para o estado do Rio de Janeiro.")
@@ -0,0 +1,70 @@
+"""
+Sumários por período climatológico (ex.: sumario_BAHIA_1981a2010.xlsx e sumario_BAHIA_1991a2020.xlsx,
+lidos por 04_FILTRAGEM) calculados a partir da matriz estação-dia já guardada pelo download completo
+(pasta_matriz), sem baixar as séries de novo. Ver 00_COMUM/janelas.py.
+
+Exemplos:
+    python periodos_wb.py -p 1981a2010,1991a2020
+    python periodos_wb.py --normais 30 --passo 10 --de 1961 --ate 2020     (1961a1990, ..., 1991a2020)
+    python periodos_wb.py -p 01/03/1981a28/02/2011 --sem-excel
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from armazem_matriz import ArmazemMatriz
+from tabelas import le_tabela, le_metadados, grava_tabelas, exporta_excel
+from janelas import tabelas_periodos, le_periodo, nome_periodo, normais_deslizantes
+
+parser = argparse.ArgumentParser(description="Sumários por período a partir da matriz guardada pelo download.")
+parser.add_argument("-m", "--matriz", type=str, default="dados_BAHIA", help="Pasta da matriz estação-dia (pasta_matriz do download)")
+parser.add_argument("-s", "--sumario", type=str, default="sumario_BAHIA.xlsx",
+                    help="Sumário completo do download (identificação das estações); as saídas ficam ao lado, com o período no nome")
+parser.add_argument("-p", "--periodos", type=str, default=None,
+                    help="Períodos separados por vírgula: 1981a2010 (anos inteiros) ou 01/03/1981a28/02/2011")
+parser.add_argument("--normais", type=int, default=None, help="Normais deslizantes de tantos anos (ex.: 30)")
+parser.add_argument("--passo", type=int, default=10, help="Anos entre o início de duas normais (padrão: 10)")
+parser.add_argument("--de", type=int, default=None, help="Primeiro ano das normais (padrão: o primeiro da matriz)")
+parser.add_argument("--ate", type=int, default=None, help="Último ano das normais (padrão: o último da matriz)")
+parser.add_argument("-l", "--limite-chuva", type=float, default=None,
+                    help="Limite de chuva LDU (padrão: o mesmo do sumário completo)")
+parser.add_argument("--sem-excel", action="store_true", help="Grava só as tabelas Parquet, sem a planilha")
+args = parser.parse_args()
+
+armazem = ArmazemMatriz(args.matriz)
+parametros = le_metadados(args.sumario).get('parametros', {})
+limite_chuva = args.limite_chuva if args.limite_chuva is not None else parametros.get('limite_chuva', 1.0)
+
+periodos = [le_periodo(texto) for texto in args.periodos.split(',') if texto.strip()] if args.periodos else []
+if args.normais:
+    anos = armazem.datas.year
+    periodos += normais_deslizantes(args.de or int(anos.min()), args.ate or int(anos.max()), args.normais, args.passo)
+if not periodos:
+    parser.error("informe os períodos (-p) ou as normais (--normais)")
+periodos = list(dict.fromkeys(periodos))     # períodos repetidos são calculados uma vez
+
+inicio = time.perf_counter()
+resultados = tabelas_periodos(armazem, le_tabela(args.sumario, 'ANUAL'), periodos, limite_chuva)
+print(f"Estatísticas de {len(periodos)} períodos em {time.perf_counter() - inicio:.1f} s")
+
+base, extensao = os.path.splitext(args.sumario)
+for data_i, data_f in periodos:
+    if (data_i, data_f) not in resultados:
+        print(f"{nome_periodo(data_i, data_f)}: nenhuma estação com dados no período, sumário não gravado")
+for (data_i, data_f), tabelas in resultados.items():
+    saida = f"{base}_{nome_periodo(data_i, data_f)}{extensao}"
+    abas = {"ANUAL": tabelas['ANUAL'], "ANUAIS": tabelas['ANUAIS'], "MENSAL": tabelas['MENSAL']}
+    mensal = tabelas['MENSAL']
+    for mes in mensal['mes'].unique():
+        abas[f"MENSAL_{mes}"] = mensal[mensal['mes'] == mes]
+    # mesmos parâmetros de um download com as datas do período, sem carimbos: um download
+    # incremental sobre este sumário recalcula todas as estações
+    grava_tabelas(saida, abas, {'parametros': {**parametros, 'data_i': f"{data_i:%d/%m/%Y}",
+                                               'data_f': f"{data_f:%d/%m/%Y}", 'limite_chuva': limite_chuva},
+                                'origem': os.path.abspath(args.matriz)})
+    if not args.sem_excel:
+        exporta_excel(saida, abas)
+    print(f"{saida}: {len(tabelas['ANUAL'])} estações")
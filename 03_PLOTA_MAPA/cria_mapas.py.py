@@ -15,6 +15,11 @@ from matplotlib.colors import ListedColormap
 from matplotlib.colors import LinearSegmentedColormap
 import geopandas as gpd
 import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from tabelas import le_tabela
 
 
 
@@ -188,7 +193,7 @@ file_path ='../04_FILTRAGEM/selecao_BAHIA_1981a2010.xlsx'
 file_path ='../04_FILTRAGEM/selecao_BAHIA.xlsx'
 
 sheet_name = "ANUAL"
-df = pd.read_excel(file_path, sheet_name=sheet_name)
+df = le_tabela(file_path, sheet_name)
 
 nome_da_figura="mapa_todas_as_estacoes_IDV_FILTRAGEM_INVENTARIO.png"
 Limite_inferior=0.0 
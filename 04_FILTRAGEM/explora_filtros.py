@@ -0,0 +1,62 @@
+"""
+Exploração dos limites da filtragem (Num Anos Validos e IDV) antes de escolher os valores usados
+na seleção: tabela de compromisso (estações e cobertura espacial por combinação) e mapa de calor,
+para vários períodos de uma vez. Ver 00_COMUM/explorador_selecao.py.
+
+Exemplos:
+    # a partir dos sumários de cada período
+    python explora_filtros.py -s 1981a2010=../02_DOWNLOAD_E_AVALIACAO/sumario_BAHIA_1981a2010.xlsx,1991a2020=../02_DOWNLOAD_E_AVALIACAO/sumario_BAHIA_1991a2020.xlsx
+    # a partir da matriz do download, para quaisquer períodos
+    python explora_filtros.py -m ../02_DOWNLOAD_E_AVALIACAO/dados_BAHIA -p 1961a1990,1981a2010,1991a2020 --anos 15:30 --idv 50:100:5
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from armazem_matriz import ArmazemMatriz
+from explorador_selecao import ExploradorSelecao, grade
+from janelas import le_periodo
+from tabelas import le_tabela
+
+parser = argparse.ArgumentParser(description="Tabela de compromisso e mapa de calor dos limites da filtragem.")
+parser.add_argument("-s", "--sumarios", type=str, default=None,
+                    help="periodo=sumario.xlsx separados por vírgula (lê a aba ANUAL de cada um)")
+parser.add_argument("-m", "--matriz", type=str, default=None, help="Pasta da matriz estação-dia do download")
+parser.add_argument("-p", "--periodos", type=str, default="1981a2010,1991a2020",
+                    help="Períodos, com -m: 1981a2010 ou 01/03/1981a28/02/2011 separados por vírgula")
+parser.add_argument("-i", "--identificacao", type=str, default="../02_DOWNLOAD_E_AVALIACAO/sumario_BAHIA.xlsx",
+                    help="Sumário completo, para as coordenadas das estações (com -m)")
+parser.add_argument("--anos", type=str, default="10:30", help="Mínimos de Num Anos Validos: 10:30, 10:30:2 ou 20,24,28")
+parser.add_argument("--idv", type=str, default="50:100:5", help="Mínimos de IDV (%%): 50:100:5 ou 70,80,90")
+parser.add_argument("--celula", type=float, default=0.5, help="Quadrícula da cobertura espacial, em graus (padrão: 0.5)")
+parser.add_argument("-o", "--saida", type=str, default="exploracao_filtros_BAHIA.xlsx", help="Tabela de compromisso (.xlsx ou .csv)")
+parser.add_argument("--lista", action="store_true", help="Inclui na tabela os códigos das estações de cada combinação")
+parser.add_argument("--mapa", type=str, default="exploracao_filtros_BAHIA.png", help="Mapa de calor (PNG); '' não desenha")
+args = parser.parse_args()
+
+inicio = time.perf_counter()
+if args.sumarios:
+    sumarios = dict(item.split('=', 1) for item in args.sumarios.split(','))
+    explorador = ExploradorSelecao.de_sumarios(sumarios, args.celula)
+elif args.matriz:
+    periodos = [le_periodo(texto) for texto in args.periodos.split(',') if texto.strip()]
+    identificacao = le_tabela(args.identificacao, 'ANUAL', ["Codigo", "Latitude", "Longitude"])
+    explorador = ExploradorSelecao.de_disponibilidade(ArmazemMatriz(args.matriz).disponibilidade(), identificacao,
+                                                      periodos, args.celula)
+else:
+    parser.error("informe os sumários (-s) ou a matriz do download (-m)")
+carga = time.perf_counter() - inicio
+
+inicio = time.perf_counter()
+tabela = explorador.tabela(grade(args.anos, int), grade(args.idv), lista=args.lista)
+print(f"{len(tabela)} combinações em {1000 * (time.perf_counter() - inicio):.1f} ms (carga: {carga:.2f} s)")
+
+if args.saida.endswith('.csv'):
+    tabela.to_csv(args.saida, index=False)
+else:
+    tabela.to_excel(args.saida, index=False)
+if args.mapa:
+    explorador.desenha(args.mapa, tabela)
+    print(f"Mapa de calor gravado em {args.mapa}")
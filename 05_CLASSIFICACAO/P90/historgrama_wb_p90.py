@@ -1,5 +1,10 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent / '00_COMUM'))
+from tabelas import le_tabela
 
 # Caminho do arquivo e nome da aba
 file_path = "../../04_FILTRAGEM/selecao_BAHIA.xlsx"
@@ -7,7 +12,7 @@ sheet_name = "ANUAL"
 
 # Carregar os dados
 try:
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
+    df = le_tabela(file_path, sheet_name)
     
     # Verificar se a coluna existe
     if "P90 NZ" in df.columns:
@@ -9,6 +9,11 @@ from pptx.util import Cm
 import time
 import os
 import xarray as xr
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent / '00_COMUM'))
+from tabelas import le_tabela
 
 # Configurações iniciais
 shapefile_path = '../../00_STUFF/BAHIA.shp'
@@ -149,6 +154,6 @@ datasets = [
 ]
 
 for file_path, arquivo_pptx, prefixo_imagem in datasets:
-    df = pd.read_excel(file_path, sheet_name="ANUAL")
+    df = le_tabela(file_path, "ANUAL", colunas=["Latitude", "Longitude", "P90 NZ"])
     olat, olon, valores = df["Latitude"], df["Longitude"], df["P90 NZ"]
     gera_interpolacao_kriging(prefixo_imagem, arquivo_pptx)
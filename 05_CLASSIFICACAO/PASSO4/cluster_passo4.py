@@ -12,6 +12,11 @@ import shutil
 import glob
 import os
 from matplotlib.colors import ListedColormap, BoundaryNorm
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent / '00_COMUM'))
+from tabelas import le_tabela, grava_tabelas, exporta_excel
 
 # Função para reorganizar a legenda em múltiplas colunas
 def ajustar_legenda(ax, ncol=3):
@@ -69,7 +74,7 @@ def copypy(origem,destino):
 def realizar_classificacao(file_path, sheet_name, coluna_variavel="Média mm/ano", intervals=None, case="CLUSTER",shapefile_path=None,cmap=None):
     # Carregar os dados do arquivo Excel):
     # Carregar os dados do arquivo Excel
-    data = pd.read_excel(file_path, sheet_name=sheet_name)
+    data = le_tabela(file_path, sheet_name)
     
     # Criar a variável x baseada na coluna escolhida
     x = data[coluna_variavel]
@@ -374,7 +379,10 @@ def realizar_classificacao(file_path, sheet_name, coluna_variavel="Média mm/ano
 
 
     # Salvar os resultados finais com os clusters adicionados
-    data.to_excel(f"{case}_classified_" + sheet_name + ".xlsx", index=False)
+    # (Parquet para as etapas seguintes e a planilha entregável)
+    arquivo_saida = f"{case}_classified_" + sheet_name + ".xlsx"
+    grava_tabelas(arquivo_saida, {sheet_name: data})
+    exporta_excel(arquivo_saida, {sheet_name: data})
 
     return data
 
@@ -16,6 +16,11 @@ import matplotlib.pyplot as plt
 from netCDF4 import Dataset
 from matplotlib.colors import ListedColormap
 from scipy.spatial.distance import cdist
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from tabelas import le_tabela
 
 
 
@@ -130,7 +135,7 @@ lon_min, lat_min, lon_max, lat_max = gdf.total_bounds
 # # Diretório de origem e destino
 file_path = "../04_FILTRAGEM/selecao_BAHIA.xlsx" ##  "  # Altere para o caminho correto
 sheet_name = "ANUAL"  # Altere para o caminho correto
-df = pd.read_excel(file_path, sheet_name=sheet_name)
+df = le_tabela(file_path, sheet_name, colunas=["Latitude", "Longitude", "Média mm/ano"])
 
 # Coordenadas das estações
 obs_latitudes = df["Latitude"]
@@ -5,6 +5,11 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 from netCDF4 import Dataset
 from matplotlib.colors import ListedColormap, BoundaryNorm
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from tabelas import le_tabela
 
 def save_to_netcdf(filename, longitude, latitude, variable_name, data):
     rootgrp = Dataset(filename, "w", format="NETCDF4")
@@ -59,7 +64,7 @@ lon_min, lat_min, lon_max, lat_max = gdf.total_bounds
 # Carregar os dados do arquivo Excel
 file_path = "../04_FILTRAGEM/selecao_BAHIA_1991a2020.xlsx"
 sheet_name = "ANUAL"
-df = pd.read_excel(file_path, sheet_name=sheet_name)
+df = le_tabela(file_path, sheet_name, colunas=["Latitude", "Longitude", "Média mm/ano"])
 
 obs_latitudes = df["Latitude"]
 obs_longitudes = df["Longitude"]
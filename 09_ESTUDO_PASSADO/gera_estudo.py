@@ -1,16 +1,28 @@
+import sys
+from pathlib import Path
+
 import pandas as pd
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from armazem_matriz import ArmazemMatriz
+from tabelas import le_tabela
+
 # Caminhos dos arquivos
 inventario_path = "estacoes_com_regiao.xlsx"
-dados_chuva_path = "../02_DOWNLOAD_E_AVALIACAO/dados_BAHIA.xlsx"
+# matriz estação-dia gravada pelo download (02_DOWNLOAD_E_AVALIACAO, pasta_matriz)
+dados_chuva_path = "../02_DOWNLOAD_E_AVALIACAO/dados_BAHIA"
 
 # Leitura dos dados
-inventario = pd.read_excel(inventario_path)
-dados_chuva = pd.read_excel(dados_chuva_path)
+inventario = le_tabela(inventario_path, colunas=['Codigo', 'regiao'])
 
 # Obter o mapeamento de Código da estação para Região
 mapa_estacao_regiao = inventario.set_index('Codigo')['regiao'].to_dict()
 
+# Lê do armazenamento só as estações do inventário (primeira coluna = data, como na planilha)
+armazem = ArmazemMatriz(dados_chuva_path)
+codigos_lidos = [c for c in armazem.codigos if c.isdigit() and int(c) in mapa_estacao_regiao]
+dados_chuva = armazem.seleciona(codigos_lidos).reset_index()
+
 # Extrair o ano da primeira coluna (data)
 dados_chuva['ano'] = pd.to_datetime(dados_chuva.iloc[:, 0]).dt.year
 
@@ -1,10 +1,15 @@
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / '00_COMUM'))
+from tabelas import le_tabela, grava_tabelas, exporta_excel
 
 # 1. Carregar a planilha com as estações
 excel_path = "../05_CLASSIFICACAO/ANUAL_classified_ANUAL.xlsx"
-df = pd.read_excel(excel_path)
+df = le_tabela(excel_path)
 
 # 2. Criar GeoDataFrame com pontos das estações
 # Substitua pelos nomes corretos se forem diferentes
@@ -51,7 +56,8 @@ if 'regiao' in regioes_gdf.columns:
 else:
     print("Índices no shapefile:", sorted(regioes_gdf.index))
 
-# 9. Exportar para novo Excel
-df.to_excel("estacoes_com_regiao.xlsx", index=False)
+# 9. Exportar para novo Excel (e Parquet, lido por gera_estudo.py)
+grava_tabelas("estacoes_com_regiao.xlsx", {"Sheet1": df})
+exporta_excel("estacoes_com_regiao.xlsx", {"Sheet1": df})
 
 print("✅ Arquivo salvo como 'estacoes_com_regiao.xlsx'")